@@ -1,12 +1,19 @@
 from datetime import datetime, timedelta
+import json
 import os
 from airflow import DAG
 from airflow.operators.bash import BashOperator
 from airflow.operators.dummy import DummyOperator
+from airflow.operators.python import BranchPythonOperator, PythonOperator
+from airflow.exceptions import AirflowException
 from s3_upload_operator import S3UploadOperator
+from redshift_stage_operator import StageToRedshiftOperator
+from redshift_loadtable_operator import LoadRedshiftTableOperator
+from sql_queries import SqlQueries
 
 BASH_SCRIPT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
 DATASET_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'input'))
+UPLOAD_MANIFEST = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'upload_manifest.sqlite'))
 S3_BUCKET_NAME = "reddit-landing-didixuecoding"
 
 default_args = dict(
@@ -20,7 +27,10 @@ dag = DAG(
     'reddit',
     default_args=default_args,
     description='Load reddit data into S3 and Redshift',
-    schedule_interval='@monthly'
+    # One run per day: every task downloads, validates, transforms, stages and loads that day only.
+    schedule_interval='@daily',
+    # Runs share the .part downloads and the upload manifest, so a backfill runs its days one after the other.
+    max_active_runs=1
 )
 
 start_task = DummyOperator(dag=dag, task_id='start_execution')
@@ -28,14 +38,52 @@ start_task = DummyOperator(dag=dag, task_id='start_execution')
 download_dataset_task = BashOperator(
     dag=dag,
     task_id='daily_download_dataset',
-    bash_command=BASH_SCRIPT_DIR + '/download_datasets.sh {{ds}}'
+    bash_command=BASH_SCRIPT_DIR + '/download_datasets.py --start {{ds}} --end {{ds}} --datasets submissions --jobs 4'
 )
 
 
-preporcess_authors_task = BashOperator(
+# Profiles the day before anything is uploaded; prints the profile as its last line, i.e. its XCom.
+# Every submission has to be created within the run's day, [ds, next_ds) as epochs. A day without a published
+# dump has no file and is profiled as empty.
+validate_submissions_task = BashOperator(
     dag=dag,
-    task_id='preprocess_authors',
-    bash_command= f"zstd -cdq {DATASET_DIR}/Authors/RA_78M.csv.zst | {BASH_SCRIPT_DIR}/preprocess_authors.py | zstd -zqfo {DATASET_DIR}/Authors/RA_78M_processed.csv.zst",
+    task_id='validate_submissions',
+    bash_command=f"{BASH_SCRIPT_DIR}/validate_datasets.py {DATASET_DIR}/Submissions/RS_{{{{ds}}}}.xz "
+                 f"--created-after {{{{ execution_date.int_timestamp }}}} "
+                 f"--created-before {{{{ next_execution_date.int_timestamp }}}} --missing-ok --exit-zero",
+)
+
+
+def _branch_on_profile(ti):
+    profile = json.loads(ti.xcom_pull(task_ids='validate_submissions'))
+    if profile['rows'] == 0:
+        return 'skip_empty_day'
+    return 'transform_submissions' if profile['ok'] else 'reject_submissions'
+
+
+def _reject_submissions(ti):
+    profile = json.loads(ti.xcom_pull(task_ids='validate_submissions'))
+    raise AirflowException(f"{profile['file']} failed validation : " + "; ".join(profile['errors']))
+
+
+branch_on_profile_task = BranchPythonOperator(
+    dag=dag,
+    task_id='branch_on_profile',
+    python_callable=_branch_on_profile,
+)
+
+skip_empty_day_task = DummyOperator(dag=dag, task_id='skip_empty_day')
+
+reject_submissions_task = PythonOperator(
+    dag=dag,
+    task_id='reject_submissions',
+    python_callable=_reject_submissions,
+)
+
+transform_submissions_task = BashOperator(
+    dag=dag,
+    task_id='transform_submissions',
+    bash_command=f"{BASH_SCRIPT_DIR}/transform_submissions.py {DATASET_DIR}/Submissions/RS_{{{{ds}}}}.xz",
 )
 
 upload_s3_task = S3UploadOperator(
@@ -44,10 +92,43 @@ upload_s3_task = S3UploadOperator(
     execution_timeout=timedelta(hours=1),
     aws_credentials_id='aws_credentials',
     dataset_dir=DATASET_DIR,
-    file_glob="test/*",
+    file_glob="Submissions/RS_*.parquet",
     bucket_name=S3_BUCKET_NAME,
+    manifest_path=UPLOAD_MANIFEST,
+)
+
+# Each run stages and loads only its own day, into its own staging table.
+stage_submissions_task = StageToRedshiftOperator(
+    dag=dag,
+    task_id='stage_submissions',
+    redshift_conn_id='redshift',
+    aws_credentials_id='aws_credentials',
+    table='staging_submissions_{{ ds_nodash }}',
+    # COPY maps Parquet columns by position: the table has the column order of transform_submissions.SCHEMA.
+    create_sql=SqlQueries.staging_submissions_parquet_create,
+    s3_src_bucket_name=S3_BUCKET_NAME,
+    s3_src_bucket_key='Submissions/RS_{{ ds }}.parquet',
+    data_format='parquet',
+)
+
+load_fact_submission_task = LoadRedshiftTableOperator(
+    dag=dag,
+    task_id='load_fact_submission',
+    redshift_conn_id='redshift',
+    table='fact_submission',
+    sql_stmt=SqlQueries.fact_submission_partition_insert,
+    update_mode='partition',
+    partition_column='created',
+    partition_start='{{ ds }}',
+    partition_end='{{ macros.ds_add(ds, 1) }}',
+    staging_table='staging_submissions_{{ ds_nodash }}',
+    drop_staging_table=True,
 )
 
-end_operator = DummyOperator(dag=dag, task_id='end_execution')
+end_operator = DummyOperator(dag=dag, task_id='end_execution', trigger_rule='none_failed')
 
-start_task >> download_dataset_task >> end_operator
+start_task >> download_dataset_task >> validate_submissions_task >> branch_on_profile_task
+branch_on_profile_task >> [transform_submissions_task, skip_empty_day_task, reject_submissions_task]
+skip_empty_day_task >> end_operator
+transform_submissions_task >> upload_s3_task
+upload_s3_task >> stage_submissions_task >> load_fact_submission_task >> end_operator
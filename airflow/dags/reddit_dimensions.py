@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+import os
+from airflow import DAG
+from airflow.operators.bash import BashOperator
+from airflow.operators.dummy import DummyOperator
+from s3_upload_operator import S3UploadOperator
+from redshift_stage_operator import StageToRedshiftOperator
+from redshift_loadtable_operator import LoadRedshiftTableOperator
+from sql_queries import SqlQueries
+
+BASH_SCRIPT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+DATASET_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'input'))
+UPLOAD_MANIFEST = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'upload_manifest.sqlite'))
+S3_BUCKET_NAME = "reddit-landing-didixuecoding"
+PREPROCESS_WORKERS = os.cpu_count() or 1
+# Share of the raw author lines preprocess_authors may reject before the task fails.
+AUTHOR_MAX_REJECT_RATE = 0.01
+
+default_args = dict(
+    owner='didixuecoding',
+    start_date=datetime(2021, 5, 1),
+    depends_on_past=False
+)
+
+dag = DAG(
+    'reddit_dimensions',
+    default_args=default_args,
+    description='Load the reddit author and subreddit dumps into S3 and the Redshift dimensions',
+    # The dumps are snapshots, not daily data: they are loaded once, independently of the daily 'reddit' DAG.
+    # Trigger it again by hand to load a newer snapshot.
+    schedule_interval='@once',
+    max_active_runs=1
+)
+
+start_task = DummyOperator(dag=dag, task_id='start_execution')
+
+download_dumps_task = BashOperator(
+    dag=dag,
+    task_id='download_dumps',
+    bash_command=BASH_SCRIPT_DIR + '/download_datasets.py --datasets dumps --jobs 2'
+)
+
+# Checkpointed: a retry resumes after the last finished segment instead of starting from row zero.
+# Rejected lines go to RA_78M_processed.csv.rejects.zst; the JSON summary of counters the script prints last
+# is the XCom of the task, and more than 1% rejects fails it.
+preprocess_authors_task = BashOperator(
+    dag=dag,
+    task_id='preprocess_authors',
+    retries=2,
+    do_xcom_push=True,
+    bash_command=f"{BASH_SCRIPT_DIR}/preprocess_authors.py --workers {PREPROCESS_WORKERS} "
+                 f"--input {DATASET_DIR}/Authors/RA_78M.csv.zst "
+                 f"--output {DATASET_DIR}/Authors/RA_78M_processed.csv.zst "
+                 f"--checkpoint-dir {DATASET_DIR}/Authors/RA_78M_processed.segments "
+                 f"--max-reject-rate {AUTHOR_MAX_REJECT_RATE}",
+)
+
+# One record per lower-cased subreddit name, so dim_subreddit_insert needs no DISTINCT.
+preprocess_subreddits_task = BashOperator(
+    dag=dag,
+    task_id='preprocess_subreddits',
+    bash_command=f"{BASH_SCRIPT_DIR}/preprocess_subreddits.py {DATASET_DIR}/Subreddits/reddit_subreddits.ndjson.zst "
+                 f"--output {DATASET_DIR}/Subreddits/reddit_subreddits_processed.ndjson.zst",
+)
+
+upload_authors_task = S3UploadOperator(
+    dag=dag,
+    task_id='upload_authors',
+    execution_timeout=timedelta(hours=1),
+    aws_credentials_id='aws_credentials',
+    dataset_dir=DATASET_DIR,
+    file_glob="Authors/RA_78M_processed.csv.zst",
+    bucket_name=S3_BUCKET_NAME,
+    manifest_path=UPLOAD_MANIFEST,
+)
+
+upload_subreddits_task = S3UploadOperator(
+    dag=dag,
+    task_id='upload_subreddits',
+    execution_timeout=timedelta(hours=1),
+    aws_credentials_id='aws_credentials',
+    dataset_dir=DATASET_DIR,
+    file_glob="Subreddits/reddit_subreddits_processed.ndjson.zst",
+    bucket_name=S3_BUCKET_NAME,
+    manifest_path=UPLOAD_MANIFEST,
+)
+
+# preprocess_authors writes '|' separated rows without a header.
+stage_authors_task = StageToRedshiftOperator(
+    dag=dag,
+    task_id='stage_authors',
+    redshift_conn_id='redshift',
+    aws_credentials_id='aws_credentials',
+    table='staging_authors',
+    s3_src_bucket_name=S3_BUCKET_NAME,
+    s3_src_bucket_key='Authors/RA_78M_processed.csv.zst',
+    data_format='csv',
+    delimiter='|',
+    copy_opts='ZSTD',
+)
+
+stage_subreddits_task = StageToRedshiftOperator(
+    dag=dag,
+    task_id='stage_subreddits',
+    redshift_conn_id='redshift',
+    aws_credentials_id='aws_credentials',
+    table='staging_subreddits',
+    s3_src_bucket_name=S3_BUCKET_NAME,
+    s3_src_bucket_key='Subreddits/reddit_subreddits_processed.ndjson.zst',
+    data_format='json',
+    copy_opts='ZSTD',
+)
+
+load_dim_author_task = LoadRedshiftTableOperator(
+    dag=dag,
+    task_id='load_dim_author',
+    redshift_conn_id='redshift',
+    table='dim_author',
+    sql_stmt=SqlQueries.dim_author_insert,
+    update_mode='overwrite',
+)
+
+load_dim_subreddit_task = LoadRedshiftTableOperator(
+    dag=dag,
+    task_id='load_dim_subreddit',
+    redshift_conn_id='redshift',
+    table='dim_subreddit',
+    sql_stmt=SqlQueries.dim_subreddit_insert,
+    update_mode='overwrite',
+)
+
+end_operator = DummyOperator(dag=dag, task_id='end_execution')
+
+start_task >> download_dumps_task >> [preprocess_authors_task, preprocess_subreddits_task]
+preprocess_authors_task >> upload_authors_task >> stage_authors_task >> load_dim_author_task >> end_operator
+preprocess_subreddits_task >> upload_subreddits_task >> stage_subreddits_task >> load_dim_subreddit_task >> end_operator
@@ -1,15 +1,34 @@
-from airflow.providers.postgres.hooks.postgres import PostgresHook
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
+from operator_metrics import InstrumentedOperatorMixin, instrumented
+from redshift_connections import redshift_connections
 
+from data_quality_queries import DataQualityQueries
 
-class DataQualityOperator(BaseOperator):
+
+class DataQualityOperator(InstrumentedOperatorMixin, BaseOperator):
     """
     Checks the data quality based on SQL queries and expected results.
     :param redshift_conn_id: Airflow connection id for Redshift connection secret
-    :param sql_queries: List of SQL queries that should be tested (must have the same length as `tables`)
+    :param checks: List of named checks from `DataQualityQueries`, e.g.
+        {'table': 'dim_author', 'check': 'col_does_not_contain_null', 'col': 'author_name'}.
+        Further keys are passed to the check (e.g. 'val' for 'col_does_not_contain_str').
+        All checks on the same table run as a single query, so the table is scanned once.
+    :param approximate: Run the named checks on a sample first and only re-run the checks that fail there on the
+        whole table. A passing sample check logs the 95% upper bound of the rows it may have missed.
+    :param sample_fraction: Share of the rows read by the approximate checks
+    :param sample_method: 'hash' samples rows whose hashed `sample_keys` column falls into the first buckets
+        (Redshift), 'tablesample' uses TABLESAMPLE BERNOULLI (Postgres)
+    :param sample_keys: Dict of table -> column to hash for the 'hash' method. Tables without one are checked exactly.
+    :param approximate_distinct: Pre-check uniqueness with APPROXIMATE COUNT(DISTINCT) in approximate mode (Redshift).
+        It only fails fast: a check fails without the exact query when the estimated duplicates exceed the error
+        bound of the estimate, every other one is checked exactly.
+    :param sql_queries: List of SQL queries that should be tested (must have the same length as `test_results`)
     :param test_results: List of functions that take the result and return True if the test succeeded and False otherwise.
-    :raises AssertionError: The first query that does not match the result raises an AssertionError
+    :raises AssertionError: After all checks ran, listing every check that failed
+
+    Every query runs as a phase of its own ('check.<table>', 'sample.<table>', 'approx_distinct.<table>',
+    'query.<n>'); the durations are pushed to XCom as 'metrics' (see `InstrumentedOperatorMixin`).
     """
     ui_color = '#89DA59'
 
@@ -17,27 +36,200 @@ class DataQualityOperator(BaseOperator):
     def __init__(
             self,
             redshift_conn_id="",
+            checks=[],
+            approximate=False,
+            sample_fraction=0.01,
+            sample_method='hash',
+            sample_keys={},
+            approximate_distinct=True,
             sql_queries=[],
             test_results=[],
             *args, **kwargs):
         super(DataQualityOperator, self).__init__(*args, **kwargs)
         self.redshift_conn_id = redshift_conn_id
+        self.checks = checks
+        self.approximate = approximate
+        self.sample_fraction = sample_fraction
+        self.sample_method = sample_method
+        self.sample_keys = sample_keys
+        self.approximate_distinct = approximate_distinct
         self.sql_queries = sql_queries
         self.test_results = test_results
+        if sample_method not in ('hash', 'tablesample'):
+            raise ValueError(f"Unknown sample_method '{sample_method}', expected 'hash' or 'tablesample'")
+        if not 0 < sample_fraction <= 1:
+            raise ValueError(f"sample_fraction must be in (0, 1], got {sample_fraction}")
+
+    @staticmethod
+    def _describe(check):
+        args = ", ".join(f"{k}={v}" for k, v in DataQualityOperator._params(check).items())
+        return f"{check['check']}({check['table']}{', ' + args if args else ''})"
+
+    @staticmethod
+    def _params(check):
+        return {k: v for k, v in check.items() if k not in ('table', 'check')}
+
+    def _run_exact(self, conn, table, table_checks):
+        """
+        Run named checks on one table in a single query.
+        :return: List of descriptions of the failed checks
+        """
+        tests = []
+        aggregates = []
+        for check in table_checks:
+            aggregate, test = DataQualityQueries.aggregate_check(check['check'])
+            aggregates.append(aggregate(**self._params(check)))
+            tests.append(test)
+
+        query = DataQualityQueries.combined_checks(table, aggregates)
+        self.log.debug(f"Run data quality query : {query}")
+        row = self.fetch_one(conn, f"check.{table}", query, checks=len(table_checks))
+        self.log.debug(f"Result from test query : {row}")
+        failed = []
+        for check, test, value in zip(table_checks, tests, row):
+            if test({'result': [value]}):
+                self.log.info(f"Data quality check {self._describe(check)} passed.")
+            else:
+                self.log.info(f"Data quality check {self._describe(check)} failed : result {value}")
+                failed.append(f"{self._describe(check)} (result {value})")
+        return failed
+
+    def _run_sampled(self, conn, table, table_checks, sample_key):
+        """
+        Run named checks on a sample of one table in a single query.
+        :return: List of the checks that failed on the sample
+        """
+        tests = []
+        aggregates = []
+        for check in table_checks:
+            aggregate, test = DataQualityQueries.aggregate_check(check['check'])
+            aggregates.append(aggregate(**self._params(check)))
+            tests.append(test)
+
+        query = DataQualityQueries.sampled_checks(table, aggregates, self.sample_fraction, sample_key=sample_key)
+        self.log.debug(f"Run sampled data quality query : {query}")
+        sampled_rows, *values = self.fetch_one(conn, f"sample.{table}", query, checks=len(table_checks))
+        self.log.debug(f"Result from sampled test query : {sampled_rows} rows, {values}")
+        escalate = []
+        for check, test, value in zip(table_checks, tests, values):
+            if sampled_rows and test({'result': [value]}):
+                if check['check'] == 'table_not_empty':
+                    self.log.info(f"Data quality check {self._describe(check)} passed on a sample.")
+                else:
+                    # Rule of three: with no match in n rows, the share of matching rows is below 3/n at 95%
+                    # confidence, i.e. fewer than about 3/fraction rows of the table.
+                    self.log.info(f"Data quality check {self._describe(check)} passed on a sample of {sampled_rows} "
+                                  f"rows : at 95% confidence fewer than {3 / sampled_rows:.4%} of the rows "
+                                  f"(~{3 / self.sample_fraction:.0f} rows) fail it.")
+            else:
+                self.log.info(f"Data quality check {self._describe(check)} failed on a sample of {sampled_rows} "
+                              f"rows : result {value}. Run it on the whole table.")
+                escalate.append(check)
+        return escalate
 
+    def _run_approximate_distinct(self, conn, table, table_checks):
+        """
+        Pre-check uniqueness on one table with APPROXIMATE COUNT(DISTINCT) in a single query.
+        :return: List of descriptions of the failed checks and list of the checks to be run exactly
+        """
+        aggregates = ["COUNT(*)"] + [DataQualityQueries.col_is_unique_approx_agg(**self._params(check))
+                                     for check in table_checks]
+        query = DataQualityQueries.combined_checks(table, aggregates)
+        self.log.debug(f"Run approximate data quality query : {query}")
+        rows, *values = self.fetch_one(conn, f"approx_distinct.{table}", query, checks=len(table_checks))
+        self.log.debug(f"Result from approximate test query : {rows} rows, {values}")
+        failed = []
+        escalate = []
+        bound = DataQualityQueries.APPROXIMATE_DISTINCT_ERROR * rows
+        for check, value in zip(table_checks, values):
+            # HyperLogLog over- and underestimates the distinct values by up to APPROXIMATE_DISTINCT_ERROR of the
+            # rows, so an estimate of no duplicates proves nothing. Only more duplicates than that fail the check.
+            if value > bound:
+                self.log.info(f"Data quality check {self._describe(check)} failed approximately : ~{value} "
+                              f"duplicates estimated in {rows} rows, more than the error bound of {bound:.0f}.")
+                failed.append(f"{self._describe(check)} (~{value} duplicates estimated)")
+            else:
+                self.log.info(f"Data quality check {self._describe(check)} is within the error bound of the "
+                              f"estimate : ~{value} duplicates estimated in {rows} rows. Run it exactly.")
+                escalate.append(check)
+        return failed, escalate
+
+    def _run_approximate(self, conn, table, table_checks):
+        """
+        Run named checks on one table in the approximate tier.
+        :return: List of descriptions of the checks that failed already and list of the checks that have to be
+            run exactly
+        """
+        sample_key = self.sample_keys.get(table)
+        exact, sampled, distinct = [], [], []
+        for check in table_checks:
+            if check['check'] == 'col_is_unique':
+                # Duplicates are rarely both sampled, only a sketch over every row can tell.
+                (distinct if self.approximate_distinct else exact).append(check)
+            elif self.sample_method == 'hash' and (sample_key is None or check.get('col') == sample_key):
+                # NULL keys never hash into the sample.
+                exact.append(check)
+            else:
+                sampled.append(check)
+
+        failed = []
+        if sampled:
+            exact += self._run_sampled(conn, table, sampled,
+                                       sample_key if self.sample_method == 'hash' else None)
+        if distinct:
+            distinct_failed, distinct_exact = self._run_approximate_distinct(conn, table, distinct)
+            failed += distinct_failed
+            exact += distinct_exact
+        return failed, exact
+
+    def _run_checks(self, conn):
+        """
+        Run the named checks, one query per table (and tier).
+        :return: List of descriptions of the failed checks
+        """
+        by_table = {}
+        for check in self.checks:
+            by_table.setdefault(check['table'], []).append(check)
+
+        failed = []
+        for table, table_checks in by_table.items():
+            if self.approximate:
+                approximate_failed, table_checks = self._run_approximate(conn, table, table_checks)
+                failed += approximate_failed
+            if table_checks:
+                failed += self._run_exact(conn, table, table_checks)
+        return failed
+
+    @instrumented
     def execute(self, context):
         self.log.info("Start Data Quality checks")
-        redshift_conn = PostgresHook(postgres_conn_id= self.redshift_conn_id)
+        with self.phase('connect'):
+            conn = redshift_connections.acquire(self.redshift_conn_id)
         self.log.info("Redshift Connection has been successfully established")
+        try:
+            with conn:
+                failed = self._run_all(conn)
+        finally:
+            redshift_connections.release(self.redshift_conn_id, conn)
+        if failed:
+            raise AssertionError(f"{len(failed)} data quality check(s) failed : " + "; ".join(failed))
+
+    def _run_all(self, conn):
+        """
+        Run the named checks and the query/test pairs.
+        :return: List of descriptions of the failed checks
+        """
+        failed = self._run_checks(conn)
 
         test_pairs = zip(self.sql_queries, self.test_results)
-        for query, test in test_pairs:
+        for i, (query, test) in enumerate(test_pairs):
             self.log.debug(f"Run data quality query : {query}")
-            result = redshift_conn.get_pandas_df(query)
-            self.log.debug(f"Result from test query : {result}")
-            if test(result):
+            # A cursor fetch of the single row, wrapped like a one row result column.
+            row = self.fetch_one(conn, f"query.{i}", query)
+            self.log.debug(f"Result from test query : {row}")
+            if test({'result': [row[0] if row else None]}):
                 self.log.info("Data quality check passed.")
             else:
                 self.log.info('Data quality check failed')
-                raise AssertionError('Data quality check failed')
-
+                failed.append(query.strip())
+        return failed
@@ -1,4 +1,9 @@
 class DataQualityQueries:
+    # Relative error of Redshift's APPROXIMATE COUNT(DISTINCT).
+    APPROXIMATE_DISTINCT_ERROR = 0.02
+    # Granularity of the modulo-hash sample, fractions are rounded to 1/SAMPLE_BUCKETS.
+    SAMPLE_BUCKETS = 10000
+
     @staticmethod
     def table_not_empty(table):
         """
@@ -26,9 +31,9 @@ class DataQualityQueries:
         :return: SQL statement that returns a single column 'result' indicate how many rows are null.
         """
         return """
-        SELECT COUNT({col:}) AS result
+        SELECT COUNT(*) AS result
         FROM {table:}
-        WHERE "{col:}" IS NULL 
+        WHERE "{col:}" IS NULL
         """.format(**dict(table=table, col=col))
 
     @staticmethod
@@ -47,9 +52,101 @@ class DataQualityQueries:
         return """
         SELECT COUNT({col:}) AS result
         FROM {table:}
-        WHERE "{col:}" LIKE "%{val:}%"
+        WHERE "{col:}" LIKE '%{val:}%'
         """.format(**dict(table=table, col=col, val=val))
 
     @staticmethod
     def check_col_does_not_contain_str(result):
         return result["result"][0] == 0
+
+    @staticmethod
+    def col_is_unique(table, col):
+        """
+        Tests if the values of a given column in a table are unique
+        :param table: Name of the table.
+        :param col: Name of the column.
+        :return: SQL statement that returns a single column 'result' indicate how many rows are duplicates.
+        """
+        return """
+        SELECT COUNT("{col:}") - COUNT(DISTINCT "{col:}") AS result
+        FROM {table:}
+        """.format(**dict(table=table, col=col))
+
+    @staticmethod
+    def check_col_is_unique(result):
+        return result["result"][0] == 0
+
+    # Conditional aggregates of the checks above. Several of them on the same table are combined into one
+    # SELECT, so N checks cost a single scan.
+
+    @staticmethod
+    def table_not_empty_agg():
+        return "CASE WHEN COUNT(*) > 0 THEN 1 ELSE 0 END"
+
+    @staticmethod
+    def col_does_not_contain_null_agg(col):
+        return """COALESCE(SUM(CASE WHEN "{col:}" IS NULL THEN 1 ELSE 0 END), 0)""".format(**dict(col=col))
+
+    @staticmethod
+    def col_does_not_contain_str_agg(col, val):
+        return """COALESCE(SUM(CASE WHEN "{col:}" LIKE '%{val:}%' THEN 1 ELSE 0 END), 0)""".format(
+            **dict(col=col, val=val))
+
+    @staticmethod
+    def col_is_unique_agg(col):
+        return """COUNT("{col:}") - COUNT(DISTINCT "{col:}")""".format(**dict(col=col))
+
+    @staticmethod
+    def col_is_unique_approx_agg(col):
+        # HyperLogLog estimate of the distinct values, see APPROXIMATE_DISTINCT_ERROR.
+        return """COUNT("{col:}") - APPROXIMATE COUNT(DISTINCT "{col:}")""".format(**dict(col=col))
+
+    @staticmethod
+    def combined_checks(table, aggregates):
+        """
+        Combine the aggregates of several checks on one table into a single query.
+        :param table: Name of the table.
+        :param aggregates: List of aggregate expressions, e.g. from `col_does_not_contain_null_agg`.
+        :return: SQL statement returning one row with one column per aggregate, in the given order.
+        """
+        return """
+        SELECT {columns:}
+        FROM {table:}
+        """.format(**dict(
+            table=table,
+            columns=",\n            ".join(f"{agg} AS check_{i}" for i, agg in enumerate(aggregates))))
+
+    @staticmethod
+    def sampled_checks(table, aggregates, fraction, sample_key=None):
+        """
+        Combine the aggregates of several checks on one table into a single query over a sample of it.
+        :param table: Name of the table.
+        :param aggregates: List of aggregate expressions, e.g. from `col_does_not_contain_null_agg`.
+        :param fraction: Share of the rows to read, between 0 and 1.
+        :param sample_key: Column to sample on with a modulo hash (Redshift). Without it the query uses
+            TABLESAMPLE BERNOULLI, which Postgres supports but Redshift does not.
+        :return: SQL statement returning one row with the number of sampled rows in 'sampled_rows', followed by
+            one column per aggregate, in the given order.
+        """
+        columns = ",\n            ".join(
+            ["COUNT(*) AS sampled_rows"] + [f"{agg} AS check_{i}" for i, agg in enumerate(aggregates)])
+        if sample_key is None:
+            return """
+        SELECT {columns:}
+        FROM {table:} TABLESAMPLE BERNOULLI ({percent:})
+        """.format(**dict(table=table, columns=columns, percent=fraction * 100))
+        return """
+        SELECT {columns:}
+        FROM {table:}
+        WHERE ABS(MOD(FNV_HASH("{key:}"), {buckets:})) < {threshold:}
+        """.format(**dict(table=table, columns=columns, key=sample_key, buckets=DataQualityQueries.SAMPLE_BUCKETS,
+                          threshold=max(1, round(fraction * DataQualityQueries.SAMPLE_BUCKETS))))
+
+    @classmethod
+    def aggregate_check(cls, check):
+        """
+        Look up a check by name.
+        :param check: Name of the check, e.g. 'col_does_not_contain_null'.
+        :return: Tuple of (function building the aggregate expression, function testing its result).
+        """
+        return getattr(cls, f"{check}_agg"), getattr(cls, f"check_{check}")
@@ -0,0 +1,122 @@
+from contextlib import contextmanager
+from functools import wraps
+import json
+import time
+
+try:
+    from airflow.stats import Stats
+except ImportError:  # metrics still go to XCom and the task log
+    Stats = None
+
+# Prefix of the StatsD metric names, e.g. 'reddit.stage_authors.copy.seconds'
+METRIC_PREFIX = 'reddit'
+
+
+class OperatorMetrics:
+    """
+    Duration, rows and bytes of each phase of one task run.
+    :param task_id: Id of the task the metrics belong to
+    """
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.status = 'running'
+        self.phases = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name, **counters):
+        """
+        Time a phase. The yielded dict takes counters such as 'rows' and 'bytes', also after the phase ended.
+        :param name: Name of the phase, e.g. 'connect', 'truncate', 'copy', 'insert' or 'check'
+        """
+        entry = {'phase': name, 'seconds': None, **counters}
+        self.phases.append(entry)
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['seconds'] = round(time.perf_counter() - start, 3)
+
+    def as_dict(self):
+        return {
+            'task_id': self.task_id,
+            'status': self.status,
+            'seconds': round(time.perf_counter() - self._start, 3),
+            'rows': sum(entry.get('rows') or 0 for entry in self.phases),
+            'bytes': sum(entry.get('bytes') or 0 for entry in self.phases),
+            'phases': self.phases,
+        }
+
+
+class InstrumentedOperatorMixin:
+    """
+    Per phase metrics for operators. Decorate `execute` with `instrumented` and wrap its phases in
+    `self.phase(...)`, or run SQL through `run_sql`/`fetch_one` to also record the affected rows.
+    At the end of the task the metrics are pushed to XCom (key 'metrics'), sent to StatsD if Airflow has it
+    enabled and logged as one JSON line starting with 'METRICS '.
+    """
+    metrics = None
+
+    def phase(self, name, **counters):
+        return self.metrics.phase(name, **counters)
+
+    def run_sql(self, conn, name, sql):
+        """
+        Execute SQL on a DB-API connection as one phase and record `cursor.rowcount` as its rows.
+        :param conn: Open connection, committing is left to the caller
+        :param name: Name of the phase
+        :param sql: One statement (the rows are those of the last one if there are several)
+        :return: Rows affected, or None if the driver does not know
+        """
+        with self.phase(name) as entry:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                entry['rows'] = cur.rowcount if cur.rowcount >= 0 else None
+        return entry['rows']
+
+    def fetch_one(self, conn, name, sql, **counters):
+        """
+        Execute a query on a DB-API connection as one phase.
+        :param counters: Further values to record for the phase, e.g. checks=3
+        :return: The first row of the result, or None
+        """
+        with self.phase(name, **counters):
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                return cur.fetchone()
+
+    def emit_metrics(self, context):
+        metrics = self.metrics.as_dict()
+        self.log.info("METRICS " + json.dumps(metrics, separators=(',', ':')))
+        if context and context.get('ti') is not None:
+            context['ti'].xcom_push(key='metrics', value=metrics)
+        if Stats is not None:
+            prefix = f"{METRIC_PREFIX}.{self.task_id}"
+            Stats.timing(f"{prefix}.seconds", metrics['seconds'] * 1000)
+            for entry in metrics['phases']:
+                Stats.timing(f"{prefix}.{entry['phase']}.seconds", (entry['seconds'] or 0) * 1000)
+                for counter in ('rows', 'bytes'):
+                    if entry.get(counter) is not None:
+                        Stats.gauge(f"{prefix}.{entry['phase']}.{counter}", entry[counter])
+
+
+def instrumented(execute):
+    """
+    Decorator for the `execute` method of an `InstrumentedOperatorMixin` operator: starts the metrics of
+    the run and emits them when it ends, whether it succeeded or failed.
+    """
+    @wraps(execute)
+    def wrapper(self, context):
+        self.metrics = OperatorMetrics(self.task_id)
+        try:
+            result = execute(self, context)
+        except BaseException:
+            self.metrics.status = 'failed'
+            raise
+        else:
+            self.metrics.status = 'success'
+            return result
+        finally:
+            self.emit_metrics(context)
+    return wrapper
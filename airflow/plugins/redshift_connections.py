@@ -0,0 +1,152 @@
+from airflow.providers.postgres.hooks.postgres import PostgresHook
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR, TRANSACTION_STATUS_INTRANS
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RedshiftConnectionCache:
+    """
+    Keeps idle Redshift connections of a worker process for reuse, so the phases of a task and the tasks
+    that run in the same process skip the TLS handshake and authentication of a new connection.
+
+        conn = redshift_connections.acquire('redshift')
+        try:
+            with conn:  # one transaction, committed on success and rolled back on error
+                ...
+        finally:
+            redshift_connections.release('redshift', conn)
+
+    A connection idle for more than `check_after` seconds is checked with a `SELECT 1` before it is handed
+    out again; connections older than `max_age` seconds, broken ones and ones left in an unknown state are
+    closed instead. After a fork, connections inherited from the parent are dropped, never shared.
+    Connections are only handed out again for the same connection id and hook arguments.
+    :param max_age: Seconds after which a connection is closed instead of reused
+    :param check_after: Seconds of idleness after which a connection is health checked before reuse
+    :param max_idle: Most idle connections kept per connection id and hook arguments
+    """
+
+    def __init__(self, max_age=15 * 60, check_after=30, max_idle=4):
+        self.max_age = max_age
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self.opened = 0
+        self.reused = 0
+        self._idle = {}
+        self._created = {}
+        self._keys = {}
+        self._inherited = []
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def acquire(self, conn_id, **hook_kwargs):
+        """
+        Hand out a healthy idle connection, or open a new one.
+        :param conn_id: Airflow connection id
+        :param hook_kwargs: Further arguments for `PostgresHook`, e.g. connect_args. A cached connection is only
+            reused if it was opened with the same ones.
+        :return: psycopg2 connection, to be given back with `release`
+        """
+        key = self._key(conn_id, hook_kwargs)
+        while True:
+            with self._lock:
+                self._forget_parent()
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                conn, released = idle.pop()
+            if self._usable(conn, released):
+                self.reused += 1
+                return conn
+            self._close(conn)
+
+        conn = PostgresHook(postgres_conn_id=conn_id, **hook_kwargs).get_conn()
+        with self._lock:
+            self._created[id(conn)] = time.monotonic()
+            self._keys[id(conn)] = key
+            self.opened += 1
+        logger.info(f"Opened connection {self.opened} to '{conn_id}'")
+        return conn
+
+    def release(self, conn_id, conn):
+        """
+        Give a connection back. An open transaction is rolled back; connections that cannot be reset, are too
+        old, exceed `max_idle` or were not acquired for `conn_id` are closed.
+        """
+        try:
+            status = conn.get_transaction_status()
+            if status in (TRANSACTION_STATUS_INTRANS, TRANSACTION_STATUS_INERROR):
+                conn.rollback()
+                status = conn.get_transaction_status()
+        except Exception:
+            status = None
+        with self._lock:
+            self._forget_parent()
+            key = self._keys.get(id(conn))
+            if (status == TRANSACTION_STATUS_IDLE and key is not None and key[0] == conn_id
+                    and not self._expired(conn)):
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle:
+                    idle.append((conn, time.monotonic()))
+                    return
+        self._close(conn)
+
+    def clear(self):
+        """
+        Close every idle connection.
+        """
+        with self._lock:
+            self._forget_parent()
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn, _ in connections:
+                self._close(conn)
+
+    @staticmethod
+    def _key(conn_id, hook_kwargs):
+        # connect_args and the like are dicts, so the arguments are keyed by their canonical JSON.
+        return conn_id, json.dumps(hook_kwargs, sort_keys=True, default=repr)
+
+    def _expired(self, conn):
+        return time.monotonic() - self._created.get(id(conn), 0) > self.max_age
+
+    def _usable(self, conn, released):
+        if conn.closed or self._expired(conn):
+            return False
+        if time.monotonic() - released < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.info(f"Drop a cached connection that failed its health check : {e}")
+            return False
+
+    def _close(self, conn):
+        with self._lock:
+            self._created.pop(id(conn), None)
+            self._keys.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _forget_parent(self):
+        # Closing the parent's connections in a forked child would end the parent's sessions too, and so would
+        # the garbage collector: keep them referenced, unused.
+        if os.getpid() != self._pid:
+            self._inherited.append(self._idle)
+            self._idle = {}
+            self._created = {}
+            self._keys = {}
+            self._pid = os.getpid()
+
+
+# Shared by the Redshift operators of this worker process.
+redshift_connections = RedshiftConnectionCache()
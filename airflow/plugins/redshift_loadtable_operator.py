@@ -1,16 +1,35 @@
-from airflow.providers.postgres.hooks.postgres import PostgresHook
+from datetime import datetime, timezone
+from airflow.exceptions import AirflowException
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
+from operator_metrics import InstrumentedOperatorMixin, instrumented
+from redshift_connections import redshift_connections
 
 
-class LoadRedshiftTableOperator(BaseOperator):
+class LoadRedshiftTableOperator(InstrumentedOperatorMixin, BaseOperator):
     """
     Load data into DWH table with a customizable SQL query.
     :param redshift_conn_id: Airflow connection id for Redshift connection secret
     :param table: Name of the table in Redshift that will be populated
     :param sql_stmt: Select query to retrieve rows that will be used for populating the target table.
+    :param update_mode: 'append' inserts the rows, 'overwrite' truncates the table first and 'upsert' replaces
+        the rows whose `key_columns` match and inserts the others, in a single transaction; rows identical to
+        the ones in the table are left alone.
+        'partition' deletes the rows of [`partition_start`, `partition_end`) and inserts them again, so
+        re-running a day is idempotent and days can be loaded in parallel.
+    :param key_columns: List of columns identifying a row, required for 'upsert'. `sql_stmt` must produce at
+        most one row per key, the task fails otherwise (use e.g. dim_author_insert_unique, not dim_author_insert).
+    :param partition_column: Timestamp column of `table` the partition is defined on, required for 'partition'.
+    :param partition_start: First day of the partition (inclusive), e.g. '{{ ds }}'. Templatable field.
+    :param partition_end: Day after the partition (exclusive), e.g. '{{ next_ds }}'. Templatable field.
+    :param staging_table: Source table passed to `sql_stmt` as `{staging_table}`. Templatable field.
+    :param drop_staging_table: Drop `staging_table` in the same transaction once it has been loaded.
+
+    Every statement runs as a phase of its own; durations and affected rows are pushed to XCom as 'metrics'
+    (see `InstrumentedOperatorMixin`).
     """
     ui_color = '#F98866'
+    template_fields = ("partition_start", "partition_end", "staging_table")
 
     @apply_defaults
     def __init__(
@@ -19,24 +38,120 @@ class LoadRedshiftTableOperator(BaseOperator):
             table="",
             sql_stmt="",
             update_mode="append",
+            key_columns=None,
+            partition_column="",
+            partition_start="",
+            partition_end="",
+            staging_table="",
+            drop_staging_table=False,
             *args, **kwargs):
         super(LoadRedshiftTableOperator, self).__init__(*args, **kwargs)
         self.redshift_conn_id = redshift_conn_id
         self.table = table
         self.sql_stmt = sql_stmt
         self.update_mode = update_mode.lower()
+        self.key_columns = key_columns or []
+        if self.update_mode == 'upsert' and not self.key_columns:
+            raise ValueError("update_mode 'upsert' requires key_columns")
+        self.partition_column = partition_column
+        self.partition_start = partition_start
+        self.partition_end = partition_end
+        self.staging_table = staging_table
+        self.drop_staging_table = drop_staging_table
+        if self.update_mode == 'partition' and not self.partition_column:
+            raise ValueError("update_mode 'partition' requires partition_column")
 
+    @instrumented
     def execute(self, context):
-        redshift_conn = PostgresHook(postgres_conn_id=self.redshift_conn_id)
+        with self.phase('connect'):
+            conn = redshift_connections.acquire(self.redshift_conn_id)
         self.log.info("Connection to Redshift has been successfully created")
-        sql_query = ""
-        if self.update_mode == 'overwrite':
-            sql_query += f"TRUNCATE TABLE '{self.table}';\n"
-        sql_query += self.sql_stmt.format(**dict(
-            table=self.table,
-        ))
+        if self.update_mode == 'upsert':
+            statements = self._upsert_statements()
+        elif self.update_mode == 'partition':
+            statements = self._partition_statements()
+        else:
+            statements = []
+            if self.update_mode == 'overwrite':
+                statements.append(('truncate', f"TRUNCATE TABLE {self.table}"))
+            statements.append(('insert', self.sql_stmt.format(**dict(
+                table=self.table,
+                staging_table=self.staging_table,
+            ))))
 
         self.log.info(f"Loading Redshift Table : {self.table}")
-        self.log.debug(f"Formatted query: {sql_query}")
-        redshift_conn.run(sql_query)
+        try:
+            # One transaction: the connection commits after the last statement or rolls back on error.
+            with conn:
+                for phase, sql_query in statements:
+                    self.log.debug(f"Formatted query ({phase}): {sql_query}")
+                    if phase == 'check_keys':
+                        self._check_unique_keys(conn, sql_query)
+                        continue
+                    rows = self.run_sql(conn, phase, sql_query)
+                    self.log.info(f"{phase} : {rows if rows is not None else 'unknown'} rows")
+        finally:
+            redshift_connections.release(self.redshift_conn_id, conn)
         self.log.info(f"Finished loading Redshift Table {self.table}")
+
+    def _upsert_statements(self):
+        """
+        Staging table merge: the new rows land in a temp table shaped like the target and must be unique on
+        the key. Staged rows equal to their target row are dropped, so only the changed and new rows are
+        deleted from the target and inserted again: the cost follows the delta, not the size of the table.
+        :return: List of (phase, statement) tuples
+        """
+        stage = f"{self.table.replace('.', '_')}_upsert_stage"
+        unchanged = f"{stage}_unchanged"
+        keys = ", ".join(f'"{col}"' for col in self.key_columns)
+
+        def key_match(left, right):
+            return " AND ".join(f'{left}."{col}" = {right}."{col}"' for col in self.key_columns)
+
+        return [
+            ('create_stage', f"CREATE TEMP TABLE {stage} (LIKE {self.table})"),
+            ('insert_stage', self.sql_stmt.format(**dict(table=stage, staging_table=self.staging_table))),
+            ('check_keys', f"SELECT COUNT(*) FROM (SELECT {keys} FROM {stage} GROUP BY {keys} HAVING COUNT(*) > 1) AS d"),
+            # INTERSECT compares whole rows and treats NULLs as equal, unlike a column by column WHERE.
+            ('find_unchanged', f"""CREATE TEMP TABLE {unchanged} AS
+SELECT * FROM {stage}
+INTERSECT
+SELECT t.* FROM {self.table} t JOIN {stage} ON {key_match('t', stage)}"""),
+            ('drop_unchanged', f"DELETE FROM {stage} USING {unchanged} WHERE {key_match(stage, unchanged)}"),
+            ('delete', f"DELETE FROM {self.table} USING {stage} WHERE {key_match(self.table, stage)}"),
+            ('insert', f"INSERT INTO {self.table} SELECT * FROM {stage}"),
+            ('drop_stage', f"DROP TABLE {stage}, {unchanged}"),
+        ]
+
+    def _check_unique_keys(self, conn, sql):
+        # The merge deletes by key, several staged rows for one key would all be inserted.
+        duplicates = self.fetch_one(conn, 'check_keys', sql)[0]
+        if duplicates:
+            raise AirflowException(f"{self.table} upsert : sql_stmt produced several rows for {duplicates} "
+                                   f"key(s) of {self.key_columns}")
+
+    def _partition_statements(self):
+        """
+        Replace one time range of the table. `sql_stmt` receives the range as `{start_epoch}`/`{end_epoch}`
+        (unix seconds) and `{start}`/`{end}` (dates) to select only the rows of that range.
+        :return: List of (phase, statement) tuples
+        """
+        start_epoch = int(datetime.fromisoformat(self.partition_start).replace(tzinfo=timezone.utc).timestamp())
+        end_epoch = int(datetime.fromisoformat(self.partition_end).replace(tzinfo=timezone.utc).timestamp())
+        insert = self.sql_stmt.format(**dict(
+            table=self.table,
+            staging_table=self.staging_table,
+            start=self.partition_start,
+            end=self.partition_end,
+            start_epoch=start_epoch,
+            end_epoch=end_epoch,
+        ))
+        statements = [
+            ('delete', f"""DELETE FROM {self.table}
+WHERE "{self.partition_column}" >= '{self.partition_start}'
+    AND "{self.partition_column}" < '{self.partition_end}'"""),
+            ('insert', insert),
+        ]
+        if self.drop_staging_table:
+            statements.append(('drop_staging', f"DROP TABLE {self.staging_table}"))
+        return statements
@@ -1,10 +1,14 @@
 from airflow.providers.amazon.aws.hooks.base_aws import AwsBaseHook
-from airflow.providers.postgres.hooks.postgres import PostgresHook
+from airflow.providers.amazon.aws.hooks.s3 import S3Hook
+from botocore.exceptions import ClientError
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
+from operator_metrics import InstrumentedOperatorMixin, instrumented
+from redshift_connections import redshift_connections
+from s3_copy_manifest import PART_COMPRESSION, split_s3_object
 
 
-class StageToRedshiftOperator(BaseOperator):
+class StageToRedshiftOperator(InstrumentedOperatorMixin, BaseOperator):
     """
     Operator to transfer data from S3 to staging tables in a Redshift database.
 
@@ -14,7 +18,7 @@ class StageToRedshiftOperator(BaseOperator):
     :param s3_src_bucket_name: Name of S3 source bucket, e.g. 'udacity-dend'
     :param s3_src_bucket_key: Key for files in the S3 source bucket. Templatable field.
         E.g. 'log_data/{execution_date.year}/{execution_date.month}/'
-    :param data_format: Determines the format of the input data. Can be either 'csv' or 'json'.
+    :param data_format: Determines the format of the input data. Can be 'csv', 'json' or 'parquet'.
     :param delimiter: CSV delimiter, will be ignored if `data_format` is not set to 'csv'
     :param jsonpaths: Defines how JSON objects are handled during import. More information see
         [here](https://docs.aws.amazon.com/en_us/redshift/latest/dg/copy-usage_notes-copy-from-json.html).
@@ -22,9 +26,25 @@ class StageToRedshiftOperator(BaseOperator):
     :param ignore_header: Specifies how many header lines should be ignored.
         [See documentation for
         details](https://docs.aws.amazon.com/redshift/latest/dg/copy-parameters-data-conversion.html#copy-ignoreheader)
+    :param split_parts: Split a single large source object into this many compressed parts and load them
+        through a COPY manifest, so every slice of the cluster takes part in the load. 'auto' uses the number
+        of slices of the cluster. Only applies to line-oriented formats ('csv', 'json') and to keys of a single
+        object, prefixes are copied as they are. The `ignore_header` lines are left out of the parts. Parts of
+        an unchanged source are split once and reused by later runs. Defaults to no split.
+    :param split_min_size: Source objects smaller than this many bytes are copied directly.
+    :param split_compression: Compression of the parts, 'gzip' or 'zstd'.
+    :param create_like: Create `table` like this table if it does not exist yet, e.g. for a staging table per
+        execution date. Templatable `table` names such as 'staging_submissions_{{ ds_nodash }}' let runs for
+        different days stage in parallel.
+    :param create_sql: Alternative to `create_like`: a CREATE TABLE IF NOT EXISTS statement with a `{table}`
+        placeholder, e.g. `SqlQueries.staging_submissions_parquet_create`. Needed for 'parquet', which COPY
+        maps to the columns by position, when no existing table has the column order of the files.
+
+    The duration of the connect, create, truncate, split and copy phases, the rows loaded and the bytes split
+    are pushed to XCom as 'metrics' (see `InstrumentedOperatorMixin`).
     """
     ui_color = '#c6bae8'
-    template_fields = ("s3_src_bucket_key",)
+    template_fields = ("table", "s3_src_bucket_key",)
 
     @apply_defaults
     def __init__(
@@ -41,6 +61,11 @@ class StageToRedshiftOperator(BaseOperator):
             jsonpath="auto",
             copy_opts="",
             ignore_header=0,
+            split_parts=None,
+            split_min_size=256 * 1024 * 1024,
+            split_compression='gzip',
+            create_like="",
+            create_sql="",
             *args, **kwargs):
         super(StageToRedshiftOperator, self).__init__(*args, **kwargs)
 
@@ -54,6 +79,13 @@ class StageToRedshiftOperator(BaseOperator):
         self.jsonpath = jsonpath
         self.copy_opts = copy_opts
         self.ignore_header = ignore_header
+        self.split_parts = split_parts
+        self.split_min_size = split_min_size
+        self.split_compression = split_compression
+        self.create_like = create_like
+        self.create_sql = create_sql
+        if create_like and create_sql:
+            raise ValueError("Pass either create_like or create_sql, not both")
         self._sql = """
             COPY {table:}
             FROM '{source:}'
@@ -62,33 +94,58 @@ class StageToRedshiftOperator(BaseOperator):
             {format:}
         """
 
+    @instrumented
     def execute(self, context):
         aws_hook = AwsBaseHook(self.aws_credentials_id)
         aws_credentials = aws_hook.get_credentials()
-        redshift_conn = PostgresHook(
-            postgres_conn_id=self.redshift_conn_id,
-            connect_args={
-                'keepalives': 1,
-                'keepalives_idle': 60,
-                'keepalives_interval': 60
-            })
+        with self.phase('connect'):
+            conn = redshift_connections.acquire(
+                self.redshift_conn_id,
+                connect_args={
+                    'keepalives': 1,
+                    'keepalives_idle': 60,
+                    'keepalives_interval': 60
+                })
+        try:
+            formatted_key = self.s3_src_bucket_key.format(**context)
+            self.log.info(f"Rendered S3 source file key : {formatted_key}")
+            split_format = ''
+            if self.split_parts and self.data_format in ('csv', 'json'):
+                # Before the transaction: splitting a large object takes a while.
+                with self.phase('split') as split:
+                    formatted_key, split_format, split['bytes'] = self._split_source(conn, formatted_key)
+            # CREATE, TRUNCATE and COPY in one transaction (Redshift commits a TRUNCATE right away, though).
+            with conn:
+                self._stage(conn, aws_credentials, formatted_key, split_format)
+        finally:
+            redshift_connections.release(self.redshift_conn_id, conn)
+
+    def _stage(self, conn, aws_credentials, formatted_key, split_format):
+        if self.create_like:
+            self.log.debug(f"Create Table: {self.table} like {self.create_like}")
+            self.run_sql(conn, 'create', f"CREATE TABLE IF NOT EXISTS {self.table} (LIKE {self.create_like})")
+        elif self.create_sql:
+            self.log.debug(f"Create Table: {self.table}")
+            self.run_sql(conn, 'create', self.create_sql.format(table=self.table))
 
         self.log.debug(f"Truncate Table: {self.table}")
-        redshift_conn.run(f"TRUNCATE TABLE {self.table}")
+        self.run_sql(conn, 'truncate', f"TRUNCATE TABLE {self.table}")
 
         format = ''
-        if self.data_format == 'csv' and self.ignore_header > 0:
+        # The header lines are not part of split parts, COPY would skip them in every part.
+        if self.data_format == 'csv' and self.ignore_header > 0 and not split_format:
             format += f"IGNOREHEADER {self.ignore_header}\n"
 
         if self.data_format == 'csv':
             format += f"DELIMITER '{self.delimiter}'\n"
         elif self.data_format == 'json':
             format += f"FORMAT AS JSON '{self.jsonpath}'\n"
+        elif self.data_format == 'parquet':
+            format += "FORMAT AS PARQUET\n"
+
+        format += split_format
         format += f"{self.copy_opts}"
         self.log.debug(f"format : {format}")
-
-        formatted_key = self.s3_src_bucket_key.format(**context)
-        self.log.info(f"Rendered S3 source file key : {formatted_key}")
         s3_url = f"s3://{self.s3_src_bucket_name}/{formatted_key}"
         self.log.debug(f"S3 URL : {s3_url}")
         formatted_sql = self._sql.format(**dict(
@@ -101,5 +158,46 @@ class StageToRedshiftOperator(BaseOperator):
         self.log.debug(f"Base SQL: {self._sql}")
 
         self.log.info(f"Copying data from S3 to Redshift table {self.table}...")
-        redshift_conn.run(formatted_sql)
-        self.log.info(f"Finished copying data from S3 to Redshift table {self.table}")
+        with self.phase('copy') as copy, conn.cursor() as cur:
+            cur.execute(formatted_sql)
+            copy['rows'] = cur.rowcount
+            if copy['rows'] < 0:
+                # Redshift does not report the rows of a COPY in the command status.
+                cur.execute("SELECT pg_last_copy_count()")
+                copy['rows'] = cur.fetchone()[0]
+        self.log.info(f"Finished copying {copy['rows']} rows from S3 to Redshift table {self.table}")
+
+    def _split_source(self, conn, key):
+        """
+        Split the source object into parts and write a COPY manifest for them, unless an earlier run already did.
+        :return: Tuple of (key to COPY from, additional COPY options, bytes split in this run)
+        """
+        s3_client = S3Hook(self.aws_credentials_id).get_conn()
+        source = f"s3://{self.s3_src_bucket_name}/{key}"
+        try:
+            head = None if key.endswith('/') else s3_client.head_object(Bucket=self.s3_src_bucket_name, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+                raise
+            head = None
+        if head is None:
+            self.log.info(f"{source} is a prefix, not a single object, copy it without splitting")
+            return key, '', 0
+        size = head['ContentLength']
+        if size < self.split_min_size:
+            self.log.info(f"{source} has {size} bytes, copy it without splitting")
+            return key, '', 0
+
+        parts = self.split_parts
+        if parts == 'auto':
+            with conn:
+                parts = self.fetch_one(conn, 'slices', "SELECT COUNT(*) FROM stv_slices")[0]
+        self.log.info(f"Split {source} into {parts} {self.split_compression} parts")
+        manifest_key, written = split_s3_object(
+            s3_client, self.s3_src_bucket_name, key, int(parts), compression=self.split_compression,
+            skip_lines=self.ignore_header if self.data_format == 'csv' else 0, source_etag=head['ETag'])
+        if not written:
+            self.log.info(f"Reuse the parts of s3://{self.s3_src_bucket_name}/{manifest_key}, {source} is unchanged")
+        # Statistics and compression analysis would run over the whole load again, skip them for staging.
+        return (manifest_key, f"MANIFEST\n{PART_COMPRESSION[self.split_compression][1]}\nCOMPUPDATE OFF\nSTATUPDATE OFF\n",
+                size if written else 0)
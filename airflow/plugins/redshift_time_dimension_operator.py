@@ -0,0 +1,38 @@
+from airflow.utils.decorators import apply_defaults
+from redshift_loadtable_operator import LoadRedshiftTableOperator
+from sql_queries import SqlQueries
+
+
+class LoadTimeDimensionOperator(LoadRedshiftTableOperator):
+    """
+    Incrementally build the time dimension from dim_author, dim_subreddit and fact_submission.
+    :param redshift_conn_id: Airflow connection id for Redshift connection secret
+    :param table: Name of the time dimension table
+    :param strategy: 'union' (default) inserts every distinct source timestamp that is not in the table yet,
+        using one UNION that reads each source table once instead of the five staging_times scans; facts join it
+        on their timestamps as stored. 'grid' inserts one row per hour of the covered date range that is not in
+        the table yet. Its start_time are whole hours, so every join against it has to truncate the fact side,
+        e.g. t.start_time = DATE_TRUNC('hour', f.created); an equality join on f.created misses almost all rows.
+    """
+    ui_color = '#F98866'
+    strategies = {
+        'union': SqlQueries.dim_time_insert_union,
+        'grid': SqlQueries.dim_time_insert_grid,
+    }
+
+    @apply_defaults
+    def __init__(
+            self,
+            redshift_conn_id="",
+            table="dim_time",
+            strategy="union",
+            *args, **kwargs):
+        if strategy not in self.strategies:
+            raise ValueError(f"Unknown time dimension strategy '{strategy}', use one of {sorted(self.strategies)}")
+        super(LoadTimeDimensionOperator, self).__init__(
+            redshift_conn_id=redshift_conn_id,
+            table=table,
+            sql_stmt=self.strategies[strategy],
+            update_mode="append",
+            *args, **kwargs)
+        self.strategy = strategy
@@ -0,0 +1,163 @@
+import gzip
+import json
+import lzma
+import os
+import tempfile
+
+try:
+    import zstandard
+except ImportError:  # only needed for .zst sources or zstd parts
+    zstandard = None
+
+READ_SIZE = 8 * 1024 * 1024
+# The pushshift dumps are compressed with --long=31, which needs a 2 GB window.
+ZSTD_MAX_WINDOW_SIZE = 2 ** 31
+
+# File extension and COPY option for each supported part compression.
+PART_COMPRESSION = {
+    'gzip': ('.gz', 'GZIP'),
+    'zstd': ('.zst', 'ZSTD'),
+}
+
+
+def _decompressed(body, key):
+    """
+    Wrap an S3 object body so that reads return the decompressed content, based on the key's extension.
+    """
+    if key.endswith('.gz'):
+        return gzip.GzipFile(fileobj=body)
+    if key.endswith(('.xz', '.lzma')):
+        return lzma.LZMAFile(body)
+    if key.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"Splitting '{key}' requires the 'zstandard' package.")
+        return zstandard.ZstdDecompressor(max_window_size=ZSTD_MAX_WINDOW_SIZE).stream_reader(body, read_size=READ_SIZE)
+    return body
+
+
+def _part_writer(path, compression):
+    if compression == 'gzip':
+        # COPY spends far longer parsing than gunzip does, favour compression speed.
+        return gzip.open(path, 'wb', compresslevel=1)
+    if zstandard is None:
+        raise RuntimeError("zstd parts require the 'zstandard' package.")
+    return zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'))
+
+
+def _skip_lines(stream, count, block_size):
+    """
+    Read past the first `count` lines of a stream.
+    :return: The bytes read after them
+    """
+    data = b''
+    while count:
+        block = stream.read(block_size)
+        if not block:
+            return b''
+        data += block
+        while count:
+            cut = data.find(b'\n') + 1
+            if cut == 0:
+                break
+            data = data[cut:]
+            count -= 1
+    return data
+
+
+def split_lines(stream, parts, tmp_dir, compression='gzip', block_size=READ_SIZE, skip_lines=0):
+    """
+    Split a line-oriented stream into `parts` compressed files of about the same size.
+    Line-aligned blocks are dealt out round robin, so no part ever contains a partial row.
+    :param stream: Binary stream of the (decompressed) source
+    :param parts: Number of files to produce
+    :param tmp_dir: Directory for the part files
+    :param compression: 'gzip' or 'zstd'
+    :param block_size: Approximate bytes per block
+    :param skip_lines: Leading lines to leave out, e.g. a CSV header. COPY would apply IGNOREHEADER to every part.
+    :return: List of part file paths
+    """
+    extension, _ = PART_COMPRESSION[compression]
+    paths = [os.path.join(tmp_dir, f"part-{i:05d}{extension}") for i in range(parts)]
+    writers = [_part_writer(path, compression) for path in paths]
+    try:
+        remainder = _skip_lines(stream, skip_lines, block_size)
+        turn = 0
+        while True:
+            data = stream.read(block_size)
+            if not data:
+                break
+            data = remainder + data
+            cut = data.rfind(b'\n') + 1
+            if cut == 0:
+                remainder = data
+                continue
+            remainder = data[cut:]
+            writers[turn % parts].write(data[:cut])
+            turn += 1
+        if remainder:
+            writers[turn % parts].write(remainder)
+    finally:
+        for writer in writers:
+            writer.close()
+    return paths
+
+
+def build_copy_manifest(bucket_name, keys_and_sizes):
+    """
+    Build a Redshift COPY manifest.
+    :param bucket_name: Bucket holding the parts
+    :param keys_and_sizes: List of (key, size in bytes) tuples
+    :return: Manifest as JSON string
+    """
+    return json.dumps({
+        'entries': [
+            {'url': f"s3://{bucket_name}/{key}", 'mandatory': True, 'meta': {'content_length': size}}
+            for key, size in keys_and_sizes
+        ]
+    }, indent=2)
+
+
+def _object_metadata(s3_client, bucket_name, key):
+    try:
+        return s3_client.head_object(Bucket=bucket_name, Key=key)['Metadata']
+    except s3_client.exceptions.ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+
+
+def split_s3_object(s3_client, bucket_name, key, parts, compression='gzip', parts_prefix=None, skip_lines=0,
+                    source_etag=None):
+    """
+    Split an S3 object into compressed parts next to it and write a COPY manifest for them.
+    :param s3_client: boto3 S3 client
+    :param bucket_name: Bucket of the source object, the parts are written to the same bucket
+    :param key: Key of the source object, may be compressed (.gz/.xz/.zst)
+    :param parts: Number of parts, ideally the number of slices of the cluster
+    :param compression: 'gzip' or 'zstd'
+    :param parts_prefix: Key prefix for parts and manifest, defaults to '<key>.parts/'
+    :param skip_lines: Leading lines of the source left out of the parts, see `split_lines`
+    :param source_etag: ETag of the source object. The manifest records it with the split settings, and an
+        existing manifest that matches both is reused instead of splitting again.
+    :return: Tuple of (key of the manifest, True if the parts were written, False if reused)
+    """
+    parts_prefix = parts_prefix or f"{key}.parts/"
+    manifest_key = parts_prefix + 'manifest'
+    # The manifest is written last, so it only exists once all of its parts do.
+    metadata = {'source-etag': source_etag or '', 'split': f"{parts}/{compression}/{skip_lines}"}
+    if source_etag is not None and _object_metadata(s3_client, bucket_name, manifest_key) == metadata:
+        return manifest_key, False
+
+    body = s3_client.get_object(Bucket=bucket_name, Key=key)['Body']
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = split_lines(_decompressed(body, key), parts, tmp_dir, compression=compression,
+                            skip_lines=skip_lines)
+        entries = []
+        for path in paths:
+            part_key = parts_prefix + os.path.basename(path)
+            s3_client.upload_file(path, bucket_name, part_key)
+            entries.append((part_key, os.path.getsize(path)))
+
+    s3_client.put_object(Bucket=bucket_name, Key=manifest_key, Metadata=metadata,
+                         Body=build_copy_manifest(bucket_name, entries).encode('utf-8'))
+    return manifest_key, True
@@ -1,16 +1,92 @@
 from airflow.providers.amazon.aws.hooks.s3 import S3Hook
+from airflow.exceptions import AirflowException
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from s3transfer.subscribers import BaseSubscriber
+from operator_metrics import InstrumentedOperatorMixin, instrumented
+from upload_manifest import HashingReader, UploadManifest
 from pathlib import Path
+import time
 
+MB = 1024 * 1024
 
-class S3UploadOperator(BaseOperator):
+
+class _UploadStats(BaseSubscriber):
+    """
+    Transfer subscriber that logs size, duration and throughput of a single upload.
+    :param size: Size of the local file; the transfer only knows it for paths, not for file objects
+    """
+
+    def __init__(self, log, bucket_key, size):
+        self.log = log
+        self.bucket_key = bucket_key
+        self.size = size
+        self.start = None
+        self.elapsed = None
+
+    def on_queued(self, future, **kwargs):
+        self.start = time.perf_counter()
+
+    def on_done(self, future, **kwargs):
+        self.elapsed = time.perf_counter() - self.start
+        self.size = future.meta.size or self.size
+        try:
+            future.result()
+        except Exception as e:
+            self.log.error(f"Upload of '{self.bucket_key}' failed after {self.elapsed:.1f}s : {e}")
+            return
+        self.log.info(f"Uploaded '{self.bucket_key}' : {self.size / MB:.1f} MB in {self.elapsed:.1f}s "
+                      f"({self.size / MB / max(self.elapsed, 1e-6):.1f} MB/s)")
+
+
+def _glob_prefix(file_glob):
+    """
+    Longest key prefix shared by every path a glob can match, e.g. 'Submissions/' for 'Submissions/RS_*.xz'.
+    The last component names the files, so even without a wildcard the prefix is its parent directory.
+    """
+    static = []
+    for part in Path(file_glob).parts[:-1]:
+        if any(c in part for c in '*?['):
+            break
+        static.append(part)
+    return '/'.join(static) + '/' if static else ''
+
+
+def list_objects(client, bucket_name, prefix=''):
+    """
+    Index all objects below a prefix with paginated ListObjectsV2 calls.
+    :param client: boto3 S3 client
+    :param bucket_name: Name of the bucket
+    :param prefix: Key prefix to list
+    :return: Dict mapping key to a (size, etag) tuple
+    """
+    index = {}
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            index[obj['Key']] = (obj['Size'], obj['ETag'].strip('"'))
+    return index
+
+
+class S3UploadOperator(InstrumentedOperatorMixin, BaseOperator):
     """
     Filter and upload content of a folder and upload matching files to AWS S3.
+    Files are uploaded in parallel through one shared client; large files are split into multipart uploads.
+    The destination prefix is listed once up front: files already present with the same size are skipped,
+    objects whose size differs from the local file (partial or stale uploads) are replaced.
     :param aws_credentials_id: Airflow connection id for AWS connection secret
     :param dataset_dir: Path to directory that contains the files
     :param file_glob: Glob to match filenames
     :param bucket_name: AWS S3 destination bucket name
+    :param max_concurrency: Maximum number of parts (across all files) that are transferred at the same time
+    :param multipart_threshold: File size in bytes from which on multipart uploads are used
+    :param multipart_chunksize: Size in bytes of each part of a multipart upload
+    :param manifest_path: Optional path of a local `UploadManifest`. When set, a file is only uploaded if its
+        content changed since it was last uploaded to the same key, even if the object size still matches.
+
+    The duration of the connect, list and upload phases, the files uploaded or skipped and the bytes
+    transferred are pushed to XCom as 'metrics' (see `InstrumentedOperatorMixin`).
     """
 
     @apply_defaults
@@ -20,6 +96,10 @@ class S3UploadOperator(BaseOperator):
         dataset_dir='',
         bucket_name='',
         file_glob="",
+        max_concurrency=10,
+        multipart_threshold=64 * MB,
+        multipart_chunksize=64 * MB,
+        manifest_path=None,
         *args, **kwargs
     ):
         super(S3UploadOperator, self).__init__(*args, **kwargs)
@@ -27,16 +107,77 @@ class S3UploadOperator(BaseOperator):
         self.dataset_dir = dataset_dir
         self.bucket_name = bucket_name
         self.file_glob = file_glob
+        self.max_concurrency = max_concurrency
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.manifest_path = manifest_path
 
 
+    @instrumented
     def execute(self, context):
-        hook = S3Hook(self.aws_credentials_id)
+        with self.phase('connect'):
+            hook = S3Hook(self.aws_credentials_id)
+            client = hook.get_conn()
+        # A single transfer manager shares its bounded thread pool between all files, so
+        # max_concurrency caps the parts in flight regardless of how many files match.
+        transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=self.max_concurrency,
+        )
 
         pathlist = list(Path(self.dataset_dir).glob(self.file_glob))
-        for path in pathlist:
-            bucket_key = str(path)[len(self.dataset_dir) + 1:]
-            if hook.check_for_key(key=bucket_key, bucket_name=self.bucket_name):
-                self.log.info(f"File '{bucket_key}' is already present as s3://{self.bucket_name}/{bucket_key}. Skip upload.")
-            else:
-                self.log.info(f"Upload file '{bucket_key}' to s3://{self.bucket_name}/{bucket_key}. This might take a while.")
-                hook.load_file(filename=str(path), key=bucket_key, bucket_name=self.bucket_name)
\ No newline at end of file
+        prefix = _glob_prefix(self.file_glob)
+        with self.phase('list') as listing:
+            remote = list_objects(client, self.bucket_name, prefix)
+            listing['objects'] = len(remote)
+        self.log.info(f"Found {len(remote)} objects below s3://{self.bucket_name}/{prefix}")
+
+        manifest = UploadManifest(self.manifest_path) if self.manifest_path else None
+        uploads = []
+        skipped = 0
+        start = time.perf_counter()
+        with self.phase('upload') as upload, create_transfer_manager(client, transfer_config) as manager:
+            for path in pathlist:
+                bucket_key = str(path)[len(self.dataset_dir) + 1:]
+                s3_uri = f"s3://{self.bucket_name}/{bucket_key}"
+                local_size = path.stat().st_size
+                remote_size, _ = remote.get(bucket_key, (None, None))
+                if remote_size == local_size and (manifest is None or not manifest.needs_upload(path, s3_uri)):
+                    self.log.info(f"File '{bucket_key}' is already present as {s3_uri}. Skip upload.")
+                    skipped += 1
+                else:
+                    if remote_size is not None:
+                        self.log.warning(f"s3://{self.bucket_name}/{bucket_key} has {remote_size} bytes but the local "
+                                         f"file has {local_size}. Upload it again.")
+                    self.log.info(f"Upload file '{bucket_key}' to s3://{self.bucket_name}/{bucket_key}. This might take a while.")
+                    stats = _UploadStats(self.log, bucket_key, local_size)
+                    # With a manifest the file is hashed while it is sent, instead of read again afterwards.
+                    source = HashingReader(path) if manifest is not None else None
+                    future = manager.upload(source or str(path), self.bucket_name, bucket_key, subscribers=[stats])
+                    uploads.append((path, s3_uri, future, stats, source))
+        elapsed = time.perf_counter() - start
+
+        failed = []
+        total_bytes = 0
+        for path, s3_uri, future, stats, source in uploads:
+            try:
+                future.result()
+                total_bytes += stats.size
+            except Exception:
+                failed.append(stats.bucket_key)
+                continue
+            finally:
+                if source is not None:
+                    source.close()
+            if manifest is not None:
+                manifest.record_upload(path, s3_uri, source.hexdigest())
+        upload.update(bytes=total_bytes, files=len(uploads) - len(failed), skipped=skipped, failed=len(failed))
+
+        self.log.info(f"Uploaded {len(uploads) - len(failed)}/{len(uploads)} files, {total_bytes / MB:.1f} MB "
+                      f"in {elapsed:.1f}s ({total_bytes / MB / max(elapsed, 1e-6):.1f} MB/s)")
+        if manifest is not None:
+            self.log.info(manifest.stats())
+            manifest.close()
+        if failed:
+            raise AirflowException(f"Failed to upload {len(failed)} files: {', '.join(failed)}")
@@ -1,5 +1,5 @@
-class SqlQueries:
-    dim_author_insert = ("""
+# Shared by dim_author_insert and dim_author_insert_unique, which only differ in the DISTINCT.
+_DIM_AUTHOR_INSERT = ("""
 INSERT INTO {table:} (
     "author_id",
     "name",
@@ -9,7 +9,7 @@ INSERT INTO {table:} (
     "karma",
     "deleted"
 )
-SELECT DISTINCT
+SELECT{distinct:}
     LOWER(sa."author"),
     sa."author",
     TIMESTAMP 'epoch' + sa."created" * INTERVAL '1 second',
@@ -26,6 +26,121 @@ WHERE sa."author_valid" = '1';
 """)
 
 
+# Shared by the full and the per partition loads of fact_submission, which differ in the target, the DISTINCT,
+# the source and its filter.
+_FACT_SUBMISSION_INSERT = ("""
+INSERT INTO {table:} (
+    "submission_id",
+    "author_id",
+    "subreddit_id",
+    "archived",
+    "can_gild",
+    "can_mod_post",
+    "category",
+    "contest_mode",
+    "created",
+    "discussion_type",
+    "domain",
+    "edited",
+    "event_end",
+    "event_is_live",
+    "event_start",
+    "gilded",
+    "hidden",
+    "is_crosspostable",
+    "is_meta",
+    "is_original_content",
+    "is_reddit_media_domain",
+    "is_robot_indexable",
+    "is_self",
+    "is_video",
+    "locked",
+    "no_follow",
+    "num_comments",
+    "num_crossposts",
+    "over_18",
+    "permalink",
+    "pinned",
+    "post_hint",
+    "quarantine",
+    "removal_reason",
+    "score",
+    "selftext",
+    "spoiler",
+    "stickied",
+    "suggested_sort",
+    "thumbnail",
+    "thumbnail_height",
+    "thumbnail_width",
+    "title",
+    "total_awards_received",
+    "url",
+    "whitelist_status"
+)
+SELECT{distinct:}
+    ss."id",
+    LOWER(ss."author"),
+    LOWER(ss."subreddit"),
+    ss."archived",
+    ss."can_gild",
+    ss."can_mod_post",
+    ss."category",
+    ss."contest_mode",
+    TIMESTAMP 'epoch' + ss."created_utc" * INTERVAL '1 second',
+    ss."discussion_type",
+    ss."domain",
+    CASE WHEN ss."edited" IS NOT NULL THEN true ELSE false END,
+    CASE WHEN ss."event_end" IS NOT NULL THEN 
+        TIMESTAMP 'epoch' + ss."event_end" * INTERVAL '1 second'
+        ELSE NULL END,
+    CASE WHEN ss."event_is_live" IS NULL THEN false ELSE ss."event_is_live" END,
+    CASE WHEN ss."event_start" IS NOT NULL THEN 
+        TIMESTAMP 'epoch' + ss."event_start" * INTERVAL '1 second'
+        ELSE NULL END,
+    ss."gilded",
+    ss."hidden",
+    ss."is_crosspostable",
+    ss."is_meta",
+    ss."is_original_content",
+    ss."is_reddit_media_domain",
+    ss."is_robot_indexable",
+    ss."is_self",
+    ss."is_video",
+    ss."locked",
+    ss."no_follow",
+    ss."num_comments",
+    ss."num_crossposts",
+    ss."over_18",
+    ss."permalink",
+    ss."pinned",
+    ss."post_hint",
+    ss."quarantine",
+    ss."removal_reason",
+    ss."score",
+    ss."selftext",
+    ss."spoiler",
+    ss."stickied",
+    CASE WHEN ss."suggested_sort" IS NULL THEN 'default' else ss."suggested_sort" END,
+    ss."thumbnail",
+    ss."thumbnail_height",
+    ss."thumbnail_width",
+    ss."title",
+    ss."total_awards_received",
+    ss."url",
+    CASE WHEN ss."whitelist_status" IS NULL THEN 'default' else ss."whitelist_status" END
+FROM {source:} ss{where:};""")
+
+
+class SqlQueries:
+    dim_author_insert = _DIM_AUTHOR_INSERT.format(table='{table:}', distinct=' DISTINCT')
+
+    # For staging_authors written by preprocess_authors.py --dedup, which holds one row per LOWER(author)
+    # already, sorted by it.
+    dim_author_insert_unique = _DIM_AUTHOR_INSERT.format(table='{table:}', distinct='')
+
+
+    # staging_subreddits holds one row per LOWER(display_name) already (see scripts/preprocess_subreddits.py),
+    # so no DISTINCT over the wide rows is needed.
     dim_subreddit_insert = ("""
 INSERT INTO {table:} (
     "subreddit_id",
@@ -78,7 +193,7 @@ INSERT INTO {table:} (
     "wiki_enabled",
     "wls"
 )
-SELECT DISTINCT
+SELECT
     LOWER(sr."display_name"),
     sr."accounts_active",
     sr."accounts_active_is_fuzzed",
@@ -131,107 +246,65 @@ SELECT DISTINCT
 FROM staging_subreddits sr;""")
 
 
-    fact_submission_insert = ("""
-INSERT INTO fact_submission (
-    "submission_id",
-    "author_id",
-    "subreddit_id",
-    "archived",
-    "can_gild",
-    "can_mod_post",
-    "category",
-    "contest_mode",
-    "created",
-    "discussion_type",
-    "domain",
-    "edited",
-    "event_end",
-    "event_is_live",
-    "event_start",
-    "gilded",
-    "hidden",
-    "is_crosspostable",
-    "is_meta",
-    "is_original_content",
-    "is_reddit_media_domain",
-    "is_robot_indexable",
-    "is_self",
-    "is_video",
-    "locked",
-    "no_follow",
-    "num_comments",
-    "num_crossposts",
-    "over_18",
-    "permalink",
-    "pinned",
-    "post_hint",
-    "quarantine",
-    "removal_reason",
-    "score",
-    "selftext",
-    "spoiler",
-    "stickied",
-    "suggested_sort",
-    "thumbnail",
-    "thumbnail_height",
-    "thumbnail_width",
-    "title",
-    "total_awards_received",
-    "url",
-    "whitelist_status"
-)
-SELECT DISTINCT
-    ss."id",
-    LOWER(ss."author"),
-    LOWER(ss."subreddit"),
-    ss."archived",
-    ss."can_gild",
-    ss."can_mod_post",
-    ss."category",
-    ss."contest_mode",
-    TIMESTAMP 'epoch' + ss."created_utc" * INTERVAL '1 second',
-    ss."discussion_type",
-    ss."domain",
-    CASE WHEN ss."edited" IS NOT NULL THEN true ELSE false END,
-    CASE WHEN ss."event_end" IS NOT NULL THEN 
-        TIMESTAMP 'epoch' + ss."event_end" * INTERVAL '1 second'
-        ELSE NULL END,
-    CASE WHEN ss."event_is_live" IS NULL THEN false ELSE ss."event_is_live" END,
-    CASE WHEN ss."event_start" IS NOT NULL THEN 
-        TIMESTAMP 'epoch' + ss."event_start" * INTERVAL '1 second'
-        ELSE NULL END,
-    ss."gilded",
-    ss."hidden",
-    ss."is_crosspostable",
-    ss."is_meta",
-    ss."is_original_content",
-    ss."is_reddit_media_domain",
-    ss."is_robot_indexable",
-    ss."is_self",
-    ss."is_video",
-    ss."locked",
-    ss."no_follow",
-    ss."num_comments",
-    ss."num_crossposts",
-    ss."over_18",
-    ss."permalink",
-    ss."pinned",
-    ss."post_hint",
-    ss."quarantine",
-    ss."removal_reason",
-    ss."score",
-    ss."selftext",
-    ss."spoiler",
-    ss."stickied",
-    CASE WHEN ss."suggested_sort" IS NULL THEN 'default' else ss."suggested_sort" END,
-    ss."thumbnail",
-    ss."thumbnail_height",
-    ss."thumbnail_width",
-    ss."title",
-    ss."total_awards_received",
-    ss."url",
-    CASE WHEN ss."whitelist_status" IS NULL THEN 'default' else ss."whitelist_status" END
-FROM staging_submissions ss;""")
+    fact_submission_insert = _FACT_SUBMISSION_INSERT.format(
+        table='fact_submission', distinct=' DISTINCT', source='staging_submissions', where='')
+
+    # Staging table of the Parquet files written by scripts/transform_submissions.py. COPY ... FORMAT AS PARQUET
+    # maps columns by position, so the columns follow transform_submissions.SCHEMA and change together with it.
+    staging_submissions_parquet_create = ("""
+CREATE TABLE IF NOT EXISTS {table:} (
+    "id" VARCHAR(256),
+    "author" VARCHAR(256),
+    "subreddit" VARCHAR(256),
+    "archived" BOOLEAN,
+    "can_gild" BOOLEAN,
+    "can_mod_post" BOOLEAN,
+    "category" VARCHAR(256),
+    "contest_mode" BOOLEAN,
+    "created_utc" BIGINT,
+    "discussion_type" VARCHAR(256),
+    "domain" VARCHAR(256),
+    "edited" BIGINT,
+    "event_end" BIGINT,
+    "event_is_live" BOOLEAN,
+    "event_start" BIGINT,
+    "gilded" BIGINT,
+    "hidden" BOOLEAN,
+    "is_crosspostable" BOOLEAN,
+    "is_meta" BOOLEAN,
+    "is_original_content" BOOLEAN,
+    "is_reddit_media_domain" BOOLEAN,
+    "is_robot_indexable" BOOLEAN,
+    "is_self" BOOLEAN,
+    "is_video" BOOLEAN,
+    "locked" BOOLEAN,
+    "no_follow" BOOLEAN,
+    "num_comments" BIGINT,
+    "num_crossposts" BIGINT,
+    "over_18" BOOLEAN,
+    "permalink" VARCHAR(MAX),
+    "pinned" BOOLEAN,
+    "post_hint" VARCHAR(256),
+    "quarantine" BOOLEAN,
+    "removal_reason" VARCHAR(MAX),
+    "score" BIGINT,
+    "selftext" VARCHAR(MAX),
+    "spoiler" BOOLEAN,
+    "stickied" BOOLEAN,
+    "suggested_sort" VARCHAR(256),
+    "thumbnail" VARCHAR(MAX),
+    "thumbnail_height" BIGINT,
+    "thumbnail_width" BIGINT,
+    "title" VARCHAR(MAX),
+    "total_awards_received" BIGINT,
+    "url" VARCHAR(MAX),
+    "whitelist_status" VARCHAR(256)
+);
+""")
+
+    fact_submission_partition_insert = _FACT_SUBMISSION_INSERT.format(
+        table='{table:}', distinct='', source='{staging_table:}',
+        where='\nWHERE ss."created_utc" >= {start_epoch:}\n    AND ss."created_utc" < {end_epoch:}')
 
     staging_times_insert = ("""
 INSERT INTO {table:} ( "start_time")
@@ -270,4 +343,97 @@ SELECT DISTINCT
     CAST(DATE_PART('month', "start_time") as INT),
     CAST(DATE_PART('year',  "start_time") as INT),
     CAST(DATE_PART('dow',   "start_time") as INT)
-FROM staging_times;""")
\ No newline at end of file
+FROM staging_times;""")
+
+
+    # Single pass alternative to staging_times_insert + dim_time_insert: one UNION dedups all source
+    # timestamps and only the ones missing from the dimension are inserted. fact_submission is read once, its
+    # three timestamps are unpivoted by a CROSS JOIN against a three row selector.
+    dim_time_insert_union = ("""
+INSERT INTO {table:} (
+    "start_time",
+    "hour",
+    "day",
+    "week",
+    "month",
+    "year",
+    "weekday"
+)
+SELECT
+    t."start_time",
+    CAST(DATE_PART('hour',  t."start_time") as INT),
+    CAST(DATE_PART('day',   t."start_time") as INT),
+    CAST(DATE_PART('week',  t."start_time") as INT),
+    CAST(DATE_PART('month', t."start_time") as INT),
+    CAST(DATE_PART('year',  t."start_time") as INT),
+    CAST(DATE_PART('dow',   t."start_time") as INT)
+FROM (
+    SELECT created AS "start_time" FROM dim_author
+    UNION
+    SELECT created FROM dim_subreddit
+    UNION
+    SELECT CASE c."n" WHEN 0 THEN fs.created WHEN 1 THEN fs.event_start ELSE fs.event_end END
+    FROM fact_submission fs
+    CROSS JOIN (SELECT 0 AS "n" UNION ALL SELECT 1 UNION ALL SELECT 2) c
+) t
+LEFT JOIN {table:} d ON d."start_time" = t."start_time"
+WHERE t."start_time" IS NOT NULL
+    AND d."start_time" IS NULL;""")
+
+
+    # Hour grain calendar: generates every hour between the earliest and the latest source timestamp and
+    # inserts the ones missing from the dimension, so hours before the ones loaded so far (backfills, old
+    # author accounts) are added too. Repeat runs only add the new hours.
+    # start_time holds whole hours while the facts keep second precision: joins have to truncate the fact side,
+    # ON t."start_time" = DATE_TRUNC('hour', f."created"); an equality join on f."created" matches almost nothing.
+    dim_time_insert_grid = ("""
+INSERT INTO {table:} (
+    "start_time",
+    "hour",
+    "day",
+    "week",
+    "month",
+    "year",
+    "weekday"
+)
+WITH digits AS (
+    SELECT 0 AS d UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4
+    UNION ALL SELECT 5 UNION ALL SELECT 6 UNION ALL SELECT 7 UNION ALL SELECT 8 UNION ALL SELECT 9
+),
+hours AS (
+    SELECT d1.d + 10 * d2.d + 100 * d3.d + 1000 * d4.d + 10000 * d5.d + 100000 * d6.d AS n
+    FROM digits d1, digits d2, digits d3, digits d4, digits d5, digits d6
+),
+source_bounds AS (
+    SELECT MIN(lo) AS lo, MAX(hi) AS hi FROM (
+        SELECT MIN(created) AS lo, MAX(created) AS hi FROM dim_author
+        UNION ALL
+        SELECT MIN(created), MAX(created) FROM dim_subreddit
+        UNION ALL
+        SELECT MIN(created), MAX(created) FROM fact_submission
+        UNION ALL
+        SELECT MIN(event_start), MAX(event_start) FROM fact_submission
+        UNION ALL
+        SELECT MIN(event_end), MAX(event_end) FROM fact_submission
+    ) b
+),
+bounds AS (
+    SELECT DATE_TRUNC('hour', sb.lo) AS lo, DATE_TRUNC('hour', sb.hi) AS hi
+    FROM source_bounds sb
+),
+grid AS (
+    SELECT b.lo + h.n * INTERVAL '1 hour' AS "start_time"
+    FROM hours h, bounds b
+    WHERE b.lo + h.n * INTERVAL '1 hour' <= b.hi
+)
+SELECT
+    g."start_time",
+    CAST(DATE_PART('hour',  g."start_time") as INT),
+    CAST(DATE_PART('day',   g."start_time") as INT),
+    CAST(DATE_PART('week',  g."start_time") as INT),
+    CAST(DATE_PART('month', g."start_time") as INT),
+    CAST(DATE_PART('year',  g."start_time") as INT),
+    CAST(DATE_PART('dow',   g."start_time") as INT)
+FROM grid g
+LEFT JOIN {table:} d ON d."start_time" = g."start_time"
+WHERE d."start_time" IS NULL;""")
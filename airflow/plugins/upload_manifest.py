@@ -0,0 +1,155 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def file_digest(path):
+    """
+    Streaming SHA-256 of a file.
+    :param path: Path of the file
+    :return: Hex digest
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class HashingReader:
+    """
+    Binary file reader that computes the SHA-256 of everything read through it. It reports itself as not
+    seekable, so boto3 reads it once from start to end while uploading it and the digest costs no second pass
+    over the file (parts are buffered in memory, up to `TransferConfig.max_in_memory_upload_chunks`).
+    :param path: Path of the file
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._sha = hashlib.sha256()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self._sha.update(data)
+        return data
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        self._file.close()
+
+    def hexdigest(self):
+        """
+        :return: Hex digest of the bytes read so far, of the whole file once it has been read to the end
+        """
+        return self._sha.hexdigest()
+
+
+class UploadManifest:
+    """
+    Local SQLite record of which file content has been uploaded to which S3 location.
+    A file is re-hashed only when its size or mtime changed since it was recorded, so checking an
+    unchanged directory costs one stat per file.
+    :param path: Path of the SQLite database, created if missing
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                path TEXT NOT NULL,
+                s3_uri TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                uploaded_at REAL NOT NULL,
+                PRIMARY KEY (path, s3_uri)
+            )""")
+        self._conn.commit()
+        self.files_skipped = self.files_sent = 0
+        self.bytes_skipped = self.bytes_sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def _lookup(self, path, s3_uri):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT size, mtime_ns, sha256 FROM uploads WHERE path = ? AND s3_uri = ?",
+                (path, s3_uri)).fetchone()
+
+    def _store(self, path, s3_uri, stat, sha256):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads (path, s3_uri, size, mtime_ns, sha256, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (path, s3_uri, stat.st_size, stat.st_mtime_ns, sha256, time.time()))
+            self._conn.commit()
+
+    def needs_upload(self, path, s3_uri):
+        """
+        Check whether the current content of a file still has to be uploaded to a location.
+        Counts the file as skipped when it does not.
+        :param path: Local file path
+        :param s3_uri: Destination, e.g. 's3://bucket/key'
+        :return: True if the file is new or changed since its last recorded upload to `s3_uri`
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self._lookup(path, s3_uri)
+        if row is None:
+            return True
+
+        size, mtime_ns, sha256 = row
+        if (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            # Touched or rewritten: only the content decides.
+            if size != stat.st_size or file_digest(path) != sha256:
+                return True
+            self._store(path, s3_uri, stat, sha256)
+
+        with self._lock:
+            self.files_skipped += 1
+            self.bytes_skipped += stat.st_size
+        return False
+
+    def record_upload(self, path, s3_uri, sha256):
+        """
+        Remember that the current content of a file has been uploaded to a location.
+        :param path: Local file path
+        :param s3_uri: Destination, e.g. 's3://bucket/key'
+        :param sha256: Hex digest of the uploaded content, e.g. of the `HashingReader` it was uploaded from
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        self._store(path, s3_uri, stat, sha256)
+        with self._lock:
+            self.files_sent += 1
+            self.bytes_sent += stat.st_size
+
+    def stats(self):
+        """
+        :return: One line summary of skipped vs. sent files and bytes
+        """
+        return (f"Skipped {self.files_skipped} unchanged files ({self.bytes_skipped / 1024 ** 2:.1f} MB), "
+                f"sent {self.files_sent} files ({self.bytes_sent / 1024 ** 2:.1f} MB)")
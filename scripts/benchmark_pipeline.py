@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the pipeline on synthetic data (see generate_synthetic_data.py).
+
+    ./benchmark_pipeline.py --authors 1000000 --submissions 200000 \\
+        --postgres-dsn "host=localhost dbname=reddit user=postgres" --s3-endpoint-url http://localhost:9000
+
+Stages, each run in a forked child so its peak RSS can be read on its own:
+
+    generate    synthetic raw datasets
+    preprocess  preprocess_authors.py, preprocess_subreddits.py and transform_submissions.py
+    compress    the processed authors and subreddits, like they are uploaded
+    upload      to S3: MinIO or a moto server with --s3-endpoint-url, moto in-process otherwise
+    stage       COPY into staging tables of a local Postgres (--postgres-dsn)
+    load        the SqlQueries dimension/fact inserts on Postgres
+    quality     the DataQualityQueries checks, one query per table
+
+Stages whose service is not available, and all stages after a failed one, are reported as
+skipped. Seconds, rows/sec, MB/sec and peak RSS of every stage go to a JSON file named after the
+current commit, so runs of different commits can be compared.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import generate_synthetic_data
+import preprocess_authors
+import preprocess_subreddits
+import transform_submissions
+from compressed_io import open_input, open_output
+from local_warehouse import AUTHOR_COLUMNS, SUBREDDIT_COLUMNS, create_table_sql
+
+sys.path.append(str(Path(__file__).parents[1] / 'airflow' / 'plugins'))
+from data_quality_queries import DataQualityQueries  # noqa: E402
+from sql_queries import SqlQueries  # noqa: E402
+
+COPY_BATCH_SIZE = 64 * 1024
+CODEC_EXTENSIONS = {'zst': '.zst', 'gz': '.gz', 'xz': '.xz'}
+_ARROW_SQL_TYPES = {'string': 'VARCHAR', 'int64': 'BIGINT', 'bool': 'BOOLEAN', 'double': 'DOUBLE PRECISION'}
+
+# Statement, target table, in DAG order.
+LOAD_STATEMENTS = [
+    ('dim_author_insert', 'dim_author'),
+    ('dim_subreddit_insert', 'dim_subreddit'),
+    ('fact_submission_insert', 'fact_submission'),
+    ('dim_time_insert_union', 'dim_time'),
+]
+TABLE_STATEMENTS = {table: statement for statement, table in LOAD_STATEMENTS}
+TABLE_STATEMENTS['dim_time'] = 'dim_time_insert'
+
+QUALITY_CHECKS = [
+    {'table': 'dim_author', 'check': 'table_not_empty'},
+    {'table': 'dim_author', 'check': 'col_does_not_contain_null', 'col': 'author_id'},
+    {'table': 'dim_author', 'check': 'col_is_unique', 'col': 'author_id'},
+    {'table': 'dim_subreddit', 'check': 'table_not_empty'},
+    {'table': 'dim_subreddit', 'check': 'col_is_unique', 'col': 'subreddit_id'},
+    {'table': 'fact_submission', 'check': 'table_not_empty'},
+    {'table': 'fact_submission', 'check': 'col_does_not_contain_null', 'col': 'author_id'},
+    {'table': 'fact_submission', 'check': 'col_is_unique', 'col': 'submission_id'},
+    {'table': 'dim_time', 'check': 'table_not_empty'},
+]
+
+
+def measure(func, *args, **kwargs):
+    """
+    Run a stage in a forked child process.
+    :param func: Stage function returning a JSON serializable dict
+    :return: The dict, plus 'seconds' and 'peak_rss_mb' of the child (or 'error' if it raised)
+    """
+    read_fd, write_fd = os.pipe()
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {e}"}
+        with os.fdopen(write_fd, 'w') as f:
+            json.dump(result, f)
+        os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        output = f.read()
+    _, status, usage = os.wait4(pid, 0)
+    result = json.loads(output) if output else {'error': f"exit status {os.waitstatus_to_exitcode(status)}"}
+    result['seconds'] = time.perf_counter() - start
+    # ru_maxrss is reported in KB on Linux.
+    result['peak_rss_mb'] = usage.ru_maxrss / 1024
+    return result
+
+
+def _count_lines(path):
+    with open_input(path) as f:
+        return sum(block.count(b'\n') for block in iter(lambda: f.read(1024 * 1024), b''))
+
+
+def _size(paths):
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def stage_generate(work_dir, authors, subreddits, submissions, start, days, seed):
+    paths = generate_synthetic_data.generate(work_dir, authors, subreddits, submissions, start, days=days,
+                                             plain=True, seed=seed)
+    files = [paths['authors'], paths['subreddits']] + list(paths['submissions'].values())
+    return {'rows': authors + _count_lines(paths['subreddits']) + submissions * days, 'bytes': _size(files)}
+
+
+def stage_preprocess(layout, workers):
+    with open_input(layout['raw_authors']) as instream, open(layout['authors'], 'wb') as outstream, \
+            open(os.devnull, 'wb') as rejects:
+        preprocess_authors.run(instream, outstream, rejects, workers=workers)
+    rows = _count_lines(layout['authors'])
+    _, written, _ = preprocess_subreddits.preprocess(layout['raw_subreddits'], layout['subreddits'])
+    rows += written
+    for raw, parquet in zip(layout['raw_submissions'], layout['submissions']):
+        written, _ = transform_submissions.transform(raw, parquet)
+        rows += written
+    return {'rows': rows,
+            'bytes': _size([layout['raw_authors'], layout['raw_subreddits']] + layout['raw_submissions'])}
+
+
+def stage_compress(layout):
+    rows = 0
+    for source, target in [(layout['authors'], layout['authors_compressed']),
+                           (layout['subreddits'], layout['subreddits_compressed'])]:
+        with open(source, 'rb') as instream, open_output(target) as outstream:
+            shutil.copyfileobj(instream, outstream, 4 * 1024 * 1024)
+        rows += _count_lines(source)
+    sources = [layout['authors'], layout['subreddits']]
+    targets = [layout['authors_compressed'], layout['subreddits_compressed']]
+    return {'rows': rows, 'bytes': _size(sources), 'compressed_bytes': _size(targets),
+            'ratio': round(_size(sources) / max(1, _size(targets)), 2)}
+
+
+def _upload(files, bucket, endpoint_url):
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+
+    s3 = boto3.client('s3', endpoint_url=endpoint_url, region_name='us-east-1')
+    try:
+        s3.head_bucket(Bucket=bucket)
+    except Exception:
+        s3.create_bucket(Bucket=bucket)
+    config = TransferConfig(multipart_threshold=64 * 1024 * 1024, multipart_chunksize=64 * 1024 * 1024,
+                            max_concurrency=10)
+    for path in files:
+        s3.upload_file(path, bucket, os.path.basename(path), Config=config)
+
+
+def stage_upload(layout, rows, bucket, endpoint_url=None):
+    files = [layout['authors_compressed'], layout['subreddits_compressed']] + layout['submissions']
+    if endpoint_url is None:
+        from moto import mock_aws
+        # moto needs some credentials, whatever they are.
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+        with mock_aws():
+            _upload(files, bucket, None)
+    else:
+        _upload(files, bucket, endpoint_url)
+    return {'rows': rows, 'bytes': _size(files), 'files': len(files)}
+
+
+def _connect(dsn, schema):
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        cur.execute(f"SET search_path TO {schema}")
+    return conn
+
+
+def _create_table(cur, table, columns):
+    cur.execute(f"DROP TABLE IF EXISTS {table}")
+    cur.execute(f"CREATE TABLE {table} ("
+                + ", ".join(f'"{name}" {type_.replace("DOUBLE", "DOUBLE PRECISION")}'
+                            for name, type_ in columns.items()) + ")")
+
+
+def _copy_batches(cur, table, batches):
+    import pyarrow as pa
+    import pyarrow.csv
+
+    for batch in batches:
+        buf = io.BytesIO()
+        pyarrow.csv.write_csv(pa.Table.from_batches([batch]), buf)
+        buf.seek(0)
+        cur.copy_expert(f"COPY {table} FROM STDIN WITH (FORMAT csv, HEADER true)", buf)
+
+
+def stage_postgres_staging(layout, dsn, schema):
+    import pyarrow as pa
+    import pyarrow.json
+    import pyarrow.parquet as pq
+
+    subreddit_schema = pa.schema([(name, {'VARCHAR': pa.string(), 'BIGINT': pa.int64(), 'BOOLEAN': pa.bool_(),
+                                          'DOUBLE': pa.float64()}[type_])
+                                  for name, type_ in SUBREDDIT_COLUMNS.items()])
+    submission_columns = {field.name: _ARROW_SQL_TYPES[str(field.type)] for field in transform_submissions.SCHEMA}
+
+    conn = _connect(dsn, schema)
+    with conn, conn.cursor() as cur:
+        _create_table(cur, 'staging_authors', AUTHOR_COLUMNS)
+        with open(layout['authors'], 'rb') as f:
+            # No quoting at all, like the Redshift COPY of the '|' delimited file.
+            cur.copy_expert("COPY staging_authors FROM STDIN WITH (FORMAT csv, DELIMITER '|', QUOTE E'\\x01', "
+                            "NULL '')", f)
+
+        _create_table(cur, 'staging_subreddits', SUBREDDIT_COLUMNS)
+        subreddits = pyarrow.json.read_json(layout['subreddits'], parse_options=pyarrow.json.ParseOptions(
+            explicit_schema=subreddit_schema, unexpected_field_behavior='ignore'))
+        _copy_batches(cur, 'staging_subreddits', subreddits.to_batches(COPY_BATCH_SIZE))
+
+        _create_table(cur, 'staging_submissions', submission_columns)
+        for path in layout['submissions']:
+            _copy_batches(cur, 'staging_submissions', pq.ParquetFile(path).iter_batches(COPY_BATCH_SIZE))
+
+        # Read by dim_time_insert, which defines the dim_time columns.
+        _create_table(cur, 'staging_times', {'start_time': 'TIMESTAMP'})
+
+        rows = 0
+        for table in ('staging_authors', 'staging_subreddits', 'staging_submissions'):
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            rows += cur.fetchone()[0]
+    conn.close()
+    return {'rows': rows, 'bytes': _size([layout['authors'], layout['subreddits']] + layout['submissions'])}
+
+
+def stage_postgres_load(dsn, schema):
+    conn = _connect(dsn, schema)
+    statements = {}
+    rows = 0
+    with conn, conn.cursor() as cur:
+        for table, statement in TABLE_STATEMENTS.items():
+            cur.execute(f"DROP TABLE IF EXISTS {table}")
+            cur.execute(create_table_sql(table, statement))
+        for statement, table in LOAD_STATEMENTS:
+            start = time.perf_counter()
+            cur.execute(getattr(SqlQueries, statement).format(table=table))
+            statements[statement] = {'rows': cur.rowcount, 'seconds': time.perf_counter() - start}
+            rows += cur.rowcount
+    conn.close()
+    return {'rows': rows, 'statements': statements}
+
+
+def stage_quality(dsn, schema, checks=QUALITY_CHECKS):
+    conn = _connect(dsn, schema)
+    by_table = {}
+    for check in checks:
+        by_table.setdefault(check['table'], []).append(check)
+
+    failed = []
+    rows = 0
+    with conn, conn.cursor() as cur:
+        for table, table_checks in by_table.items():
+            aggregates = ['COUNT(*)']
+            tests = []
+            for check in table_checks:
+                aggregate, test = DataQualityQueries.aggregate_check(check['check'])
+                aggregates.append(aggregate(**{k: v for k, v in check.items() if k not in ('table', 'check')}))
+                tests.append(test)
+            cur.execute(DataQualityQueries.combined_checks(table, aggregates))
+            count, *values = cur.fetchone()
+            rows += count
+            failed += [f"{check['check']}({table}, {check.get('col', '')}) = {value}"
+                       for check, test, value in zip(table_checks, tests, values) if not test({'result': [value]})]
+    conn.close()
+    return {'rows': rows, 'checks': len(checks), 'failed': failed}
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _module_available(name):
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic data.")
+    parser.add_argument('--authors', type=int, default=100_000, help="Author rows (default: %(default)s)")
+    parser.add_argument('--subreddits', type=int, default=10_000, help="Subreddits (default: %(default)s)")
+    parser.add_argument('--submissions', type=int, default=100_000, help="Submissions per day (default: %(default)s)")
+    parser.add_argument('--days', type=int, default=1, help="Submission days (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="preprocess_authors.py workers (default: %(default)s)")
+    parser.add_argument('--codec', choices=sorted(CODEC_EXTENSIONS), default='zst',
+                        help="Compression of the uploaded text files (default: %(default)s)")
+    parser.add_argument('--s3-endpoint-url',
+                        help="S3 compatible endpoint (MinIO, moto server), moto runs in-process if omitted")
+    parser.add_argument('--bucket', default='reddit-benchmark', help="Bucket to upload to (default: %(default)s)")
+    parser.add_argument('--postgres-dsn', help="libpq connection string of a local Postgres for stage/load/quality")
+    parser.add_argument('--schema', default='reddit_benchmark', help="Postgres schema to use (default: %(default)s)")
+    parser.add_argument('--work-dir', help="Keep the generated files here instead of a temporary directory")
+    parser.add_argument('--json', help="Result file (default: benchmark-<commit>.json)")
+    args = parser.parse_args()
+
+    commit = _commit()
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='reddit-benchmark-')
+    start_day = date(2018, 1, 1)
+    raw = generate_synthetic_data.dataset_paths(work_dir, args.authors, start_day, args.days, plain=True)
+    ext = CODEC_EXTENSIONS[args.codec]
+    layout = {
+        'raw_authors': raw['authors'],
+        'raw_subreddits': raw['subreddits'],
+        'raw_submissions': list(raw['submissions'].values()),
+        'authors': os.path.join(work_dir, 'authors_processed.csv'),
+        'subreddits': os.path.join(work_dir, 'reddit_subreddits_processed.ndjson'),
+        'submissions': [os.path.join(work_dir, f"RS_{day}.parquet") for day in raw['submissions']],
+        'authors_compressed': os.path.join(work_dir, 'authors_processed.csv' + ext),
+        'subreddits_compressed': os.path.join(work_dir, 'reddit_subreddits_processed.ndjson' + ext),
+    }
+
+    results = []
+
+    def run_stage(name, available, func, *stage_args):
+        if not available or any('error' in r for r in results):
+            results.append({'stage': name, 'skipped': True})
+            print(f"{name:<12}{'skipped':>10}")
+            return {}
+        result = dict(stage=name, **measure(func, *stage_args))
+        result['rows_per_sec'] = result.get('rows', 0) / result['seconds']
+        result['mb_per_sec'] = result.get('bytes', 0) / 1024 ** 2 / result['seconds']
+        results.append(result)
+        if 'error' in result:
+            print(f"{name:<12}{'failed':>10}  {result['error']}")
+        else:
+            print(f"{name:<12}{result['seconds']:>10.2f}{result.get('rows', 0):>12,}{result['rows_per_sec']:>14,.0f}"
+                  f"{result['mb_per_sec']:>10.1f}{result['peak_rss_mb']:>14.1f}")
+        return result
+
+    s3_available = args.s3_endpoint_url is not None or _module_available('moto')
+    postgres_available = args.postgres_dsn is not None
+    print(f"{'stage':<12}{'seconds':>10}{'rows':>12}{'rows/sec':>14}{'MB/sec':>10}{'peak RSS MB':>14}")
+    try:
+        generated = run_stage('generate', True, stage_generate, work_dir, args.authors, args.subreddits,
+                              args.submissions, start_day, args.days, args.seed)
+        run_stage('preprocess', True, stage_preprocess, layout, args.workers)
+        run_stage('compress', True, stage_compress, layout)
+        run_stage('upload', s3_available, stage_upload, layout, generated.get('rows', 0), args.bucket,
+                  args.s3_endpoint_url)
+        run_stage('stage', postgres_available, stage_postgres_staging, layout, args.postgres_dsn, args.schema)
+        run_stage('load', postgres_available, stage_postgres_load, args.postgres_dsn, args.schema)
+        run_stage('quality', postgres_available, stage_quality, args.postgres_dsn, args.schema)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'parameters': {'authors': args.authors, 'subreddits': args.subreddits, 'submissions': args.submissions,
+                       'days': args.days, 'seed': args.seed, 'workers': args.workers, 'codec': args.codec},
+        'stages': results,
+    }
+    output = args.json or f"benchmark-{commit or 'unknown'}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+    if any('error' in result for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Compare rows/sec and peak RSS of the preprocess_authors.py engines on a generated fixture.
+
+    ./benchmark_preprocess_authors.py --rows 5000000
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT = Path(__file__).parent / 'preprocess_authors.py'
+
+CONFIGURATIONS = {
+    'python-regex': ['--engine', 'python', '--parser', 'regex'],
+    'python-fast': ['--engine', 'python', '--parser', 'fast'],
+    'arrow-csv': ['--engine', 'arrow', '--format', 'csv'],
+    'arrow-parquet': ['--engine', 'arrow', '--format', 'parquet'],
+}
+
+
+def write_author_fixture(path, rows, seed=0):
+    """
+    Write a raw author file shaped like assets/sample-author.txt.
+    :param path: Destination path
+    :param rows: Number of rows
+    :param seed: Random seed
+    """
+    rnd = random.Random(seed)
+    with open(path, 'w') as f:
+        for userid in range(rows):
+            name = f"user_{rnd.getrandbits(32):x}"[:rnd.randint(3, 24)]
+            created = 1137474000 + rnd.randint(0, 400_000_000)
+            updated = 1540040752 + rnd.randint(0, 20_000)
+            karma_posts = rnd.choice(['0', '1', str(rnd.randint(-50, 50_000)), 'None'])
+            karma_comments = rnd.choice(['0', '2', str(rnd.randint(-50, 50_000)), 'None'])
+            f.write(f"{userid} {name} {created} {updated} {karma_posts} {karma_comments}\n")
+
+
+def run_engine(args, fixture, output):
+    """
+    Run preprocess_authors.py in a child process.
+    :return: Tuple of (wall seconds, peak RSS in MB)
+    """
+    cmd = [sys.executable, str(SCRIPT), '--input', fixture, '--output', output] + args
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"{' '.join(cmd)} failed")
+    # ru_maxrss is reported in KB on Linux.
+    return elapsed, usage.ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the preprocess_authors.py engines.")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Fixture rows (default: %(default)s)")
+    parser.add_argument('--fixture', help="Use an existing raw author file instead of generating one")
+    parser.add_argument('--engines', nargs='+', choices=sorted(CONFIGURATIONS), default=sorted(CONFIGURATIONS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture = args.fixture
+        rows = args.rows
+        if fixture is None:
+            fixture = os.path.join(tmp, 'authors.txt')
+            write_author_fixture(fixture, rows)
+        else:
+            with open(fixture, 'rb') as f:
+                rows = sum(1 for _ in f)
+
+        print(f"{'engine':<16}{'seconds':>10}{'rows/sec':>14}{'peak RSS MB':>14}")
+        for name in args.engines:
+            suffix = '.parquet' if 'parquet' in name else '.csv'
+            elapsed, rss = run_engine(CONFIGURATIONS[name], fixture, os.path.join(tmp, name + suffix))
+            print(f"{name:<16}{elapsed:>10.2f}{rows / elapsed:>14,.0f}{rss:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark transform_submissions.py on a generated day-sized RS_*.xz fixture and compare the
+volume Redshift has to COPY for raw NDJSON and for the projected Parquet file.
+
+    ./benchmark_transform_submissions.py --rows 300000
+"""
+import argparse
+import json
+import lzma
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from transform_submissions import transform
+
+SAMPLE = Path(__file__).parents[1] / 'assets' / 'sample-submission.json'
+
+
+def write_submission_fixture(path, rows, seed=0):
+    """
+    Write an xz compressed NDJSON day of submissions derived from assets/sample-submission.json.
+    :param path: Destination path
+    :param rows: Number of rows
+    :param seed: Random seed
+    :return: Size of the uncompressed NDJSON in bytes
+    """
+    rnd = random.Random(seed)
+    template = json.loads(SAMPLE.read_text())
+    raw_size = 0
+    with lzma.open(path, 'wb', preset=1) as f:
+        for i in range(rows):
+            record = dict(template)
+            record['id'] = f"{i:x}"
+            record['author'] = f"user_{rnd.randint(0, rows):x}"
+            record['subreddit'] = f"sub_{int(rnd.paretovariate(1.2)) % 5000}"
+            record['created_utc'] = 1514764800 + i * 86400 // rows
+            record['score'] = int(rnd.paretovariate(1.5))
+            record['num_comments'] = int(rnd.paretovariate(1.5)) - 1
+            record['edited'] = rnd.random() < 0.05 and record['created_utc'] + rnd.randint(60, 3600)
+            record['title'] = ' '.join(rnd.choice(['reddit', 'new', 'year', 'uk', 'yay', 'today']) for _ in range(8))
+            record['selftext'] = 'lorem ipsum ' * rnd.randint(0, 40)
+            line = (json.dumps(record) + '\n').encode()
+            raw_size += len(line)
+            f.write(line)
+    return raw_size
+
+
+def run_codec(fixture, output, codec):
+    """
+    Transform the fixture with one codec. Meant to run in a fresh process, whose peak RSS is then that of
+    this codec alone: ru_maxrss of RUSAGE_SELF and RUSAGE_CHILDREN only ever grows.
+    :return: Tuple of (rows, seconds, peak RSS in MB)
+    """
+    start = time.perf_counter()
+    rows, _ = transform(fixture, output, compression=codec)
+    elapsed = time.perf_counter() - start
+    return rows, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the submission NDJSON -> Parquet transformation.")
+    parser.add_argument('--rows', type=int, default=300_000, help="Rows of the generated day (default: %(default)s)")
+    parser.add_argument('--compression', nargs='+', default=['zstd', 'snappy'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture = os.path.join(tmp, 'RS_2018-01-01.xz')
+        raw_size = write_submission_fixture(fixture, args.rows)
+        print(f"fixture: {args.rows} rows, {raw_size / 1024 ** 2:.1f} MB NDJSON, "
+              f"{os.path.getsize(fixture) / 1024 ** 2:.1f} MB xz")
+
+        print(f"{'codec':<10}{'seconds':>10}{'rows/sec':>12}{'parquet MB':>12}{'vs NDJSON':>11}{'peak RSS MB':>13}")
+        for codec in args.compression:
+            output = os.path.join(tmp, f'RS_2018-01-01.{codec}.parquet')
+            # spawn, not fork: a forked child starts with the memory of this process.
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                rows, elapsed, rss = pool.submit(run_codec, fixture, output, codec).result()
+            size = os.path.getsize(output)
+            print(f"{codec:<10}{elapsed:>10.2f}{rows / elapsed:>12,.0f}{size / 1024 ** 2:>12.1f}"
+                  f"{raw_size / size:>10.1f}x{rss:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Time every staging -> dimension/fact statement of `SqlQueries` on a local DuckDB mirror of the
+warehouse (see local_warehouse.py), at growing fixture sizes.
+
+    ./benchmark_warehouse.py --scales 1 10 100 --unit-rows 10000 --json warehouse.json
+
+The fixtures are the assets/ samples replicated to `scale * unit-rows` rows per dataset, with the
+keys varied (and a share of exact duplicates) so the DISTINCTs and joins have real work to do.
+Submissions go through transform_submissions.py, authors through preprocess_authors.py and
+subreddits through preprocess_subreddits.py, so the staged files look like the ones the pipeline
+uploads.
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import preprocess_authors
+import preprocess_subreddits
+import transform_submissions
+from local_warehouse import TABLE_DEFINITIONS, LocalWarehouse
+
+ASSETS = Path(__file__).parents[1] / 'assets'
+# One in DUPLICATE_EVERY rows repeats the previous one.
+DUPLICATE_EVERY = 20
+# Statement, target table; run in this order, like the DAG.
+STATEMENTS = [
+    ('dim_author_insert', 'dim_author'),
+    ('dim_subreddit_insert', 'dim_subreddit'),
+    ('fact_submission_insert', 'fact_submission'),
+    ('staging_times_insert', 'staging_times'),
+    ('dim_time_insert', 'dim_time'),
+    ('dim_time_insert_union', 'dim_time_union'),
+    ('dim_time_insert_grid', 'dim_time_grid'),
+]
+
+
+def _copies(rows):
+    # Yields the copy number of each row, repeating one every DUPLICATE_EVERY rows.
+    for i in range(rows):
+        yield i - 1 if i % DUPLICATE_EVERY == DUPLICATE_EVERY - 1 else i
+
+
+def write_fixtures(directory, rows):
+    """
+    Write processed authors, subreddits and submissions fixtures derived from the assets/ samples.
+    :param directory: Destination directory
+    :param rows: Rows per dataset
+    :return: Dict of staging table -> fixture path
+    """
+    authors = [line.split() for line in (ASSETS / 'sample-author.txt').read_text().splitlines()]
+    subreddit = json.loads((ASSETS / 'sample-subrredit.json').read_text())
+    submission = json.loads((ASSETS / 'sample-submission.json').read_text())
+    paths = {
+        'staging_authors': os.path.join(directory, 'authors.csv'),
+        'staging_subreddits': os.path.join(directory, 'subreddits.ndjson'),
+        'staging_submissions': os.path.join(directory, 'submissions.parquet'),
+    }
+
+    raw = io.StringIO()
+    for k in _copies(rows):
+        userid, name, created, updated, karma_posts, karma_comments = authors[k % len(authors)]
+        raw.write(f"{k} {name}{k // len(authors)} {int(created) + k} {updated} {karma_posts} {karma_comments}\n")
+    with open(paths['staging_authors'], 'wb') as out:
+        preprocess_authors.run(io.BytesIO(raw.getvalue().encode()), out, io.BytesIO())
+
+    raw_subreddits = os.path.join(directory, 'subreddits_raw.ndjson')
+    with open(raw_subreddits, 'w') as out:
+        for k in _copies(rows):
+            record = dict(subreddit, display_name=f"{subreddit['display_name']}{k}",
+                          created_utc=subreddit['created_utc'] + k)
+            out.write(json.dumps(record) + '\n')
+    preprocess_subreddits.preprocess(raw_subreddits, paths['staging_subreddits'])
+    os.remove(raw_subreddits)
+
+    ndjson = os.path.join(directory, 'submissions.ndjson')
+    with open(ndjson, 'w') as out:
+        for k in _copies(rows):
+            record = dict(submission, id=f"{k:x}", author=f"{authors[k % len(authors)][1]}{k // len(authors)}",
+                          subreddit=f"{subreddit['display_name']}{k % max(1, rows // 100)}",
+                          created_utc=submission['created_utc'] + k * 86400 // rows)
+            out.write(json.dumps(record) + '\n')
+    transform_submissions.transform(ndjson, paths['staging_submissions'])
+    os.remove(ndjson)
+    return paths
+
+
+def benchmark(fixtures, threads=None):
+    """
+    Stage the fixtures and run every statement once on a fresh in-memory warehouse.
+    :return: List of dicts with statement, table, rows and seconds
+    """
+    results = []
+    with LocalWarehouse(threads=threads) as wh:
+        for table, path in fixtures.items():
+            start = time.perf_counter()
+            rows = wh.stage(table, path)
+            results.append({'statement': f"stage {os.path.basename(path)}", 'table': table, 'rows': rows,
+                            'seconds': time.perf_counter() - start})
+        wh.create_tables(dict(TABLE_DEFINITIONS, dim_time_union='dim_time_insert', dim_time_grid='dim_time_insert'))
+        for statement, table in STATEMENTS:
+            seconds = wh.run(statement, table=table)
+            results.append({'statement': statement, 'table': table, 'rows': wh.count(table), 'seconds': seconds})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the warehouse SQL on a local DuckDB mirror.")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help="Fixture sizes in multiples of --unit-rows (default: %(default)s)")
+    parser.add_argument('--unit-rows', type=int, default=10_000,
+                        help="Rows per dataset at scale 1 (default: %(default)s)")
+    parser.add_argument('--threads', type=int, help="DuckDB threads (default: all cores)")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    report = []
+    print(f"{'scale':>6}  {'statement':<26}{'rows':>12}{'seconds':>10}{'rows/sec':>14}")
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            fixtures = write_fixtures(tmp, scale * args.unit_rows)
+            for result in benchmark(fixtures, threads=args.threads):
+                result['scale'] = scale
+                report.append(result)
+                rate = result['rows'] / result['seconds'] if result['seconds'] else 0
+                print(f"{scale:>6}  {result['statement']:<26}{result['rows']:>12,}{result['seconds']:>10.3f}"
+                      f"{rate:>14,.0f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
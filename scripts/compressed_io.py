@@ -0,0 +1,86 @@
+"""
+Binary streaming I/O for the dataset files, compressed or not.
+
+The codec is picked from the file extension: '.zst' (zstandard), '.xz'/'.lzma' (lzma),
+'.gz' (gzip), anything else is read or written as is. '-' stands for stdin/stdout.
+"""
+import contextlib
+import gzip
+import io
+import lzma
+import sys
+
+try:
+    import zstandard
+except ImportError:  # only needed for .zst files
+    zstandard = None
+
+# Large reads keep the number of decompressor calls and copies per row low.
+READ_SIZE = 4 * 1024 * 1024
+WRITE_SIZE = 4 * 1024 * 1024
+# The pushshift dumps are compressed with --long=31, which needs a 2 GB window.
+ZSTD_MAX_WINDOW_SIZE = 2 ** 31
+ZSTD_LEVEL = 3
+
+
+def _require_zstandard(path):
+    if zstandard is None:
+        raise RuntimeError(f"Reading or writing '{path}' requires the 'zstandard' package.")
+
+
+@contextlib.contextmanager
+def open_input(path):
+    """
+    Open a (possibly compressed) file for binary streaming reads.
+    :param path: File path, or '-' for stdin
+    :return: Context manager yielding a binary file object
+    """
+    if path in (None, '-'):
+        yield sys.stdin.buffer
+        return
+
+    if path.endswith('.zst'):
+        _require_zstandard(path)
+        decompressor = zstandard.ZstdDecompressor(max_window_size=ZSTD_MAX_WINDOW_SIZE)
+        with open(path, 'rb') as raw, decompressor.stream_reader(raw, read_size=READ_SIZE) as reader:
+            # The zstd reader has no readline(), buffering it makes the stream line-iterable like the others.
+            yield io.BufferedReader(reader, buffer_size=READ_SIZE)
+    elif path.endswith(('.xz', '.lzma')):
+        with lzma.open(path, 'rb') as reader:
+            yield reader
+    elif path.endswith('.gz'):
+        with gzip.open(path, 'rb') as reader:
+            yield reader
+    else:
+        with open(path, 'rb', buffering=READ_SIZE) as reader:
+            yield reader
+
+
+@contextlib.contextmanager
+def open_output(path, threads=-1, level=ZSTD_LEVEL):
+    """
+    Open a (possibly compressed) file for binary streaming writes.
+    :param path: File path, or '-' for stdout
+    :param threads: zstd compression threads, -1 uses every CPU
+    :param level: zstd compression level
+    :return: Context manager yielding a binary file object
+    """
+    if path in (None, '-'):
+        yield sys.stdout.buffer
+        sys.stdout.buffer.flush()
+        return
+
+    if path.endswith('.zst'):
+        _require_zstandard(path)
+        compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+        with open(path, 'wb') as raw, compressor.stream_writer(raw, write_size=WRITE_SIZE, closefd=False) as writer:
+            yield writer
+    elif path.endswith(('.xz', '.lzma')):
+        with lzma.open(path, 'wb') as writer:
+            yield writer
+    elif path.endswith('.gz'):
+        with gzip.open(path, 'wb', compresslevel=6) as writer:
+            yield writer
+    else:
+        with open(path, 'wb', buffering=WRITE_SIZE) as writer:
+            yield writer
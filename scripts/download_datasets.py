@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Download the pushshift datasets into input/.
+
+    ./download_datasets.py --start 2018-01-01 --end 2018-03-31 --jobs 4
+    ./download_datasets.py --datasets dumps
+
+The Authors and Subreddits dumps are fetched once; one Submissions dump is planned per calendar
+day in [start, end], so dates like 2018-02-30 are never requested. Downloads go to a '.part' file
+that is resumed with an HTTP range request after an interruption and only renamed once its size
+and magic bytes check out. A day without a published Submissions dump (HTTP 404) is logged and
+left out, so the run goes on and the validation sees an empty day.
+"""
+import argparse
+import http.client
+import logging
+import os
+import shutil
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = "http://files.pushshift.io/reddit"
+DATA_FOLDER = Path(__file__).parents[1] / 'input'
+
+AUTHORS = ('authors/RA_78M.csv.zst', 'Authors')
+SUBREDDITS = ('subreddits/reddit_subreddits.ndjson.zst', 'Subreddits')
+SUBMISSIONS = ('submissions/daily/RS_{day}.xz', 'Submissions')
+
+MAGIC_BYTES = {
+    '.xz': b'\xfd7zXZ\x00',
+    '.zst': b'\x28\xb5\x2f\xfd',
+}
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+class NotPublishedError(DownloadError):
+    """
+    The server has no such file (HTTP 404).
+    """
+
+
+def plan_dates(start, end):
+    """
+    All calendar days from start to end (inclusive).
+    :param start: First day as date or 'YYYY-MM-DD'
+    :param end: Last day as date or 'YYYY-MM-DD'
+    :return: List of dates
+    """
+    start = date.fromisoformat(str(start))
+    end = date.fromisoformat(str(end))
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def plan_downloads(start, end, base_url=BASE_URL, data_folder=DATA_FOLDER, datasets='all'):
+    """
+    Build the list of files to download for a date range.
+    :param datasets: 'all', 'dumps' for the Authors and Subreddits dumps only (the dates are ignored) or
+        'submissions' for the Submissions days only
+    :return: List of (url, destination path) tuples
+    """
+    plan = []
+    if datasets in ('all', 'dumps'):
+        plan += [(f"{base_url}/{AUTHORS[0]}", Path(data_folder) / AUTHORS[1] / os.path.basename(AUTHORS[0])),
+                 (f"{base_url}/{SUBREDDITS[0]}", Path(data_folder) / SUBREDDITS[1] / os.path.basename(SUBREDDITS[0]))]
+    if datasets == 'dumps':
+        return plan
+    for day in plan_dates(start, end):
+        remote = SUBMISSIONS[0].format(day=day.isoformat())
+        plan.append((f"{base_url}/{remote}", Path(data_folder) / SUBMISSIONS[1] / os.path.basename(remote)))
+    return plan
+
+
+def validate(path, expected_size=None, suffix=None):
+    """
+    Check a downloaded file against its expected size and the magic bytes of its format. Small error
+    pages served with status 200 fail the magic byte check.
+    :param path: Path of the file
+    :param expected_size: Size announced by the server, if known
+    :param suffix: Extension that determines the format, defaults to the one of `path`
+    :raises DownloadError: If the file does not look complete
+    """
+    size = os.path.getsize(path)
+    if expected_size is not None and size != expected_size:
+        raise DownloadError(f"{path} has {size} bytes, expected {expected_size}")
+    suffix = suffix or Path(path).suffix
+    magic = MAGIC_BYTES.get(suffix)
+    if magic is not None:
+        with open(path, 'rb') as f:
+            if f.read(len(magic)) != magic:
+                raise DownloadError(f"{path} is not a {suffix} file ({size} bytes)")
+
+
+def _total_size(response, offset):
+    # 'Content-Range: bytes 100-199/200' on resumed downloads, Content-Length otherwise.
+    content_range = response.headers.get('Content-Range')
+    if content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('Content-Length')
+    return offset + int(length) if length is not None else None
+
+
+def download(url, path, retries=3, timeout=60):
+    """
+    Download a file, resuming a previous partial download if there is one.
+    :param url: Source URL
+    :param path: Destination path
+    :param retries: Attempts before giving up
+    :param timeout: Socket timeout in seconds
+    :return: True if the file was downloaded, False if a valid copy was already present
+    :raises DownloadError: If the file could not be downloaded completely
+    """
+    path = Path(path)
+    if path.exists():
+        try:
+            validate(path)
+            logger.info(f"File {path.name} found. Skip download.")
+            return False
+        except DownloadError as e:
+            logger.warning(f"{e}. Download it again.")
+            path.unlink()
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    part = path.with_name(path.name + '.part')
+    for attempt in range(1, retries + 1):
+        offset = part.stat().st_size if part.exists() else 0
+        request = urllib.request.Request(url, headers={'Range': f'bytes={offset}-'} if offset else {})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                if offset and response.status != 206:
+                    # The server ignored the range, start over.
+                    offset = 0
+                expected = _total_size(response, offset)
+                logger.info(f"Download file {path.name} from {url}"
+                            + (f", resuming at byte {offset}" if offset else ""))
+                with open(part, 'ab' if offset else 'wb') as f:
+                    shutil.copyfileobj(response, f, COPY_BUFFER_SIZE)
+            if expected is not None and part.stat().st_size < expected:
+                raise ConnectionError(f"connection closed after {part.stat().st_size}/{expected} bytes")
+            validate(part, expected, suffix=path.suffix)
+            os.replace(part, path)
+            return True
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                # Range starts at the end of the file: the part file may already be complete.
+                try:
+                    validate(part, suffix=path.suffix)
+                    os.replace(part, path)
+                    return True
+                except DownloadError:
+                    part.unlink()
+            elif e.code == 404:
+                raise NotPublishedError(f"{url} : HTTP {e.code}")
+            elif 400 <= e.code < 500:
+                raise DownloadError(f"{url} : HTTP {e.code}")
+            logger.warning(f"Attempt {attempt}/{retries} for {url} failed : HTTP {e.code}")
+        except DownloadError as e:
+            # A complete but invalid file cannot be fixed by resuming it.
+            part.unlink()
+            logger.warning(f"Attempt {attempt}/{retries} for {url} failed : {e}")
+        except (OSError, http.client.HTTPException) as e:
+            # Keep the part file, the next attempt resumes it.
+            logger.warning(f"Attempt {attempt}/{retries} for {url} failed : {e}")
+        if attempt < retries:
+            time.sleep(min(2 ** attempt, 30))
+    raise DownloadError(f"Giving up on {url} after {retries} attempts")
+
+
+def download_all(plan, jobs=4, retries=3):
+    """
+    Download all planned files with at most `jobs` transfers at the same time. A Submissions day that is not
+    published is not a failure, the day just has no data.
+    :param plan: List of (url, destination path) tuples
+    :return: List of (url, error) tuples for the files that failed
+    """
+    def _run(item):
+        url, path = item
+        try:
+            download(url, path, retries=retries)
+            return None
+        except NotPublishedError as e:
+            if Path(path).parent.name != SUBMISSIONS[1]:
+                logger.error(str(e))
+                return url, e
+            logger.warning(f"{e} : no dump published for {Path(path).name}, the day has no data")
+            return None
+        except DownloadError as e:
+            logger.error(str(e))
+            return url, e
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return [failure for failure in executor.map(_run, plan) if failure is not None]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the reddit datasets from pushshift.io.")
+    parser.add_argument('--start', help="First submission day, YYYY-MM-DD (required unless --datasets dumps)")
+    parser.add_argument('--end', help="Last submission day, YYYY-MM-DD (default: --start)")
+    parser.add_argument('--jobs', type=int, default=4, help="Concurrent downloads (default: %(default)s)")
+    parser.add_argument('--retries', type=int, default=3, help="Attempts per file (default: %(default)s)")
+    parser.add_argument('--base-url', default=BASE_URL, help="Mirror to download from (default: %(default)s)")
+    parser.add_argument('--data-folder', default=str(DATA_FOLDER), help="Destination (default: %(default)s)")
+    parser.add_argument('--datasets', choices=('all', 'dumps', 'submissions'), default='all',
+                        help="Download the Authors and Subreddits dumps, the Submissions days or all of them "
+                             "(default: %(default)s)")
+    args = parser.parse_args()
+    if args.start is None and args.datasets != 'dumps':
+        parser.error("--start is required unless --datasets is 'dumps'")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    plan = plan_downloads(args.start, args.end or args.start, base_url=args.base_url, data_folder=args.data_folder,
+                          datasets=args.datasets)
+    logger.info(f"Download datasets... {len(plan)} files planned")
+    failures = download_all(plan, jobs=args.jobs, retries=args.retries)
+    if failures:
+        logger.error(f"{len(failures)}/{len(plan)} downloads failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
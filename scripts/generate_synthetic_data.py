@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic pushshift-like datasets of any size, without the multi-GB downloads.
+
+    ./generate_synthetic_data.py --output-dir ../input --authors 1000000 --subreddits 50000 \\
+        --submissions 200000 --start 2018-01-01 --days 3
+
+Records follow the shapes of assets/sample-*: the same fields and types, with value distributions
+close to the real dumps (heavy-tailed karma, scores and subscribers, a few popular authors and
+subreddits receiving most submissions, 'None' fields, invalid user names, '[deleted]' authors and
+subreddits listed twice). Submissions reference the generated authors and subreddits, so the
+fact table joins. The files get the pushshift names and codecs, or are written plain with --plain:
+
+    Authors/RA_<n>.csv.zst
+    Subreddits/reddit_subreddits.ndjson.zst
+    Submissions/RS_<YYYY-MM-DD>.xz
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import string
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+from compressed_io import open_output
+
+logger = logging.getLogger(__name__)
+
+ASSETS = Path(__file__).parents[1] / 'assets'
+
+WORDS = ("reddit data pipeline star schema cat dog news world game music video photo art science "
+         "today question help first time finally look new old best worst year week day night city "
+         "home work life love movie book food travel sport team season update discussion").split()
+DOMAINS = ['i.redd.it', 'imgur.com', 'i.imgur.com', 'youtube.com', 'gfycat.com', 'twitter.com', 'v.redd.it']
+THUMBNAILS = ['default', 'nsfw', 'image', 'https://b.thumbs.redditmedia.com/x.jpg']
+# Oldest accounts carry this creation time in the dump.
+FIRST_CREATED = 1137474000
+LAST_CREATED = 1540000000
+UPDATED = 1540040752
+
+# Share of author rows with a name preprocess_authors.py flags as invalid.
+INVALID_NAME_RATE = 0.02
+NONE_RATE = 0.01
+DELETED_AUTHOR_RATE = 0.1
+# Share of subreddits listed a second time, with another case and a later creation time.
+DUPLICATE_SUBREDDIT_RATE = 0.01
+
+
+def author_name(k):
+    """
+    Name of the k-th generated author, valid per reddit's rules and unique.
+    """
+    return f"{WORDS[k % len(WORDS)]}_{k:x}"[:20]
+
+
+def subreddit_name(k):
+    """
+    Display name of the k-th generated subreddit, unique ignoring case.
+    """
+    return f"{WORDS[k % len(WORDS)].capitalize()}{k:x}"[:21]
+
+
+def _skewed_index(rnd, n, skew=3.0):
+    # Low indexes are drawn far more often: a few authors and subreddits get most of the activity.
+    return min(n - 1, int(n * rnd.random() ** skew))
+
+
+def _heavy_tail(rnd, alpha=1.2, scale=1):
+    return int((rnd.paretovariate(alpha) - 1) * scale)
+
+
+def _text(rnd, min_words, max_words):
+    return ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(min_words, max_words)))
+
+
+def _invalid_name(rnd, name):
+    return rnd.choice([name + '.' + name, name[:2], name + 'ü' * 2, 'x' * 21, name.replace('_', ' ', 1) + '!'])
+
+
+def _none_or(rnd, value):
+    return 'None' if rnd.random() < NONE_RATE else str(value)
+
+
+def write_authors(stream, rows, seed=0):
+    """
+    Write raw author rows like assets/sample-author.txt: 'id name created updated karma_posts karma_comments'.
+    :param stream: Binary output stream
+    :param rows: Number of rows
+    :param seed: Random seed
+    """
+    rnd = random.Random(seed)
+    lines = []
+    for k in range(rows):
+        name = author_name(k)
+        if rnd.random() < INVALID_NAME_RATE:
+            name = _invalid_name(rnd, name)
+        # Most old accounts share FIRST_CREATED, the rest spread towards the present.
+        created = FIRST_CREATED if rnd.random() < 0.05 else FIRST_CREATED + int(
+            (LAST_CREATED - FIRST_CREATED) * rnd.random() ** 0.5)
+        karma_posts = 0 if rnd.random() < 0.6 else _heavy_tail(rnd, 1.1, 10)
+        karma_comments = 0 if rnd.random() < 0.4 else _heavy_tail(rnd, 1.1, 20) - (rnd.random() < 0.02) * 50
+        lines.append(f"{77714 + k} {name} {_none_or(rnd, created)} {UPDATED + rnd.randint(0, 20000)} "
+                     f"{_none_or(rnd, karma_posts)} {_none_or(rnd, karma_comments)}\n")
+        if len(lines) >= 10000:
+            stream.write(''.join(lines).encode('utf-8'))
+            lines = []
+    stream.write(''.join(lines).encode('utf-8'))
+
+
+def _subreddit(template, rnd, k, name, created):
+    record = dict(template)
+    record.update({
+        'display_name': name,
+        'display_name_prefixed': f"r/{name}",
+        'name': f"t5_{k:x}",
+        'url': f"/r/{name}/",
+        'title': _text(rnd, 1, 6),
+        'created_utc': float(created),
+        'subscribers': _heavy_tail(rnd, 0.9, 5),
+        'over18': rnd.random() < 0.1,
+        'description': _text(rnd, 0, 80),
+        'public_description': _text(rnd, 0, 30),
+        'subreddit_type': rnd.choices(['public', 'restricted', 'private', 'archived'], [90, 6, 3, 1])[0],
+        'lang': rnd.choices(['en', 'de', 'es', 'fr', 'pt'], [85, 4, 4, 4, 3])[0],
+        'accounts_active': None if rnd.random() < 0.8 else _heavy_tail(rnd, 1.2, 3),
+        'quarantine': rnd.random() < 0.001,
+        'wiki_enabled': rnd.random() < 0.3,
+    })
+    return record
+
+
+def write_subreddits(stream, rows, seed=0):
+    """
+    Write subreddit NDJSON records like assets/sample-subrredit.json.
+    :param stream: Binary output stream
+    :param rows: Number of distinct subreddits; about DUPLICATE_SUBREDDIT_RATE more records are written
+    :param seed: Random seed
+    """
+    rnd = random.Random(seed)
+    template = json.loads((ASSETS / 'sample-subrredit.json').read_text())
+    for k in range(rows):
+        created = FIRST_CREATED + int((LAST_CREATED - FIRST_CREATED) * rnd.random())
+        record = _subreddit(template, rnd, k, subreddit_name(k), created)
+        stream.write(json.dumps(record).encode('utf-8') + b'\n')
+        if rnd.random() < DUPLICATE_SUBREDDIT_RATE:
+            again = _subreddit(template, rnd, k, subreddit_name(k).lower(), created + rnd.randint(1, 10 ** 7))
+            stream.write(json.dumps(again).encode('utf-8') + b'\n')
+
+
+def write_submissions(stream, rows, day, authors, subreddits, seed=0):
+    """
+    Write one day of submission NDJSON records like assets/sample-submission.json.
+    :param stream: Binary output stream
+    :param rows: Number of submissions
+    :param day: date the submissions were created on (UTC)
+    :param authors: Number of generated authors to draw from
+    :param subreddits: Number of generated subreddits to draw from
+    :param seed: Random seed
+    """
+    rnd = random.Random(f"{seed}-{day}")
+    template = json.loads((ASSETS / 'sample-submission.json').read_text())
+    start = int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+    # Room for 2M submissions per day before the ids of the next day start.
+    first_id = day.toordinal() * 2 ** 21
+    for k in range(rows):
+        sid = _base36(first_id + k)
+        created = start + k * 86400 // rows
+        subreddit_k = _skewed_index(rnd, subreddits)
+        subreddit = subreddit_name(subreddit_k)
+        author = '[deleted]' if rnd.random() < DELETED_AUTHOR_RATE else author_name(_skewed_index(rnd, authors))
+        title = _text(rnd, 2, 15)
+        slug = '_'.join(title.lower().split()[:6])
+        is_self = rnd.random() < 0.4
+        record = dict(template)
+        record.update({
+            'id': sid,
+            'author': author,
+            'subreddit': subreddit,
+            'subreddit_id': f"t5_{subreddit_k:x}",
+            'created_utc': created,
+            'retrieved_on': created + rnd.randint(10 ** 6, 5 * 10 ** 6),
+            'title': title,
+            'is_self': is_self,
+            'domain': f"self.{subreddit}" if is_self else rnd.choice(DOMAINS),
+            'selftext': _text(rnd, 0, 120) if is_self else '',
+            'permalink': f"/r/{subreddit}/comments/{sid}/{slug}/",
+            'url': f"https://www.reddit.com/r/{subreddit}/comments/{sid}/{slug}/" if is_self
+            else f"https://{rnd.choice(DOMAINS)}/{''.join(rnd.choices(string.ascii_letters, k=8))}",
+            'score': _heavy_tail(rnd, 0.8),
+            'num_comments': _heavy_tail(rnd, 1.0),
+            'gilded': int(rnd.random() < 0.002),
+            'edited': created + rnd.randint(60, 86400) if rnd.random() < 0.05 else False,
+            'over_18': rnd.random() < 0.05,
+            'stickied': rnd.random() < 0.001,
+            'spoiler': rnd.random() < 0.002,
+            'thumbnail': 'self' if is_self else rnd.choice(THUMBNAILS),
+            'thumbnail_height': None if is_self else 140,
+            'thumbnail_width': None if is_self else 140,
+        })
+        stream.write(json.dumps(record).encode('utf-8') + b'\n')
+
+
+def _base36(n):
+    digits = string.digits + string.ascii_lowercase
+    out = ''
+    while True:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+        if not n:
+            return out
+
+
+def dataset_paths(output_dir, authors, start, days, plain=False):
+    """
+    Paths of the generated files, laid out like the pushshift downloads.
+    :return: Dict with 'authors', 'subreddits' and 'submissions' (dict of date -> path)
+    """
+    output_dir = Path(output_dir)
+    return {
+        'authors': str(output_dir / 'Authors' / (f"RA_{authors}.csv" + ('' if plain else '.zst'))),
+        'subreddits': str(output_dir / 'Subreddits' / ('reddit_subreddits.ndjson' + ('' if plain else '.zst'))),
+        'submissions': {day: str(output_dir / 'Submissions' / (f"RS_{day}" + ('.ndjson' if plain else '.xz')))
+                        for day in (start + timedelta(days=i) for i in range(days))},
+    }
+
+
+def generate(output_dir, authors, subreddits, submissions, start, days=1, plain=False, seed=0):
+    """
+    Generate all three datasets.
+    :param submissions: Submissions per day
+    :return: The dict of `dataset_paths`
+    """
+    paths = dataset_paths(output_dir, authors, start, days, plain=plain)
+    targets = [(paths['authors'], write_authors, (authors,)),
+               (paths['subreddits'], write_subreddits, (subreddits,))]
+    targets += [(path, write_submissions, (submissions, day, authors, subreddits))
+                for day, path in paths['submissions'].items()]
+    for path, writer, args in targets:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open_output(path) as stream:
+            writer(stream, *args, seed=seed)
+        logger.info(f"Wrote {path} ({os.path.getsize(path) / 1024 ** 2:.1f} MB)")
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic reddit datasets of any size.")
+    parser.add_argument('--output-dir', default=str(Path(__file__).parents[1] / 'input'),
+                        help="Destination (default: %(default)s)")
+    parser.add_argument('--authors', type=int, default=100_000, help="Author rows (default: %(default)s)")
+    parser.add_argument('--subreddits', type=int, default=10_000, help="Subreddits (default: %(default)s)")
+    parser.add_argument('--submissions', type=int, default=100_000,
+                        help="Submissions per day (default: %(default)s)")
+    parser.add_argument('--start', default='2018-01-01', help="First submission day (default: %(default)s)")
+    parser.add_argument('--days', type=int, default=1, help="Number of submission days (default: %(default)s)")
+    parser.add_argument('--plain', action='store_true', help="Write uncompressed files")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: %(default)s)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    generate(args.output_dir, args.authors, args.subreddits, args.submissions, date.fromisoformat(args.start),
+             days=args.days, plain=args.plain, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Local DuckDB mirror of the Redshift star schema, to run and time the `SqlQueries` statements
+without a cluster.
+
+    with LocalWarehouse() as wh:
+        wh.stage('staging_authors', '../input/Authors/RA_78M_processed.csv.zst')
+        wh.stage('staging_subreddits', '../input/Subreddits/reddit_subreddits_processed.ndjson.zst')
+        wh.stage('staging_submissions', '../input/Submissions/RS_2018-01-01.parquet')
+        wh.create_tables()
+        wh.run('dim_author_insert', table='dim_author')
+
+The staging tables are read from the same files that get uploaded to S3. The dimension and fact
+tables are derived from the INSERT statements themselves (column names from the INSERT list, types
+from the SELECT), so there is no second copy of the schema to keep in sync. DuckDB understands the
+plugin SQL as is; `_DIALECT_SHIMS` rewrites the few Redshift-only functions used elsewhere.
+"""
+import re
+import sys
+import time
+from pathlib import Path
+
+try:
+    import duckdb
+except ImportError:  # only needed by LocalWarehouse, not by the SQL helpers
+    duckdb = None
+
+# The statements are shared with the Airflow plugins.
+sys.path.append(str(Path(__file__).parents[1] / 'airflow' / 'plugins'))
+from sql_queries import SqlQueries  # noqa: E402
+
+# Redshift-only syntax -> DuckDB equivalent.
+_DIALECT_SHIMS = [
+    (re.compile(r'APPROXIMATE\s+COUNT\(\s*DISTINCT\s+', re.IGNORECASE), 'APPROX_COUNT_DISTINCT('),
+    (re.compile(r'\bFNV_HASH\(', re.IGNORECASE), 'HASH('),
+    (re.compile(r'\bGETDATE\(\)', re.IGNORECASE), 'CURRENT_TIMESTAMP'),
+]
+
+_INSERT_RE = re.compile(r'INSERT\s+INTO\s+(\S+)\s*\((.*?)\)\s*(.*?);?\s*$', re.DOTALL | re.IGNORECASE)
+
+# Field order of preprocess_authors.py
+AUTHOR_COLUMNS = {
+    'id': 'BIGINT',
+    'author': 'VARCHAR',
+    'created': 'BIGINT',
+    'updated': 'BIGINT',
+    'karma_posts': 'BIGINT',
+    'karma_comments': 'BIGINT',
+    'author_valid': 'VARCHAR',
+}
+
+# Keys of the subreddit dump read by dim_subreddit_insert.
+SUBREDDIT_COLUMNS = dict(
+    [(name, 'VARCHAR') for name in (
+        "display_name advertiser_category community_icon description display_name_prefixed header_img "
+        "header_title key_color lang name notification_level primary_color public_description submission_type "
+        "submit_link_label submit_text submit_text_label subreddit_type suggested_comment_sort title url "
+        "whitelist_status").split()]
+    + [(name, 'BIGINT') for name in (
+        "accounts_active active_user_count comment_score_hide_mins subscribers videostream_links_count "
+        "wls").split()]
+    + [(name, 'BOOLEAN') for name in (
+        "accounts_active_is_fuzzed all_original_content allow_discovery allow_images allow_videogifs "
+        "allow_videos can_assign_link_flair can_assign_user_flair emojis_enabled free_form_reports hide_ads "
+        "original_content_tag_enabled over18 public_traffic quarantine show_media show_media_preview "
+        "spoilers_enabled wiki_enabled").split()]
+    # Written as a float in the dump, e.g. 1137700161.0
+    + [('created_utc', 'DOUBLE')])
+
+# Target table -> statement whose INSERT list and SELECT define it.
+TABLE_DEFINITIONS = {
+    'dim_author': 'dim_author_insert',
+    'dim_subreddit': 'dim_subreddit_insert',
+    'fact_submission': 'fact_submission_insert',
+    'dim_time': 'dim_time_insert',
+}
+
+
+def translate(sql):
+    """
+    Rewrite Redshift-only syntax of a statement for DuckDB.
+    :param sql: Redshift SQL
+    :return: DuckDB SQL
+    """
+    for pattern, replacement in _DIALECT_SHIMS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def create_table_sql(table, statement):
+    """
+    Derive a CREATE TABLE for a dimension or fact table from the statement that loads it: column names
+    from the INSERT list, types from the SELECT. Works on DuckDB and Postgres; the staging tables the
+    SELECT reads have to exist.
+    :param table: Name of the table to create
+    :param statement: Name of the `SqlQueries` INSERT ... SELECT statement that loads it
+    :return: SQL statement creating the empty table if it does not exist
+    """
+    m = _INSERT_RE.search(getattr(SqlQueries, statement).format(table=table).strip())
+    if m is None:
+        raise ValueError(f"SqlQueries.{statement} is not an INSERT INTO ... (columns) SELECT ...")
+    _, columns, select = m.groups()
+    return f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM ({translate(select)}) AS s({columns}) LIMIT 0"
+
+
+def _sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _columns_literal(columns):
+    return '{' + ', '.join(f"{_sql_literal(name)}: {_sql_literal(type_)}" for name, type_ in columns.items()) + '}'
+
+
+class LocalWarehouse:
+    """
+    DuckDB database holding the staging, dimension and fact tables.
+    :param path: Database file, ':memory:' keeps everything in RAM
+    :param threads: DuckDB worker threads, None lets DuckDB decide
+    """
+
+    def __init__(self, path=':memory:', threads=None):
+        if duckdb is None:
+            raise RuntimeError("LocalWarehouse requires the 'duckdb' package.")
+        self.conn = duckdb.connect(path)
+        if threads is not None:
+            self.conn.execute(f"SET threads = {int(threads)}")
+        # staging_times_insert fills it, dim_time_insert reads it.
+        self.conn.execute('CREATE TABLE IF NOT EXISTS staging_times ("start_time" TIMESTAMP)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def execute(self, sql):
+        """
+        Run one or more statements written for Redshift.
+        """
+        self.conn.execute(translate(sql))
+
+    def stage(self, table, path):
+        """
+        (Re)create a staging table from a local file, like the COPY of StageToRedshiftOperator.
+        :param table: 'staging_authors', 'staging_subreddits' or 'staging_submissions'
+        :param path: Processed authors CSV, processed subreddit NDJSON or submissions Parquet, optionally .gz/.zst
+        :return: Number of rows staged
+        """
+        source = _sql_literal(path)
+        if table == 'staging_authors':
+            reader = (f"read_csv({source}, delim='|', header=false, quote='', escape='', auto_detect=false, "
+                      f"columns={_columns_literal(AUTHOR_COLUMNS)})")
+        elif table == 'staging_subreddits':
+            reader = (f"read_json({source}, format='newline_delimited', "
+                      f"columns={_columns_literal(SUBREDDIT_COLUMNS)})")
+        elif table == 'staging_submissions':
+            reader = f"read_parquet({source})"
+        else:
+            raise ValueError(f"Unknown staging table '{table}'")
+        self.conn.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM {reader}")
+        return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def create_tables(self, tables=TABLE_DEFINITIONS):
+        """
+        Create the empty dimension and fact tables from their INSERT statements. Needs the staging tables.
+        :param tables: Dict of table name -> name of the `SqlQueries` statement that loads it
+        """
+        for table, statement in tables.items():
+            self.conn.execute(create_table_sql(table, statement))
+
+    def run(self, statement, **params):
+        """
+        Run a `SqlQueries` statement.
+        :param statement: Name of the statement, e.g. 'dim_author_insert'
+        :param params: Values for its placeholders, e.g. table='dim_author'
+        :return: Seconds the statement took
+        """
+        sql = getattr(SqlQueries, statement).format(**params)
+        start = time.perf_counter()
+        self.execute(sql)
+        return time.perf_counter() - start
+
+    def count(self, table):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
@@ -1,13 +1,44 @@
 #!/usr/bin/env python3
 
+import argparse
+import collections
+import contextlib
+import json
+import multiprocessing
+import os
+import shutil
 import sys
 import re
+import time
+
+from compressed_io import open_input, open_output
 
 # Values taken from historical reddit source code:
 # https://github.com/reddit-archive/reddit/blob/master/r2/r2/lib/validator/validator.py#L1567-L1570
 MIN_USERNAME_LENGTH = 3
 MAX_USERNAME_LENGTH = 20
 USER_REGEX = re.compile(r"\A[\w-]+\Z", re.UNICODE)
+LINE_REGEX = re.compile(r"^(\d+) (.*?) ([\d]+|None) ([\d]+|None) (\-?[\d]+|None) (\-?[\d]+|None)$", re.UNICODE)
+# For ASCII input the bytes pattern matches exactly what USER_REGEX does.
+ASCII_USER_REGEX = re.compile(rb"\A[\w-]+\Z")
+
+# Size of the line-aligned blocks handed to the workers. Large enough to amortize
+# the inter-process copy, small enough to keep every core busy until the end.
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Input bytes per segment of a checkpointed run (--checkpoint-dir).
+SEGMENT_SIZE = 256 * 1024 * 1024
+CHECKPOINT_FILE = 'checkpoint.json'
+SEGMENT_PREFIX = 'segment-'
+# Files being written carry this prefix until they are complete.
+PART_PREFIX = '.part-'
+
+# Reason codes of the reject sidecar, one 'reason<TAB>raw line' record per line. Lines that do not match
+# LINE_REGEX and usernames that are not valid UTF-8 are left out of the output; rows with an invalid
+# username stay in it, flagged 0, and are listed for inspection only.
+REJECT_REGEX_MISMATCH = 'regex_mismatch'
+REJECT_ENCODING_ERROR = 'encoding_error'
+REJECT_INVALID_USERNAME = 'invalid_username'
 
 
 def _replace_none(val):
@@ -16,29 +47,568 @@ def _replace_none(val):
     return val
 
 
-def main():
-    line_regex = re.compile(r"^(\d+) (.*?) ([\d]+|None) ([\d]+|None) (\-?[\d]+|None) (\-?[\d]+|None)$", re.UNICODE)
+def _reject(reason, line):
+    # One record per line, with or without the newline of the raw line.
+    return f"{reason}\t{line[:-1] if line.endswith(chr(10)) else line}\n"
+
+
+def _is_utf8(text):
+    # Text decoded with surrogateescape: undecodable bytes became lone surrogates.
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _process_line(line, out, err):
+    m = LINE_REGEX.match(line)
+    if m is None:
+        err.append(_reject(REJECT_REGEX_MISMATCH, line))
+        return
+    userid = m.group(1)
+    username = m.group(2)
+    if not username.isascii() and not _is_utf8(username):
+        err.append(_reject(REJECT_ENCODING_ERROR, line))
+        return
+    start_date = _replace_none(m.group(3))
+    end_date = _replace_none(m.group(4))
+    karma_post = _replace_none(m.group(5))
+    karma_comment = _replace_none(m.group(6))
+
+    # Determine if username is valid based.
+    # 0 (invalid) or 1 (valid) will be added as an additional column.
+    valid = USER_REGEX.match(username) is not None and MIN_USERNAME_LENGTH <= len(
+        username) <= MAX_USERNAME_LENGTH
 
-    for line in sys.stdin:
+    out.append(
+        "|".join([userid, username, start_date, end_date, karma_post, karma_comment, str(int(valid))]) + '\n')
+    if not valid:
+        err.append(_reject(REJECT_INVALID_USERNAME, line))
+
+
+def _is_count(val):
+    return val.isdigit() or val == b'None'
+
+
+def _is_karma(val):
+    return val.isdigit() or val == b'None' or (val[:1] == b'-' and val[1:].isdigit())
+
+
+def _parse_line_fast(line, newline, out, err):
+    # Without a backtracking regex: the userid ends at the first space and the last four
+    # fields never contain one, so whatever sits in between is the username. Anything
+    # the split cannot vouch for (malformed or non-ASCII digits) takes the reference path.
+    userid, _, rest = line.partition(b' ')
+    fields = rest.rsplit(b' ', 4)
+    if not (len(fields) == 5 and userid.isdigit() and _is_count(fields[1]) and _is_count(fields[2])
+            and _is_karma(fields[3]) and _is_karma(fields[4])):
+        ref_out = []
+        _process_line((line + newline).decode('utf-8', 'surrogateescape'), ref_out, err)
+        for row in ref_out:
+            out += row.encode('utf-8', 'surrogateescape')
+        return
+
+    username, start_date, end_date, karma_post, karma_comment = fields
+    if username.isascii():
+        valid = MIN_USERNAME_LENGTH <= len(username) <= MAX_USERNAME_LENGTH and \
+            ASCII_USER_REGEX.match(username) is not None
+    else:
         try:
-            m = line_regex.match(line)
-            userid = m.group(1)
-            username = m.group(2)
-            start_date = _replace_none(m.group(3))
-            end_date = _replace_none(m.group(4))
-            karma_post = _replace_none(m.group(5))
-            karma_comment = _replace_none(m.group(6))
-
-            # Determine if username is valid based.
-            # 0 (invalid) or 1 (valid) will be added as an additional column.
-            valid = USER_REGEX.match(username) is not None and MIN_USERNAME_LENGTH <= len(
-                username) <= MAX_USERNAME_LENGTH
-
-            sys.stdout.write(
-                "|".join([userid, username, start_date, end_date, karma_post, karma_comment, str(int(valid))]) + '\n')
-
-        except:
-            sys.stderr.write(line)
+            name = username.decode('utf-8')
+        except UnicodeDecodeError:
+            err.append(_reject(REJECT_ENCODING_ERROR, line.decode('utf-8', 'surrogateescape')))
+            return
+        valid = USER_REGEX.match(name) is not None and MIN_USERNAME_LENGTH <= len(name) <= MAX_USERNAME_LENGTH
+
+    out += userid
+    out += b'|'
+    out += username
+    out += b'|'
+    if start_date != b'None':
+        out += start_date
+    out += b'|'
+    if end_date != b'None':
+        out += end_date
+    out += b'|'
+    if karma_post != b'None':
+        out += karma_post
+    out += b'|'
+    if karma_comment != b'None':
+        out += karma_comment
+    if valid:
+        out += b'|1\n'
+    else:
+        out += b'|0\n'
+        err.append(_reject(REJECT_INVALID_USERNAME, line.decode('utf-8', 'surrogateescape')))
+
+
+def process_chunk_fast(chunk):
+    """
+    Preprocess a block of complete author lines without decoding it.
+    :param chunk: Raw bytes holding whole lines, only the last one may lack its newline.
+    :return: Tuple of (output bytes, reject sidecar records) for the block.
+    """
+    out = bytearray()
+    err = []
+    lines = chunk.split(b'\n')
+    last = lines.pop()
+    for line in lines:
+        _parse_line_fast(line, b'\n', out, err)
+    if last:
+        _parse_line_fast(last, b'', out, err)
+    return bytes(out), ''.join(err).encode('utf-8', 'surrogateescape')
+
+
+def process_chunk_regex(chunk):
+    """
+    Reference implementation of `process_chunk_fast` built on `LINE_REGEX`.
+    :param chunk: Raw bytes holding whole lines, only the last one may lack its newline.
+    :return: Tuple of (output bytes, reject sidecar records) for the block.
+    """
+    # surrogateescape keeps undecodable bytes intact on the way back out.
+    text = chunk.decode('utf-8', 'surrogateescape')
+    out = []
+    err = []
+    start = 0
+    end = len(text)
+    while start < end:
+        stop = text.find('\n', start)
+        stop = end if stop == -1 else stop + 1
+        _process_line(text[start:stop], out, err)
+        start = stop
+    return ''.join(out).encode('utf-8', 'surrogateescape'), ''.join(err).encode('utf-8', 'surrogateescape')
+
+
+PARSERS = {
+    'fast': process_chunk_fast,
+    'regex': process_chunk_regex,
+}
+
+
+def iter_chunks(stream, chunk_size=CHUNK_SIZE):
+    """
+    Split a binary stream into blocks that always end on a line boundary.
+    :param stream: Binary file object to read from
+    :param chunk_size: Approximate number of bytes per block
+    :return: Generator of bytes blocks
+    """
+    remainder = b''
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        data = remainder + data
+        cut = data.rfind(b'\n') + 1
+        if cut == 0:
+            remainder = data
+            continue
+        remainder = data[cut:]
+        yield data[:cut]
+    if remainder:
+        yield remainder
+
+
+def _imap_ordered(pool, func, iterable, max_in_flight):
+    # Pool.imap would read the whole input ahead of the workers, so keep a bounded
+    # window of pending blocks and hand results back in submission order.
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _process_chunks(chunks, workers=1, parser='fast'):
+    """
+    Process blocks in this process or a pool of workers.
+    :return: Generator of (output bytes, rejected bytes) tuples, in the order of the blocks
+    """
+    process_chunk = PARSERS[parser]
+    if workers <= 1:
+        yield from map(process_chunk, chunks)
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        yield from _imap_ordered(pool, process_chunk, chunks, max_in_flight=2 * workers)
+
+
+class RunStats:
+    """
+    Counters of a preprocessing run: rows written to the output, how many of them have a valid username, and
+    the reject sidecar records per reason.
+    """
+
+    def __init__(self, parsed=0, valid=0, reasons=None):
+        self.parsed = parsed
+        self.valid = valid
+        self.reasons = collections.Counter(reasons or {})
+        self._start = time.perf_counter()
+        # Lines counted by earlier runs, see restore().
+        self._restored_lines = 0
+
+    def restore(self, parsed, valid, reasons):
+        """
+        Continue the counters of an earlier run. Its lines count towards the totals but not towards the rate of
+        this process.
+        """
+        self.parsed = parsed
+        self.valid = valid
+        self.reasons = collections.Counter(reasons)
+        self._restored_lines = self.parsed + self.rejected
+
+    def add_rows(self, out):
+        """
+        Count processed rows, 'userid|...|valid\\n'.
+        """
+        self.parsed += out.count(b'\n')
+        self.valid += out.count(b'|1\n')
+
+    def add_rejects(self, err):
+        """
+        Count reject sidecar records by their reason.
+        """
+        for record in err.split(b'\n'):
+            if record:
+                self.reasons[record.partition(b'\t')[0].decode('ascii', 'replace')] += 1
+
+    @property
+    def rejected(self):
+        # Lines left out of the output; invalid usernames are still in it.
+        return sum(self.reasons.values()) - self.reasons[REJECT_INVALID_USERNAME]
+
+    @property
+    def reject_rate(self):
+        lines = self.parsed + self.rejected
+        return self.rejected / lines if lines else 0.0
+
+    def as_dict(self):
+        """
+        :return: JSON-serializable counters; 'seconds' and 'rows_per_sec' cover the lines of this process only
+        """
+        seconds = time.perf_counter() - self._start
+        return {
+            'parsed': self.parsed,
+            'valid': self.valid,
+            'invalid': self.parsed - self.valid,
+            'rejected': self.rejected,
+            'reasons': dict(self.reasons),
+            'reject_rate': round(self.reject_rate, 6),
+            'seconds': round(seconds, 3),
+            'rows_per_sec': round((self.parsed + self.rejected - self._restored_lines) / seconds)
+            if seconds > 0 else None,
+        }
+
+
+class RejectWriter:
+    """
+    Binary writer for the reject sidecar that counts the records it passes on.
+    :param stream: Binary stream receiving the records
+    :param stats: RunStats counting them
+    """
+
+    def __init__(self, stream, stats):
+        self.stream = stream
+        self.stats = stats
+
+    def write(self, data):
+        if data:
+            self.stats.add_rejects(data)
+            self.stream.write(data)
+
+
+def run(instream, outstream, errstream, workers=1, chunk_size=CHUNK_SIZE, parser='fast', stats=None):
+    """
+    Preprocess an author dump.
+    :param instream: Binary stream with the raw space-delimited author rows
+    :param outstream: Binary stream receiving the pipe-delimited rows
+    :param errstream: Binary stream receiving the reject sidecar records, 'reason\\traw line\\n'
+    :param workers: Number of worker processes, 1 keeps everything in this process
+    :param chunk_size: Approximate number of bytes per block
+    :param parser: 'fast' (bytes split) or 'regex' (reference implementation)
+    :param stats: Optional RunStats counting the rows and rejects
+    :return: The RunStats
+    """
+    stats = stats if stats is not None else RunStats()
+    for out, err in _process_chunks(iter_chunks(instream, chunk_size), workers, parser):
+        outstream.write(out)
+        errstream.write(err)
+        stats.add_rows(out)
+        stats.add_rejects(err)
+    return stats
+
+
+def _output_extension(path):
+    return next((ext for ext in ('.zst', '.xz', '.lzma', '.gz') if path.endswith(ext)), '')
+
+
+def _part_path(path):
+    return os.path.join(os.path.dirname(path) or '.', PART_PREFIX + os.path.basename(path))
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_checkpoint(checkpoint_dir, checkpoint):
+    path = os.path.join(checkpoint_dir, CHECKPOINT_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _load_checkpoint(checkpoint_dir, identity):
+    """
+    The checkpoint of an earlier run on the same input, or a fresh one. A checkpoint is only trusted if all of its
+    segments exist. Leftovers of unfinished segments and of runs on another input are removed.
+    """
+    path = os.path.join(checkpoint_dir, CHECKPOINT_FILE)
+    checkpoint = None
+    if os.path.exists(path):
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('identity') != identity:
+            sys.stderr.write(f"Discard the checkpoint in {checkpoint_dir}, it belongs to another input\n")
+            checkpoint = None
+    finished = {name for segment in checkpoint['segments'] for name in (segment['file'], segment['rejects'])} \
+        if checkpoint else set()
+    if any(not os.path.exists(os.path.join(checkpoint_dir, name)) for name in finished):
+        sys.stderr.write(f"Discard the checkpoint in {checkpoint_dir}, some of its segments are missing\n")
+        checkpoint = None
+        finished = set()
+    for name in os.listdir(checkpoint_dir):
+        if name.startswith((SEGMENT_PREFIX, PART_PREFIX)) and name not in finished:
+            os.remove(os.path.join(checkpoint_dir, name))
+    return checkpoint or {'identity': identity, 'offset': 0, 'rows': 0, 'done': False, 'segments': [],
+                          'stats': {'parsed': 0, 'valid': 0, 'reasons': {}}}
+
+
+def _skip(stream, offset):
+    # Compressed inputs cannot seek, they are decompressed up to the checkpoint, which is still far cheaper
+    # than parsing the rows again.
+    if offset and stream.seekable():
+        stream.seek(offset)
+        return
+    while offset:
+        data = stream.read(min(offset, CHUNK_SIZE))
+        if not data:
+            raise ValueError("The input is shorter than its checkpoint")
+        offset -= len(data)
+
+
+def _concatenate(paths, output_path):
+    with open(output_path, 'wb') as out:
+        for path in paths:
+            with open(path, 'rb') as segment:
+                shutil.copyfileobj(segment, out, CHUNK_SIZE)
+
+
+def run_segmented(input_path, output_path, checkpoint_dir, rejects_path, workers=1, chunk_size=CHUNK_SIZE,
+                  parser='fast', segment_size=SEGMENT_SIZE, finish=None, stats=None):
+    """
+    Preprocess an author dump into numbered segments that survive a crash. Every finished segment is recorded in
+    a checkpoint with the input offset it ends at, its rows and the counters so far; a new run on the same input
+    skips to the last checkpoint, so a retry only redoes the unfinished segment. When the input is done the
+    segments, each compressed on its own, are concatenated into the output, which is valid for zstd, xz, gzip and
+    plain files. The rejects are segmented and concatenated the same way.
+    :param input_path: Raw author file, plain or compressed
+    :param output_path: Final processed file, its extension sets the codec of the segments
+    :param checkpoint_dir: Directory for the segments and the checkpoint, emptied once the output is complete
+    :param rejects_path: Final reject sidecar, compressed according to its extension
+    :param segment_size: Approximate number of (uncompressed) input bytes per segment
+    :param finish: Optional function (segment paths, output path) writing the output instead of concatenating
+    :param stats: Optional RunStats, it is given the counters of the segments done by earlier runs
+    :return: The final checkpoint dict
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    identity = {'input': os.path.abspath(input_path), 'size': os.path.getsize(input_path),
+                'mtime': os.path.getmtime(input_path), 'parser': parser,
+                'extension': _output_extension(output_path), 'rejects_extension': _output_extension(rejects_path)}
+    checkpoint = _load_checkpoint(checkpoint_dir, identity)
+    if checkpoint['offset']:
+        sys.stderr.write(f"Resume after {len(checkpoint['segments'])} segments, {checkpoint['rows']} rows, "
+                         f"at input byte {checkpoint['offset']}\n")
+    stats = stats if stats is not None else RunStats()
+    stats.restore(**checkpoint['stats'])
+
+    if not checkpoint['done']:
+        with open_input(input_path) as instream:
+            _skip(instream, checkpoint['offset'])
+            sizes = collections.deque()
+
+            def sized(chunks):
+                for chunk in chunks:
+                    sizes.append(len(chunk))
+                    yield chunk
+
+            results = _process_chunks(sized(iter_chunks(instream, chunk_size)), workers, parser)
+            while True:
+                number = f"{SEGMENT_PREFIX}{len(checkpoint['segments']):05d}"
+                name = number + identity['extension']
+                rejects = number + '.rejects' + identity['rejects_extension']
+                part = os.path.join(checkpoint_dir, PART_PREFIX + name)
+                rejects_part = os.path.join(checkpoint_dir, PART_PREFIX + rejects)
+                consumed = rows = 0
+                with open_output(part) as segment, open_output(rejects_part) as errstream:
+                    for out, err in results:
+                        segment.write(out)
+                        errstream.write(err)
+                        stats.add_rows(out)
+                        stats.add_rejects(err)
+                        rows += out.count(b'\n')
+                        consumed += sizes.popleft()
+                        if consumed >= segment_size:
+                            break
+                if not consumed:
+                    os.remove(part)
+                    os.remove(rejects_part)
+                    break
+                for path, final in ((part, name), (rejects_part, rejects)):
+                    _fsync(path)
+                    os.replace(path, os.path.join(checkpoint_dir, final))
+                checkpoint['offset'] += consumed
+                checkpoint['rows'] += rows
+                checkpoint['segments'].append({'file': name, 'rejects': rejects, 'offset': checkpoint['offset'],
+                                               'rows': rows})
+                checkpoint['stats'] = {'parsed': stats.parsed, 'valid': stats.valid, 'reasons': dict(stats.reasons)}
+                _write_checkpoint(checkpoint_dir, checkpoint)
+        checkpoint['done'] = True
+        _write_checkpoint(checkpoint_dir, checkpoint)
+
+    segments = [os.path.join(checkpoint_dir, segment['file']) for segment in checkpoint['segments']]
+    rejects = [os.path.join(checkpoint_dir, segment['rejects']) for segment in checkpoint['segments']]
+    tmp_path = _part_path(output_path)
+    (finish or _concatenate)(segments, tmp_path)
+    _concatenate(rejects, _part_path(rejects_path))
+    os.replace(_part_path(rejects_path), rejects_path)
+    os.replace(tmp_path, output_path)
+    # The checkpoint goes first: without it, leftover segments are removed by the next run instead of trusted.
+    for path in [os.path.join(checkpoint_dir, CHECKPOINT_FILE)] + segments + rejects:
+        os.remove(path)
+    return checkpoint
+
+
+@contextlib.contextmanager
+def _output_rows(outstream, args):
+    # With --dedup the rows go through the external sort, which writes them out when the input is done.
+    if not args.dedup:
+        yield outstream
+        return
+    from preprocess_authors_dedup import SortedDedupWriter
+
+    with SortedDedupWriter(outstream, memory_budget=args.memory_budget * 1024 * 1024,
+                           temp_dir=args.temp_dir) as writer:
+        yield writer
+    sys.stderr.write(f"Deduplicated {writer.rows} rows into {writer.unique} authors "
+                     f"({len(writer.runs)} sorted runs)\n")
+
+
+@contextlib.contextmanager
+def _open_rejects(path):
+    # stderr is already a buffered binary stream, a file gets the write buffer and codec of open_output.
+    if path == '-':
+        yield sys.stderr.buffer
+        sys.stderr.buffer.flush()
+        return
+    with open_output(path) as rejects:
+        yield rejects
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess the reddit authors dataset.")
+    parser.add_argument('-i', '--input', default='-',
+                        help="Raw author file (.zst/.xz/.gz or plain), '-' reads stdin (default)")
+    parser.add_argument('-o', '--output', default='-',
+                        help="Processed author file (.zst/.xz/.gz or plain), '-' writes stdout (default)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes (default: 1)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help="Bytes per block handed to a worker (default: %(default)s)")
+    parser.add_argument('--parser', choices=sorted(PARSERS), default='fast',
+                        help="Line parser, 'regex' is the slower reference implementation (default: fast)")
+    parser.add_argument('--engine', choices=['python', 'arrow'], default='python',
+                        help="'arrow' processes record batches with pyarrow compute kernels (default: python)")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help="Output format, 'parquet' requires --engine arrow and an --output path (default: csv)")
+    parser.add_argument('--row-group-size', type=int, default=1024 * 1024,
+                        help="Rows per Parquet row group (default: %(default)s)")
+    parser.add_argument('--dedup', action='store_true',
+                        help="Keep one row per lower-cased author, sorted by it (external merge sort)")
+    parser.add_argument('--memory-budget', type=int, default=1024,
+                        help="MB of rows --dedup sorts in memory before spilling a run (default: %(default)s)")
+    parser.add_argument('--temp-dir', help="Directory for the --dedup runs (default: the system temp directory)")
+    parser.add_argument('--checkpoint-dir',
+                        help="Write the output in checkpointed segments here first, so a rerun resumes where the "
+                             "last one stopped; requires --input and --output paths")
+    parser.add_argument('--segment-size', type=int, default=SEGMENT_SIZE // (1024 * 1024),
+                        help="MB of input per --checkpoint-dir segment (default: %(default)s)")
+    parser.add_argument('--rejects',
+                        help="Reject sidecar, 'reason<TAB>raw line' per line, compressed according to its extension "
+                             "(default: <output>.rejects<codec extension> for an --output path, else stderr)")
+    parser.add_argument('--max-reject-rate', type=float,
+                        help="Exit with status 1 if more than this share of the lines is rejected, e.g. 0.01")
+    args = parser.parse_args()
+
+    if args.format == 'parquet' and (args.engine != 'arrow' or args.output == '-'):
+        parser.error("--format parquet requires --engine arrow and an --output path")
+    if args.dedup and args.format == 'parquet':
+        parser.error("--dedup writes the pipe-delimited format only")
+    if args.checkpoint_dir and (args.engine != 'python' or '-' in (args.input, args.output)):
+        parser.error("--checkpoint-dir requires --engine python and --input and --output paths")
+    if args.rejects is None:
+        extension = _output_extension(args.output)
+        args.rejects = '-' if args.output == '-' else \
+            args.output[:len(args.output) - len(extension)] + '.rejects' + extension
+    if args.checkpoint_dir and args.rejects == '-':
+        parser.error("--checkpoint-dir requires a --rejects path")
+
+    stats = RunStats()
+    if args.checkpoint_dir:
+        def concatenate(segments, path):
+            # The segments are complete files in the output format already, only --dedup has to read them again.
+            with open_output(path) as outstream, _output_rows(outstream, args) as rows:
+                for segment in segments:
+                    with open_input(segment) as instream:
+                        shutil.copyfileobj(instream, rows, CHUNK_SIZE)
+
+        run_segmented(args.input, args.output, args.checkpoint_dir, args.rejects, workers=args.workers,
+                      chunk_size=args.chunk_size, parser=args.parser, segment_size=args.segment_size * 1024 * 1024,
+                      finish=concatenate if args.dedup else None, stats=stats)
+    elif args.engine == 'arrow':
+        import preprocess_authors_arrow
+
+        with open_input(args.input) as instream, _open_rejects(args.rejects) as rejects:
+            if args.format == 'parquet':
+                preprocess_authors_arrow.run(instream, args.output, RejectWriter(rejects, stats),
+                                             output_format='parquet', row_group_size=args.row_group_size,
+                                             stats=stats)
+            else:
+                with open_output(args.output) as outstream, _output_rows(outstream, args) as rows:
+                    preprocess_authors_arrow.run(instream, rows, RejectWriter(rejects, stats), stats=stats)
+    else:
+        with open_input(args.input) as instream, open_output(args.output) as outstream, \
+                _output_rows(outstream, args) as rows, _open_rejects(args.rejects) as rejects:
+            run(instream, rows, rejects, workers=args.workers, chunk_size=args.chunk_size, parser=args.parser,
+                stats=stats)
+
+    # One JSON line, the last one on stdout when the rows go to a file: BashOperator pushes it to XCom.
+    summary = json.dumps(stats.as_dict(), sort_keys=True)
+    if args.output == '-':
+        sys.stderr.write(summary + '\n')
+    else:
+        print(summary, flush=True)
+    if args.max_reject_rate is not None and stats.reject_rate > args.max_reject_rate:
+        sys.stderr.write(f"Rejected {stats.rejected} lines, a rate of {stats.reject_rate:.4%} above the "
+                         f"--max-reject-rate of {args.max_reject_rate:.4%}, see {args.rejects}\n")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
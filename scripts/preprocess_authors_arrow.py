@@ -0,0 +1,293 @@
+"""
+Vectorized engine for preprocess_authors.py built on pyarrow.
+
+Rows are read in large record batches by pyarrow's CSV reader, validated and rewritten with
+Arrow compute kernels, and written either as the pipe-delimited text produced by the Python
+engine or as typed Parquet. Empty lines and lines that are not valid UTF-8 never reach Arrow: they
+go to the reject sidecar through the reference parser, like in the Python engine. Lines holding a
+carriage return do not reach the CSV reader either, which would split them there, and are parsed
+by the reference regex instead.
+"""
+import io
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+from preprocess_authors import LINE_REGEX, MAX_USERNAME_LENGTH, MIN_USERNAME_LENGTH, REJECT_INVALID_USERNAME, \
+    REJECT_REGEX_MISMATCH, USER_REGEX, iter_chunks, process_chunk_regex
+
+BLOCK_SIZE = 16 * 1024 * 1024
+ROW_GROUP_SIZE = 1024 * 1024
+
+RAW_COLUMNS = ['id', 'author', 'created', 'updated', 'karma_posts', 'karma_comments']
+PARQUET_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('author', pa.string()),
+    ('created', pa.int64()),
+    ('updated', pa.int64()),
+    ('karma_posts', pa.int64()),
+    ('karma_comments', pa.int64()),
+    ('author_valid', pa.bool_()),
+])
+
+# RE2 equivalents of LINE_REGEX for the columns; RE2 only knows ASCII digits, rows with
+# anything else fall back to the Python reference parser.
+_COUNT_PATTERN = r'^([0-9]+|None)$'
+_KARMA_PATTERN = r'^(-?[0-9]+|None)$'
+_ASCII_USER_PATTERN = r'^[A-Za-z0-9_-]+$'
+
+
+def _is_valid_username(username):
+    return USER_REGEX.match(username) is not None and MIN_USERNAME_LENGTH <= len(username) <= MAX_USERNAME_LENGTH
+
+
+def _author_valid(author):
+    # Vectorized for ASCII names; the few non-ASCII ones need Python's unicode \w.
+    length = pc.utf8_length(author)
+    valid = pc.and_(
+        pc.and_(pc.greater_equal(length, MIN_USERNAME_LENGTH), pc.less_equal(length, MAX_USERNAME_LENGTH)),
+        pc.match_substring_regex(author, _ASCII_USER_PATTERN))
+    non_ascii = pc.indices_nonzero(pc.invert(pc.string_is_ascii(author))).to_pylist()
+    if non_ascii:
+        valid = valid.to_numpy(zero_copy_only=False).copy()
+        for i in non_ascii:
+            valid[i] = _is_valid_username(author[i].as_py())
+        valid = pa.array(valid, type=pa.bool_())
+    return valid
+
+
+def _readable_lines(block, errstream, fallback):
+    # Lines that are not valid UTF-8 and empty lines (six empty fields to the CSV reader) take the reference
+    # parser, which only ever turns them into reject records. The CSV reader also ends a row at a bare '\r', so
+    # lines holding one are added to `fallback` for the regex path. Validating a whole block is cheap; only a
+    # block that fails is checked line by line.
+    if not block.startswith(b'\n') and b'\n\n' not in block and b'\r' not in block:
+        if block.isascii():
+            return block
+        try:
+            block.decode('utf-8')
+            return block
+        except UnicodeDecodeError:
+            pass
+    lines = block.split(b'\n')
+    # A block ending in a newline leaves an empty last piece, which is not a line.
+    if block.endswith(b'\n'):
+        lines.pop()
+    good = []
+    bad = []
+    for line in lines:
+        try:
+            text = line.decode('utf-8')
+        except UnicodeDecodeError:
+            bad.append(line)
+            continue
+        if not line:
+            bad.append(line)
+        elif '\r' in text:
+            fallback.append(text)
+        else:
+            good.append(line)
+    errstream.write(process_chunk_regex(b''.join(line + b'\n' for line in bad))[1])
+    # The next block follows in the same stream, so every kept line ends in a newline.
+    return b''.join(line + b'\n' for line in good)
+
+
+class ReadableLinesReader(io.RawIOBase):
+    """
+    Binary stream of the non-empty lines of `instream` that are valid UTF-8. The CSV reader cannot even report
+    a malformed row that is not valid UTF-8, so those lines are written to `errstream` before it reads them.
+    Lines with a carriage return are collected in `fallback` as text instead.
+    :param instream: Binary stream with the raw author rows
+    :param errstream: Binary stream receiving the reject sidecar records of the dropped lines
+    :param block_size: Bytes checked at once
+    """
+
+    def __init__(self, instream, errstream, block_size=BLOCK_SIZE):
+        super().__init__()
+        self._blocks = iter_chunks(instream, block_size)
+        self._errstream = errstream
+        self._pending = memoryview(b'')
+        self.fallback = []
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            block = next(self._blocks, None)
+            if block is None:
+                return 0
+            self._pending = memoryview(_readable_lines(block, self._errstream, self.fallback))
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def _fallback_batch(lines, errstream):
+    """
+    Parse rows the CSV reader could not split into six columns (e.g. usernames with spaces)
+    with the reference regex.
+    """
+    columns = {name: [] for name in RAW_COLUMNS}
+    for line in lines:
+        m = LINE_REGEX.match(line)
+        if m is None:
+            errstream.write(f"{REJECT_REGEX_MISMATCH}\t{line}\n".encode('utf-8'))
+            continue
+        for name, value in zip(RAW_COLUMNS, m.groups()):
+            columns[name].append(value)
+    return pa.record_batch([pa.array(columns[name], type=pa.string()) for name in RAW_COLUMNS], names=RAW_COLUMNS)
+
+
+def _split_conforming(batch):
+    # Rows whose fields do not look like LINE_REGEX are re-assembled and re-parsed by the
+    # reference path, six columns never contain a space so the join is lossless.
+    ok = pc.and_(
+        pc.and_(pc.match_substring_regex(batch['id'], r'^[0-9]+$'),
+                pc.and_(pc.match_substring_regex(batch['created'], _COUNT_PATTERN),
+                        pc.match_substring_regex(batch['updated'], _COUNT_PATTERN))),
+        pc.and_(pc.match_substring_regex(batch['karma_posts'], _KARMA_PATTERN),
+                pc.match_substring_regex(batch['karma_comments'], _KARMA_PATTERN)))
+    if pc.all(ok).as_py():
+        return batch, []
+    rejected = batch.filter(pc.invert(ok))
+    lines = pc.binary_join_element_wise(*[rejected[name] for name in RAW_COLUMNS], ' ').to_pylist()
+    return batch.filter(ok), lines
+
+
+def _to_csv_bytes(batch, valid):
+    """
+    Render a batch as the pipe-delimited rows written by the Python engine.
+    :param valid: Boolean array of `_author_valid`
+    """
+    columns = [batch['id'], batch['author']]
+    for name in RAW_COLUMNS[2:]:
+        columns.append(pc.if_else(pc.equal(batch[name], 'None'), '', batch[name]))
+    columns.append(pc.if_else(valid, '1\n', '0\n'))
+    rows = pc.binary_join_element_wise(*columns, '|')
+    if len(rows) == 0:
+        return b''
+    # The joined values sit back to back in the data buffer, which is exactly the file content.
+    _, offsets, data = rows.buffers()
+    start, end = np.frombuffer(offsets, dtype=np.int32)[[rows.offset, rows.offset + len(rows)]]
+    return data[int(start):int(end)]
+
+
+def _to_int64(values):
+    try:
+        return pc.cast(values, pa.int64())
+    except pa.ArrowInvalid:
+        # Rows of the fallback path may hold any Unicode digits, which LINE_REGEX and int() accept.
+        return pa.array([None if value is None else int(value) for value in values.to_pylist()], type=pa.int64())
+
+
+def _to_parquet_batch(batch, valid):
+    """
+    Cast a batch to `PARQUET_SCHEMA`, turning 'None' into nulls; 'author_valid' is a boolean column.
+    :param valid: Boolean array of `_author_valid`
+    """
+    arrays = [_to_int64(batch['id']), batch['author']]
+    for name in RAW_COLUMNS[2:]:
+        arrays.append(_to_int64(pc.if_else(pc.equal(batch[name], 'None'), pa.scalar(None, pa.string()), batch[name])))
+    arrays.append(valid)
+    return pa.record_batch(arrays, schema=PARQUET_SCHEMA)
+
+
+def iter_batches(instream, errstream, block_size=BLOCK_SIZE):
+    """
+    Read the space-delimited author file in record batches of string columns.
+    :param instream: Binary stream with the raw author rows
+    :param errstream: Binary stream receiving the lines that could not be parsed
+    :param block_size: Bytes per CSV block
+    :return: Generator of record batches with the `RAW_COLUMNS`
+    """
+    invalid_rows = []
+
+    def on_invalid_row(row):
+        invalid_rows.append(row.text)
+        return 'skip'
+
+    lines_reader = ReadableLinesReader(instream, errstream, block_size)
+    reader = pv.open_csv(
+        lines_reader,
+        read_options=pv.ReadOptions(column_names=RAW_COLUMNS, block_size=block_size),
+        parse_options=pv.ParseOptions(delimiter=' ', quote_char=False, escape_char=False,
+                                      ignore_empty_lines=False, invalid_row_handler=on_invalid_row),
+        convert_options=pv.ConvertOptions(column_types={name: pa.string() for name in RAW_COLUMNS},
+                                          strings_can_be_null=False, check_utf8=False))  # checked already
+    for batch in reader:
+        batch, lines = _split_conforming(batch)
+        if batch.num_rows:
+            yield batch
+        lines.extend(invalid_rows)
+        lines.extend(lines_reader.fallback)
+        invalid_rows.clear()
+        lines_reader.fallback.clear()
+        if lines:
+            yield _fallback_batch(lines, errstream)
+
+    lines = invalid_rows + lines_reader.fallback
+    if lines:
+        yield _fallback_batch(lines, errstream)
+
+
+def _validated(batches, errstream, stats):
+    # Flags the authors of every batch once, lists the invalid ones in the reject sidecar and counts the rows.
+    for batch in batches:
+        valid = _author_valid(batch['author'])
+        if not pc.all(valid).as_py():
+            invalid = batch.filter(pc.invert(valid))
+            # Six fields joined by single spaces are the raw line again.
+            lines = pc.binary_join_element_wise(*[invalid[name] for name in RAW_COLUMNS], ' ').to_pylist()
+            errstream.write(''.join(f"{REJECT_INVALID_USERNAME}\t{line}\n" for line in lines).encode('utf-8'))
+        if stats is not None:
+            stats.parsed += batch.num_rows
+            stats.valid += pc.sum(valid).as_py() or 0
+        yield batch, valid
+
+
+def run(instream, output, errstream, output_format='csv', row_group_size=ROW_GROUP_SIZE, block_size=BLOCK_SIZE,
+        stats=None):
+    """
+    Preprocess an author dump with the Arrow engine.
+    :param instream: Binary stream with the raw space-delimited author rows
+    :param output: Binary stream for 'csv', file path for 'parquet' (written to '<path>.tmp' first)
+    :param errstream: Binary stream receiving the reject sidecar records, as in the Python engine
+    :param output_format: 'csv' (same rows as the Python engine) or 'parquet'
+    :param row_group_size: Rows per Parquet row group
+    :param block_size: Bytes per CSV block
+    :param stats: Optional preprocess_authors.RunStats counting the rows written
+    """
+    batches = _validated(iter_batches(instream, errstream, block_size=block_size), errstream, stats)
+    if output_format == 'csv':
+        for batch, valid in batches:
+            output.write(_to_csv_bytes(batch, valid))
+        return
+
+    tmp_path = output + '.tmp'
+    try:
+        with pq.ParquetWriter(tmp_path, PARQUET_SCHEMA, compression='zstd') as writer:
+            pending = []
+            pending_rows = 0
+            for batch, valid in batches:
+                pending.append(_to_parquet_batch(batch, valid))
+                pending_rows += batch.num_rows
+                if pending_rows >= row_group_size:
+                    writer.write_table(pa.Table.from_batches(pending, schema=PARQUET_SCHEMA),
+                                       row_group_size=row_group_size)
+                    pending = []
+                    pending_rows = 0
+            if pending:
+                writer.write_table(pa.Table.from_batches(pending, schema=PARQUET_SCHEMA),
+                                   row_group_size=row_group_size)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # Like transform_submissions.py, only a complete file gets the final name.
+    os.replace(tmp_path, output)
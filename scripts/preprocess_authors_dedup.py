@@ -0,0 +1,178 @@
+"""
+Memory-bounded deduplication for preprocess_authors.py (--dedup).
+
+The processed rows are keyed on the lower-cased author name, the `author_id` of dim_author, and
+sorted with an external merge sort: rows are buffered until the RAM budget is reached, sorted and
+spilled to a temporary run file, and the runs are merged with heapq at the end. Of the rows sharing
+a key only the first in sort order is written: a valid name before an invalid one, then the lowest
+userid (the oldest account). The output keeps the pipe-delimited format and is sorted by key, so it
+loads in the order of a table sorted on author_id and dim_author_insert_unique needs no DISTINCT.
+
+Every buffered row is one bytes object, the sort record
+
+    <lower-cased name> \\0 <0 if valid else 1> <userid, zero padded> <processed row>
+
+so plain bytes ordering is the key ordering and the memory per row is predictable.
+"""
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+
+# Userids are zero padded to this many digits, so they compare as numbers.
+USERID_WIDTH = 20
+# Object header of a bytes object plus the list slot pointing at it and the scratch space of the sort.
+ROW_OVERHEAD = sys.getsizeof(b'') + 3 * 8
+# Most runs merged at once; more runs are merged in several rounds.
+MAX_FAN_IN = 64
+# Bounds of the read buffer of each run while merging.
+MIN_MERGE_BUFFER = 64 * 1024
+MAX_MERGE_BUFFER = 4 * 1024 * 1024
+
+
+def sort_record(row):
+    """
+    Sort record of one processed row: 'userid|author|created|updated|karma_posts|karma_comments|valid\\n'.
+    """
+    userid, _, rest = row.partition(b'|')
+    # The author is the only field that may contain the separator.
+    author = rest.rsplit(b'|', 5)[0]
+    key = author.lower() if author.isascii() else \
+        author.decode('utf-8', 'surrogateescape').lower().encode('utf-8', 'surrogateescape')
+    return b''.join((key, b'\0', b'0' if row.endswith(b'|1\n') else b'1', userid.zfill(USERID_WIDTH), row))
+
+
+def _key(record):
+    return record[:record.index(b'\0')]
+
+
+def _row(record):
+    return record[record.index(b'\0') + 2 + USERID_WIDTH:]
+
+
+class SortedDedupWriter:
+    """
+    Binary writer that takes processed author rows and, when closed, writes them to `outstream` sorted by
+    lower-cased author with one row per name.
+    :param outstream: Binary stream receiving the result
+    :param memory_budget: Bytes the buffered rows may take before they are spilled to a run file
+    :param temp_dir: Directory for the run files (default: the system temp directory)
+    """
+
+    def __init__(self, outstream, memory_budget=1024 * 1024 * 1024, temp_dir=None):
+        self.outstream = outstream
+        self.memory_budget = memory_budget
+        self.temp_dir = temp_dir
+        self.rows = 0
+        self.unique = 0
+        self.runs = []
+        self._records = []
+        self._buffered = 0
+        self._partial = b''
+        self._run_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self._cleanup()
+
+    def write(self, data):
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        for line in lines:
+            if line:
+                self._add(sort_record(line + b'\n'))
+
+    def _add(self, record):
+        self._records.append(record)
+        self.rows += 1
+        self._buffered += len(record) + ROW_OVERHEAD
+        if self._buffered >= self.memory_budget:
+            self._spill()
+
+    def _spill(self):
+        self._records.sort()
+        if self._run_dir is None:
+            self._run_dir = tempfile.mkdtemp(prefix='authors-dedup-', dir=self.temp_dir)
+        path = os.path.join(self._run_dir, f"run-{len(self.runs):05d}")
+        with open(path, 'wb', buffering=MAX_MERGE_BUFFER) as run:
+            run.writelines(self._records)
+        self.runs.append(path)
+        self._records = []
+        self._buffered = 0
+
+    def _merge_buffer(self, runs):
+        return max(MIN_MERGE_BUFFER, min(MAX_MERGE_BUFFER, self.memory_budget // (2 * (runs + 1))))
+
+    def _merge_runs(self, paths, path):
+        buffering = self._merge_buffer(len(paths))
+        files = [open(p, 'rb', buffering=buffering) for p in paths]
+        try:
+            with open(path, 'wb', buffering=buffering) as run:
+                run.writelines(heapq.merge(*files))
+        finally:
+            for f in files:
+                f.close()
+        for p in paths:
+            os.remove(p)
+
+    def _sorted_records(self):
+        """
+        :return: Tuple of (iterator over all records in sort order, run files to close after iterating)
+        """
+        if not self.runs:
+            self._records.sort()
+            return iter(self._records), []
+        if self._records:
+            self._spill()
+        # Too many runs for one merge: merge them in groups of MAX_FAN_IN into longer runs first.
+        while len(self.runs) > MAX_FAN_IN:
+            merged = []
+            for i in range(0, len(self.runs), MAX_FAN_IN):
+                path = os.path.join(self._run_dir, f"merge-{len(merged):05d}-{os.path.basename(self.runs[i])}")
+                self._merge_runs(self.runs[i:i + MAX_FAN_IN], path)
+                merged.append(path)
+            self.runs = merged
+        buffering = self._merge_buffer(len(self.runs))
+        files = [open(path, 'rb', buffering=buffering) for path in self.runs]
+        return heapq.merge(*files), files
+
+    def close(self):
+        """
+        Merge everything written so far into `outstream`.
+        :return: Tuple of (rows written to this writer, unique rows written to `outstream`)
+        """
+        if self._partial:
+            self._add(sort_record(self._partial + b'\n'))
+            self._partial = b''
+        records, files = self._sorted_records()
+        try:
+            last_key = None
+            out = []
+            for record in records:
+                key = _key(record)
+                if key != last_key:
+                    last_key = key
+                    out.append(_row(record))
+                    if len(out) >= 10000:
+                        self.outstream.write(b''.join(out))
+                        self.unique += len(out)
+                        out = []
+            self.outstream.write(b''.join(out))
+            self.unique += len(out)
+        finally:
+            for f in files:
+                f.close()
+            self._cleanup()
+        return self.rows, self.unique
+
+    def _cleanup(self):
+        self._records = []
+        if self._run_dir is not None:
+            shutil.rmtree(self._run_dir, ignore_errors=True)
+            self._run_dir = None
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Reduce the subreddit dump (reddit_subreddits.ndjson.zst) to one record per subreddit, holding only
+the keys `SqlQueries.dim_subreddit_insert` reads from staging_subreddits.
+
+    ./preprocess_subreddits.py ../input/Subreddits/reddit_subreddits.ndjson.zst \\
+        --output ../input/Subreddits/reddit_subreddits_processed.ndjson.zst
+
+The dump lists some subreddits more than once, with another case of the display name. The dim
+table is keyed on LOWER(display_name), so only the record with the latest created_utc of every
+lower-cased name is kept (the first one on ties). The input is streamed twice: the first pass keeps
+an 8-byte digest of every name with its latest creation time, the second writes the winners. Memory
+grows with the number of subreddits, not with the size of their records, and the output is still NDJSON,
+so the COPY ... FORMAT AS JSON 'auto' into staging_subreddits does not change.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+from compressed_io import open_input, open_output
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:  # the standard library is only slower
+    _loads = json.loads
+
+    def _dumps(record):
+        return json.dumps(record, separators=(',', ':')).encode('utf-8')
+
+logger = logging.getLogger(__name__)
+
+# Keys of staging_subreddits used by the dim table, in staging order.
+COLUMNS = (
+    "accounts_active accounts_active_is_fuzzed active_user_count advertiser_category all_original_content "
+    "allow_discovery allow_images allow_videogifs allow_videos can_assign_link_flair can_assign_user_flair "
+    "comment_score_hide_mins community_icon created_utc description display_name display_name_prefixed "
+    "emojis_enabled free_form_reports header_img header_title hide_ads key_color lang name notification_level "
+    "original_content_tag_enabled over18 primary_color public_description public_traffic quarantine show_media "
+    "show_media_preview spoilers_enabled submission_type submit_link_label submit_text submit_text_label "
+    "subreddit_type subscribers suggested_comment_sort title url videostream_links_count whitelist_status "
+    "wiki_enabled wls").split()
+
+# Records without a creation time lose against any record with one.
+_NO_CREATED = float('-inf')
+
+
+def _key(display_name):
+    # 64 bits: the chance of any collision among a million names is below 1e-7.
+    return int.from_bytes(hashlib.blake2b(display_name.lower().encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _created(record):
+    value = record.get('created_utc')
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else _NO_CREATED
+
+
+def _records(stream, counts):
+    # Yields every JSON object with a display name and counts them; other non-empty lines count as skipped.
+    for line in stream:
+        try:
+            record = _loads(line)
+        except ValueError:
+            record = None
+        if isinstance(record, dict) and isinstance(record.get('display_name'), str):
+            counts['rows'] += 1
+            yield record
+        elif line.strip():
+            counts['skipped'] += 1
+
+
+def latest_created(input_path):
+    """
+    First pass: the latest creation time of every lower-cased display name.
+    :return: Tuple of (dict of name digest -> created_utc, dict of 'rows' read and 'skipped' lines)
+    """
+    latest = {}
+    counts = {'rows': 0, 'skipped': 0}
+    with open_input(input_path) as instream:
+        for record in _records(instream, counts):
+            key = _key(record['display_name'])
+            created = _created(record)
+            if key not in latest or created > latest[key]:
+                latest[key] = created
+    return latest, counts
+
+
+def preprocess(input_path, output_path):
+    """
+    Project and deduplicate the subreddit dump.
+    :param input_path: NDJSON file, plain or compressed (.zst/.xz/.gz); it is read twice
+    :param output_path: Destination NDJSON file, compressed according to its extension
+    :return: Tuple of (records read, records written, lines skipped because they are not subreddit records)
+    """
+    latest, counts = latest_created(input_path)
+    written = 0
+    # The codec follows the extension, so the marker goes in front of the name.
+    tmp_path = os.path.join(os.path.dirname(output_path), '.tmp-' + os.path.basename(output_path))
+    try:
+        with open_input(input_path) as instream, open_output(tmp_path) as outstream:
+            buffer = []
+            for record in _records(instream, {'rows': 0, 'skipped': 0}):
+                key = _key(record['display_name'])
+                # Popping the winner also drops later records with the same name and creation time.
+                if key in latest and _created(record) == latest[key]:
+                    del latest[key]
+                    buffer.append(_dumps({name: record.get(name) for name in COLUMNS}))
+                    if len(buffer) >= 10000:
+                        outstream.write(b'\n'.join(buffer) + b'\n')
+                        written += len(buffer)
+                        buffer = []
+            if buffer:
+                outstream.write(b'\n'.join(buffer) + b'\n')
+                written += len(buffer)
+    except BaseException:
+        # No half-written leftovers either, the next run starts from scratch anyway.
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # Only a complete file gets the final name.
+    os.replace(tmp_path, output_path)
+    return counts['rows'], written, counts['skipped']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Project and deduplicate the subreddit dump for staging.")
+    parser.add_argument('input', help="reddit_subreddits.ndjson(.zst) file")
+    parser.add_argument('--output', help="Destination (default: <input>_processed.ndjson.zst next to the input)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    stem = os.path.basename(args.input).split('.')[0]
+    output_path = args.output or os.path.join(os.path.dirname(args.input), stem + '_processed.ndjson.zst')
+    start = time.perf_counter()
+    rows, written, skipped = preprocess(args.input, output_path)
+    elapsed = time.perf_counter() - start
+    logger.info(f"{args.input} -> {output_path} : {rows} records, {rows - written} duplicates dropped, "
+                f"{written} written ({skipped} lines skipped) in {elapsed:.1f}s, "
+                f"{os.path.getsize(args.input) / 1024 ** 2:.1f} MB -> {os.path.getsize(output_path) / 1024 ** 2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
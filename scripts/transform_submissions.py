@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Turn daily submission dumps (RS_YYYY-MM-DD.xz, NDJSON) into Parquet files that only hold the
+columns `SqlQueries.fact_submission_insert` reads from staging_submissions.
+
+    ./transform_submissions.py ../input/Submissions/RS_2018-01-01.xz --output-dir ../input/Submissions
+
+Records are decoded line by line and written in batches, so memory stays bounded by
+--batch-size regardless of the size of the day.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from compressed_io import open_input
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # the standard library parser is only slower
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 64 * 1024
+
+# Columns of staging_submissions used by the fact table, in staging order.
+SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('author', pa.string()),
+    ('subreddit', pa.string()),
+    ('archived', pa.bool_()),
+    ('can_gild', pa.bool_()),
+    ('can_mod_post', pa.bool_()),
+    ('category', pa.string()),
+    ('contest_mode', pa.bool_()),
+    ('created_utc', pa.int64()),
+    ('discussion_type', pa.string()),
+    ('domain', pa.string()),
+    ('edited', pa.int64()),
+    ('event_end', pa.int64()),
+    ('event_is_live', pa.bool_()),
+    ('event_start', pa.int64()),
+    ('gilded', pa.int64()),
+    ('hidden', pa.bool_()),
+    ('is_crosspostable', pa.bool_()),
+    ('is_meta', pa.bool_()),
+    ('is_original_content', pa.bool_()),
+    ('is_reddit_media_domain', pa.bool_()),
+    ('is_robot_indexable', pa.bool_()),
+    ('is_self', pa.bool_()),
+    ('is_video', pa.bool_()),
+    ('locked', pa.bool_()),
+    ('no_follow', pa.bool_()),
+    ('num_comments', pa.int64()),
+    ('num_crossposts', pa.int64()),
+    ('over_18', pa.bool_()),
+    ('permalink', pa.string()),
+    ('pinned', pa.bool_()),
+    ('post_hint', pa.string()),
+    ('quarantine', pa.bool_()),
+    ('removal_reason', pa.string()),
+    ('score', pa.int64()),
+    ('selftext', pa.string()),
+    ('spoiler', pa.bool_()),
+    ('stickied', pa.bool_()),
+    ('suggested_sort', pa.string()),
+    ('thumbnail', pa.string()),
+    ('thumbnail_height', pa.int64()),
+    ('thumbnail_width', pa.int64()),
+    ('title', pa.string()),
+    ('total_awards_received', pa.int64()),
+    ('url', pa.string()),
+    ('whitelist_status', pa.string()),
+])
+
+
+def _as_bool(value):
+    return value if isinstance(value, bool) else None
+
+
+def _as_int(value):
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_str(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _as_edited(value):
+    # 'edited' is either false or the epoch of the last edit; keep the epoch, false becomes null.
+    return None if isinstance(value, bool) else _as_int(value)
+
+
+_CONVERTERS = {pa.bool_(): _as_bool, pa.int64(): _as_int, pa.string(): _as_str}
+
+
+def _column_array(field, values):
+    if field.name == 'edited':
+        return pa.array([_as_edited(v) for v in values], type=field.type)
+    try:
+        return pa.array(values, type=field.type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+        # Only batches with off-type values pay for the per value conversion.
+        convert = _CONVERTERS[field.type]
+        return pa.array([convert(v) for v in values], type=field.type)
+
+
+def _to_batch(records):
+    return pa.record_batch(
+        [_column_array(field, [r.get(field.name) for r in records]) for field in SCHEMA],
+        schema=SCHEMA)
+
+
+def transform(input_path, output_path, compression='zstd', batch_size=BATCH_SIZE):
+    """
+    Project and cast one submission dump into a Parquet file.
+    :param input_path: NDJSON file, plain or compressed (.xz/.zst/.gz)
+    :param output_path: Destination Parquet file
+    :param compression: Parquet codec, e.g. 'zstd' or 'snappy'
+    :param batch_size: Rows per record batch (and row group)
+    :return: Tuple of (rows written, rows skipped because they are not valid JSON objects)
+    """
+    rows = skipped = 0
+    records = []
+    tmp_path = output_path + '.tmp'
+    try:
+        with open_input(input_path) as instream, \
+                pq.ParquetWriter(tmp_path, SCHEMA, compression=compression) as writer:
+            for line in instream:
+                try:
+                    record = _loads(line)
+                except ValueError:
+                    record = None
+                if not isinstance(record, dict):
+                    if line.strip():
+                        skipped += 1
+                    continue
+                records.append(record)
+                if len(records) >= batch_size:
+                    writer.write_batch(_to_batch(records))
+                    rows += len(records)
+                    records = []
+            if records:
+                writer.write_batch(_to_batch(records))
+                rows += len(records)
+    except BaseException:
+        # No half-written leftovers either, the next run starts from scratch anyway.
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # Only a complete file gets the final name, a crashed run never leaves a truncated Parquet file behind.
+    os.replace(tmp_path, output_path)
+    return rows, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert daily submission dumps into schema-projected Parquet.")
+    parser.add_argument('inputs', nargs='+', help="RS_YYYY-MM-DD.xz files")
+    parser.add_argument('--output-dir', help="Directory for the Parquet files (default: next to the input)")
+    parser.add_argument('--compression', choices=['zstd', 'snappy', 'gzip', 'none'], default='zstd',
+                        help="Parquet compression codec (default: %(default)s)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="Rows per record batch / row group (default: %(default)s)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    for input_path in args.inputs:
+        output_dir = args.output_dir or os.path.dirname(input_path)
+        stem = os.path.basename(input_path).split('.')[0]
+        output_path = os.path.join(output_dir, stem + '.parquet')
+        start = time.perf_counter()
+        rows, skipped = transform(input_path, output_path, compression=args.compression, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        logger.info(f"{input_path} -> {output_path} : {rows} rows ({skipped} skipped) in {elapsed:.1f}s, "
+                    f"{os.path.getsize(input_path) / 1024 ** 2:.1f} MB -> {os.path.getsize(output_path) / 1024 ** 2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,83 @@
+import argparse
 import os
 import sys
 import threading
+import time
 import glob
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 import logging.config
 import configparser
 from pathlib import Path
 
-# Setting up logger, logger properties are defined in logging.ini file
-logging.config.fileConfig(f"{Path(__file__).parents[0]}/logging.ini")  # get the path of logging.ini file
-logger = logging.getLogger(__name__)  # setup logger
+# The upload manifest is shared with the S3UploadOperator plugin
+sys.path.append(str(Path(__file__).parents[1] / 'airflow' / 'plugins'))
+from upload_manifest import HashingReader, UploadManifest  # noqa: E402
 
-# Loading configuration from s3_buckets.cfg
+logger = logging.getLogger(__name__)  # setup logger, its properties are defined in logging.ini
+
+# Configuration from s3_buckets.cfg, loaded when the script runs
 config = configparser.ConfigParser()
-config.read_file(open('s3_buckets.cfg'))
 
 
-class ProgressPercentage(object):
+class AggregateProgress(object):
+    """
+    Progress over all uploads of a run, safe to call from boto3's transfer threads.
+    Prints at most one status line per `interval` seconds.
+    """
 
-    def __init__(self, filename):
-        self._filename = filename
-        self._size = float(os.path.getsize(filename))
+    def __init__(self, total_files, total_bytes, interval=2.0):
+        self._total_files = total_files
+        self._total_bytes = total_bytes
+        self._interval = interval
         self._seen_so_far = 0
+        self._done = 0
+        self._failed = 0
+        self._start = time.monotonic()
+        self._last_report = 0.0
         self._lock = threading.Lock()
 
     def __call__(self, bytes_amount):
-        # To simplify, assume this is hooked up to a single filename
         with self._lock:
             self._seen_so_far += bytes_amount
-            percentage = (self._seen_so_far / self._size) * 100
-            sys.stdout.write(
-                "\r%s  %s / %s  (%.2f%%)" % (
-                    self._filename, self._seen_so_far, self._size,
-                    percentage))
-            sys.stdout.flush()
+            now = time.monotonic()
+            if now - self._last_report < self._interval:
+                return
+            self._last_report = now
+        self.report()
+
+    def file_finished(self, success, skipped_bytes=0):
+        """
+        Count a finished file. The bytes of a skipped file are taken off the total, so the transferred bytes,
+        rate and ETA only cover what is actually sent.
+        """
+        with self._lock:
+            if success:
+                self._done += 1
+            else:
+                self._failed += 1
+            self._total_bytes -= skipped_bytes
+
+    def report(self):
+        with self._lock:
+            elapsed = max(time.monotonic() - self._start, 1e-6)
+            rate = self._seen_so_far / elapsed
+            remaining = max(self._total_bytes - self._seen_so_far, 0)
+            eta = remaining / rate if rate else float('inf')
+            logger.info(f"{self._seen_so_far / 1024 ** 2:.1f}/{self._total_bytes / 1024 ** 2:.1f} MB "
+                        f"({rate / 1024 ** 2:.1f} MB/s, ETA {eta:.0f}s), "
+                        f"{self._done}/{self._total_files} files done, {self._failed} failed")
 
 
-def upload_file(s3_client, file_name, object_name=None):
+def upload_file(s3_client, file_name, object_name=None, manifest=None, progress=None):
     """Upload a file to an given S3 bucket
     :param s3_client: an S3 service client instance
     :param file_name: File to upload
     :param object_name: S3 object name. If not specified then file_name is used
-    :return: True if file was uploaded, else False
+    :param manifest: Optional UploadManifest, files whose content was already uploaded to the same key are skipped
+    :param progress: Optional AggregateProgress that is fed with transferred bytes and finished files
+    :return: True if file was uploaded or is already up to date, else False
     """
 
     # read bucket name from cfg file
@@ -52,13 +87,31 @@ def upload_file(s3_client, file_name, object_name=None):
     if object_name is None:
         object_name = file_name.split('\\')[-1]
 
+    s3_uri = f"s3://{bucket}/{object_name}"
+    if manifest is not None and not manifest.needs_upload(file_name, s3_uri):
+        logger.info(f"{file_name} is unchanged since its last upload to {s3_uri}. Skip upload.")
+        if progress is not None:
+            progress.file_finished(True, skipped_bytes=os.path.getsize(file_name))
+        return True
+
     # Upload the file
     try:
-        response = s3_client.upload_file(file_name, bucket, object_name, Callback=ProgressPercentage(file_name))
+        if manifest is None:
+            response = s3_client.upload_file(file_name, bucket, object_name, Callback=progress)
+        else:
+            # Hashed while it is sent, so recording the upload does not read the file again.
+            with HashingReader(file_name) as source:
+                response = s3_client.upload_fileobj(source, bucket, object_name, Callback=progress)
 #        logger.debug(f"Got response from s3 client for uploading file: {response}")
     except Exception as e:
         logger.error(f"Error occurred while upload {file_name} : {e}")
+        if progress is not None:
+            progress.file_finished(False)
         return False
+    if manifest is not None:
+        manifest.record_upload(file_name, s3_uri, source.hexdigest())
+    if progress is not None:
+        progress.file_finished(True)
     return True
 
 
@@ -73,22 +126,38 @@ def get_all_files(filepath):
 
 
 if __name__ == "__main__":
-    # Creating low-level service clients
+    logging.config.fileConfig(f"{Path(__file__).parents[0]}/logging.ini")  # get the path of logging.ini file
+    config.read_file(open('s3_buckets.cfg'))
+
+    parser = argparse.ArgumentParser(description="Upload the downloaded datasets to the S3 landing zone.")
+    parser.add_argument('--jobs', type=int, default=1, help="Number of files uploaded concurrently (default: 1)")
+    parser.add_argument('--progress-interval', type=float, default=2.0,
+                        help="Seconds between two progress lines (default: %(default)s)")
+    args = parser.parse_args()
+
+    # Creating low-level service clients, one client is shared by all upload threads
     session = boto3.Session(profile_name='default')
     s3_client = session.client('s3', region_name=str(config.get("S3", "LOCATION")))
     logger.info("Clients setup for S3 services.")
     # List all files needed to be uploaded
     filepath = f"{Path(__file__).parents[0].parents[0]}/input"
     all_files = get_all_files(filepath=filepath)
+    # Remember uploaded content so re-runs only transfer new or changed files
+    manifest = UploadManifest(f"{Path(__file__).parents[0].parents[0]}/upload_manifest.sqlite")
+    progress = AggregateProgress(total_files=len(all_files),
+                                 total_bytes=sum(os.path.getsize(f) for f in all_files),
+                                 interval=args.progress_interval)
     # Upload each file
-    success = fail = 0
-    for i, file in enumerate(all_files):
-        if upload_file(s3_client=s3_client, file_name=file):
-            success += 1
-            logger.info(f"{file} has been successfully uploaded...")
-            logger.info(f"{success}/{len(all_files)} completed...")
-        else:
-            fail += 1
-            logger.error(f"{file} failed to be uploaded...")
-            logger.info(f"{fail} files failed...")
-
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        results = list(executor.map(
+            lambda file: upload_file(s3_client=s3_client, file_name=file, manifest=manifest, progress=progress),
+            all_files))
+    progress.report()
+
+    failed = [file for file, ok in zip(all_files, results) if not ok]
+    for file in failed:
+        logger.error(f"{file} failed to be uploaded...")
+    logger.info(f"{len(all_files) - len(failed)}/{len(all_files)} completed, {len(failed)} files failed...")
+    logger.info(manifest.stats())
+    manifest.close()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Profile a dataset file before it is uploaded and staged, so bad input fails locally in seconds
+instead of after a COPY into Redshift.
+
+    ./validate_datasets.py ../input/Submissions/RS_2018-01-01.xz --profile RS_2018-01-01.profile.json
+
+One streaming pass counts rows, unparseable rows, nulls and type mismatches per column and the
+min/max creation time, in constant memory. The profile is written as JSON and printed as the last
+line of stdout (the XCom value of a BashOperator). The exit code is 1 when a check fails, unless
+--exit-zero is given to let the DAG branch on the profile instead.
+
+Supported kinds: 'submissions' (RS_*.xz NDJSON), 'subreddits' (reddit_subreddits.ndjson.zst) and
+'authors' (the '|' separated output of preprocess_authors.py).
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from compressed_io import open_input
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # the standard library parser is only slower
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+
+def _is_str(value):
+    return type(value) is str
+
+
+def _is_int(value):
+    # Some dumps write integral values as floats, e.g. "created_utc": 1137700161.0
+    return type(value) is int or (type(value) is float and value.is_integer())
+
+
+def _is_bool(value):
+    return type(value) is bool
+
+
+def _is_edited(value):
+    # false, or the epoch of the last edit
+    return type(value) in (bool, int, float)
+
+
+def _is_int_text(value):
+    return value.isdigit() or (value[:1] == '-' and value[1:].isdigit())
+
+
+def _is_flag_text(value):
+    return value in ('0', '1')
+
+
+# Columns read by the staging -> fact/dim inserts, with the check their values have to pass.
+SUBMISSION_COLUMNS = [
+    (name, check) for names, check in [
+        ("id author subreddit category discussion_type domain permalink post_hint removal_reason selftext "
+         "suggested_sort thumbnail title url whitelist_status", _is_str),
+        ("created_utc event_end event_start gilded num_comments num_crossposts score thumbnail_height "
+         "thumbnail_width total_awards_received", _is_int),
+        ("archived can_gild can_mod_post contest_mode event_is_live hidden is_crosspostable is_meta "
+         "is_original_content is_reddit_media_domain is_robot_indexable is_self is_video locked no_follow "
+         "over_18 pinned quarantine spoiler stickied", _is_bool),
+        ("edited", _is_edited),
+    ] for name in names.split()]
+
+SUBREDDIT_COLUMNS = [
+    (name, check) for names, check in [
+        ("display_name advertiser_category community_icon description display_name_prefixed header_img "
+         "header_title key_color lang name notification_level primary_color public_description submission_type "
+         "submit_link_label submit_text submit_text_label subreddit_type suggested_comment_sort title url "
+         "whitelist_status", _is_str),
+        ("created_utc accounts_active active_user_count comment_score_hide_mins subscribers "
+         "videostream_links_count wls", _is_int),
+        ("accounts_active_is_fuzzed all_original_content allow_discovery allow_images allow_videogifs "
+         "allow_videos can_assign_link_flair can_assign_user_flair emojis_enabled free_form_reports hide_ads "
+         "original_content_tag_enabled over18 public_traffic quarantine show_media show_media_preview "
+         "spoilers_enabled wiki_enabled", _is_bool),
+    ] for name in names.split()]
+
+# Field order of preprocess_authors.py, all values are text.
+AUTHOR_COLUMNS = [
+    ('id', _is_int_text),
+    ('author', _is_str),
+    ('created', _is_int_text),
+    ('updated', _is_int_text),
+    ('karma_posts', _is_int_text),
+    ('karma_comments', _is_int_text),
+    ('author_valid', _is_flag_text),
+]
+
+# Per kind: columns, columns that must never be null, column holding the creation epoch.
+KINDS = {
+    'submissions': (SUBMISSION_COLUMNS, ('id', 'author', 'subreddit', 'created_utc'), 'created_utc'),
+    'subreddits': (SUBREDDIT_COLUMNS, ('display_name', 'created_utc'), 'created_utc'),
+    'authors': (AUTHOR_COLUMNS, ('id', 'author', 'author_valid'), 'created'),
+}
+
+
+def guess_kind(path):
+    """
+    Derive the dataset kind from a file name. Raw author dumps are not supported, only processed ones.
+    :return: Key of KINDS, or None
+    """
+    name = os.path.basename(path)
+    if name.startswith('RS_'):
+        return 'submissions'
+    if 'subreddits' in name:
+        return 'subreddits'
+    if name.startswith('RA_') and '_processed' in name:
+        return 'authors'
+    return None
+
+
+def _ndjson_records(stream, profile):
+    for line in stream:
+        try:
+            record = _loads(line)
+        except ValueError:
+            record = None
+        if isinstance(record, dict):
+            yield record
+        elif line.strip():
+            profile['invalid_rows'] += 1
+
+
+def _author_records(stream, profile):
+    for line in stream:
+        line = line.rstrip(b'\r\n')
+        if not line:
+            continue
+        try:
+            text = line.decode('utf-8')
+        except UnicodeDecodeError:
+            profile['invalid_rows'] += 1
+            continue
+        # The author name is the only field that may contain the separator.
+        userid, _, rest = text.partition('|')
+        fields = rest.rsplit('|', 5)
+        if len(fields) != 6:
+            profile['invalid_rows'] += 1
+            continue
+        yield dict(zip((name for name, _ in AUTHOR_COLUMNS),
+                       [userid] + [field if field != '' else None for field in fields]))
+
+
+def profile_file(path, kind, missing_ok=False):
+    """
+    Stream a dataset file once and collect its profile.
+    :param path: File path, plain or compressed (.xz/.zst/.gz)
+    :param kind: Key of KINDS
+    :param missing_ok: Profile a missing file as an empty one (marked 'missing') instead of failing
+    :return: Profile dict, without the verdict (see `evaluate`)
+    """
+    columns, _, created_column = KINDS[kind]
+    names = [name for name, _ in columns]
+    checks = [check for _, check in columns]
+    nulls = [0] * len(columns)
+    type_errors = [0] * len(columns)
+    created_min = created_max = None
+    missing = missing_ok and not os.path.exists(path)
+    profile = {'file': os.path.abspath(path), 'kind': kind, 'bytes': 0 if missing else os.path.getsize(path),
+               'rows': 0, 'invalid_rows': 0, 'missing': missing}
+
+    start = time.perf_counter()
+    with open_input(os.devnull if missing else path) as stream:
+        records = _author_records(stream, profile) if kind == 'authors' else _ndjson_records(stream, profile)
+        for record in records:
+            profile['rows'] += 1
+            for i, name in enumerate(names):
+                value = record.get(name)
+                if value is None:
+                    nulls[i] += 1
+                elif not checks[i](value):
+                    type_errors[i] += 1
+            created = record.get(created_column)
+            if created is not None:
+                try:
+                    created = int(created)
+                except (TypeError, ValueError):
+                    continue
+                if created_min is None or created < created_min:
+                    created_min = created
+                if created_max is None or created > created_max:
+                    created_max = created
+
+    profile['seconds'] = round(time.perf_counter() - start, 3)
+    profile['created_column'] = created_column
+    profile['created_min'] = created_min
+    profile['created_max'] = created_max
+    profile['columns'] = {name: {'nulls': n, 'type_errors': t} for name, n, t in zip(names, nulls, type_errors)}
+    return profile
+
+
+def evaluate(profile, min_rows=1, max_invalid_rate=0.001, max_type_error_rate=0.001,
+             created_after=None, created_before=None):
+    """
+    Add the verdict to a profile: 'errors' lists every failed check and 'ok' is True if there is none.
+    :param min_rows: Fewest parseable rows the file has to hold
+    :param max_invalid_rate: Highest share of unparseable rows
+    :param max_type_error_rate: Highest share of values of the wrong type, per column
+    :param created_after: Earliest allowed creation epoch, if any
+    :param created_before: Epoch every creation time has to be below, if any
+    :return: The profile
+    """
+    _, required, _ = KINDS[profile['kind']]
+    rows = profile['rows']
+    errors = []
+    if rows < min_rows:
+        errors.append(f"{rows} rows, expected at least {min_rows}")
+    total = rows + profile['invalid_rows']
+    if total and profile['invalid_rows'] / total > max_invalid_rate:
+        errors.append(f"{profile['invalid_rows']} of {total} rows are not parseable")
+    for name, stats in profile['columns'].items():
+        if name in required and stats['nulls']:
+            errors.append(f"{stats['nulls']} null values in required column '{name}'")
+        if rows and stats['type_errors'] / rows > max_type_error_rate:
+            errors.append(f"{stats['type_errors']} values of the wrong type in column '{name}'")
+    if created_after is not None and profile['created_min'] is not None and profile['created_min'] < created_after:
+        errors.append(f"{profile['created_column']} {profile['created_min']} is before {created_after}")
+    if created_before is not None and profile['created_max'] is not None and profile['created_max'] >= created_before:
+        errors.append(f"{profile['created_column']} {profile['created_max']} is not before {created_before}")
+    profile['errors'] = errors
+    profile['ok'] = not errors
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile and validate a reddit dataset file in one streaming pass.")
+    parser.add_argument('input', help="Dataset file, plain or compressed (.xz/.zst/.gz)")
+    parser.add_argument('--kind', choices=sorted(KINDS), help="Dataset kind (default: derived from the file name)")
+    parser.add_argument('--profile', help="Also write the JSON profile to this path")
+    parser.add_argument('--min-rows', type=int, default=1, help="Fewest rows to accept (default: %(default)s)")
+    parser.add_argument('--max-invalid-rate', type=float, default=0.001,
+                        help="Highest share of unparseable rows (default: %(default)s)")
+    parser.add_argument('--max-type-error-rate', type=float, default=0.001,
+                        help="Highest share of wrongly typed values per column (default: %(default)s)")
+    parser.add_argument('--created-after', type=int, help="Earliest allowed creation epoch")
+    parser.add_argument('--created-before', type=int, help="Creation epochs have to be below this one")
+    parser.add_argument('--exit-zero', action='store_true', help="Exit with 0 even if a check fails")
+    parser.add_argument('--missing-ok', action='store_true',
+                        help="Profile a missing input as an empty file, e.g. a day without a published dump")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s", stream=sys.stderr)
+
+    kind = args.kind or guess_kind(args.input)
+    if kind is None:
+        parser.error(f"Cannot tell the kind of '{args.input}', pass --kind")
+
+    profile = evaluate(profile_file(args.input, kind, missing_ok=args.missing_ok), min_rows=args.min_rows,
+                       max_invalid_rate=args.max_invalid_rate, max_type_error_rate=args.max_type_error_rate,
+                       created_after=args.created_after, created_before=args.created_before)
+    logger.info(f"{args.input} : {profile['rows']} rows, {profile['invalid_rows']} invalid, "
+                f"{profile['created_column']} {profile['created_min']}..{profile['created_max']}, "
+                f"{profile['seconds']}s")
+    if profile['missing']:
+        logger.warning(f"{args.input} does not exist, profiled as an empty file")
+    for error in profile['errors']:
+        logger.error(error)
+    if args.profile:
+        with open(args.profile, 'w') as f:
+            json.dump(profile, f, indent=2)
+    print(json.dumps(profile, separators=(',', ':')))
+    if not profile['ok'] and not args.exit_zero:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
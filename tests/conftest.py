@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'airflow', 'plugins'))
+
+
+@pytest.fixture
+def postgres_dsn():
+    """
+    DSN of a scratch Postgres database standing in for Redshift, e.g. 'host=127.0.0.1 user=postgres'.
+    """
+    dsn = os.environ.get('POSTGRES_TEST_DSN')
+    if not dsn:
+        pytest.skip("POSTGRES_TEST_DSN is not set")
+    return dsn
+
+
+@pytest.fixture
+def postgres_hook(postgres_dsn, monkeypatch):
+    """
+    PostgresHook stand-in for the Redshift operators that connects to `postgres_dsn` and keeps the arguments of
+    every connection it opened in `connections`.
+    """
+    pytest.importorskip('airflow.providers.postgres.hooks.postgres')
+    psycopg2 = pytest.importorskip('psycopg2')
+    import redshift_connections
+
+    class PostgresHook:
+        connections = []
+
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+
+        def get_conn(self):
+            PostgresHook.connections.append(self.kwargs)
+            return psycopg2.connect(postgres_dsn)
+
+    monkeypatch.setattr(redshift_connections, 'PostgresHook', PostgresHook)
+    redshift_connections.redshift_connections.clear()
+    yield PostgresHook
+    redshift_connections.redshift_connections.clear()
+
+
+@pytest.fixture
+def postgres(postgres_dsn):
+    """
+    Autocommit connection for setting up and checking tables.
+    """
+    psycopg2 = pytest.importorskip('psycopg2')
+    conn = psycopg2.connect(postgres_dsn)
+    conn.autocommit = True
+    yield conn
+    conn.close()
+
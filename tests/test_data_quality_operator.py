@@ -0,0 +1,96 @@
+import pytest
+
+pytest.importorskip('airflow.models')
+
+import data_quality  # noqa: E402
+
+
+class _TaskInstance:
+    def __init__(self):
+        self.xcom = {}
+
+    def xcom_push(self, key, value):
+        self.xcom[key] = value
+
+
+class _EstimatingOperator(data_quality.DataQualityOperator):
+    """
+    Runs the APPROXIMATE COUNT(DISTINCT) of Redshift as an exact COUNT(DISTINCT) on Postgres and shifts the
+    estimated duplicates by `skew`, the way HyperLogLog misses them.
+    """
+    skew = 0
+
+    def fetch_one(self, conn, name, sql, **counters):
+        row = super().fetch_one(conn, name, sql.replace('APPROXIMATE ', ''), **counters)
+        if name.startswith('approx_distinct.'):
+            row = (row[0],) + tuple(value + self.skew for value in row[1:])
+        return row
+
+
+@pytest.fixture
+def tables(postgres, postgres_hook):
+    with postgres.cursor() as cur:
+        cur.execute("""
+            DROP TABLE IF EXISTS dq_authors;
+            CREATE TABLE dq_authors (id INT, name TEXT);
+            -- ids 1-5 twice, names 'user_1'-'user_1000', 'user_6' holds a NULL.
+            INSERT INTO dq_authors
+                SELECT CASE WHEN g > 995 THEN g - 995 ELSE g END, CASE WHEN g = 6 THEN NULL ELSE 'user_' || g END
+                FROM generate_series(1, 1000) g;
+        """)
+    yield postgres
+    with postgres.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS dq_authors")
+
+
+def _check(checks, operator=data_quality.DataQualityOperator, **kwargs):
+    ti = _TaskInstance()
+    try:
+        operator(task_id='run_quality_checks', redshift_conn_id='redshift', checks=checks,
+                 **kwargs).execute({'ti': ti})
+        error = None
+    except AssertionError as e:
+        error = str(e)
+    return error, {phase['phase']: phase for phase in ti.xcom['metrics']['phases']}
+
+
+@pytest.mark.parametrize('skew', [-10, 0])
+def test_underestimated_duplicates_are_checked_exactly(tables, skew):
+    operator = type('Operator', (_EstimatingOperator,), {'skew': skew})
+    error, phases = _check([{'table': 'dq_authors', 'check': 'col_is_unique', 'col': 'id'}], operator=operator,
+                           approximate=True)
+    assert error == "1 data quality check(s) failed : col_is_unique(dq_authors, col=id) (result 5)"
+    assert 'approx_distinct.dq_authors' in phases and 'check.dq_authors' in phases
+
+
+def test_duplicates_above_the_error_bound_fail_fast(tables):
+    operator = type('Operator', (_EstimatingOperator,), {'skew': 50})
+    error, phases = _check([{'table': 'dq_authors', 'check': 'col_is_unique', 'col': 'id'}], operator=operator,
+                           approximate=True)
+    assert error == "1 data quality check(s) failed : col_is_unique(dq_authors, col=id) (~55 duplicates estimated)"
+    assert 'check.dq_authors' not in phases
+
+
+def test_checks_on_a_table_run_as_one_query_and_report_every_failure(tables, postgres_hook):
+    error, phases = _check([
+        {'table': 'dq_authors', 'check': 'table_not_empty'},
+        {'table': 'dq_authors', 'check': 'col_is_unique', 'col': 'id'},
+        {'table': 'dq_authors', 'check': 'col_does_not_contain_null', 'col': 'name'},
+        {'table': 'dq_authors', 'check': 'col_does_not_contain_str', 'col': 'name', 'val': 'bot'},
+    ], sql_queries=["SELECT COUNT(*) FROM dq_authors"], test_results=[lambda result: result['result'][0] == 1])
+    assert error == ("3 data quality check(s) failed : col_is_unique(dq_authors, col=id) (result 5); "
+                     "col_does_not_contain_null(dq_authors, col=name) (result 1); SELECT COUNT(*) FROM dq_authors")
+    assert [name for name in phases if name != 'connect'] == ['check.dq_authors', 'query.0']
+    assert phases['check.dq_authors']['checks'] == 4
+    assert len(postgres_hook.connections) == 1
+
+
+def test_only_checks_failing_on_the_sample_run_on_the_whole_table(tables):
+    error, phases = _check([
+        {'table': 'dq_authors', 'check': 'table_not_empty'},
+        {'table': 'dq_authors', 'check': 'col_does_not_contain_null', 'col': 'name'},
+        {'table': 'dq_authors', 'check': 'col_does_not_contain_str', 'col': 'name', 'val': 'bot'},
+    ], approximate=True, sample_method='tablesample', sample_fraction=1)
+    assert error == "1 data quality check(s) failed : col_does_not_contain_null(dq_authors, col=name) (result 1)"
+    assert phases['sample.dq_authors']['checks'] == 3
+    assert phases['check.dq_authors']['checks'] == 1
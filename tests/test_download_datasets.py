@@ -0,0 +1,63 @@
+import functools
+import http.server
+import lzma
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import download_datasets  # noqa: E402
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    """
+    Local HTTP mirror with the author and subreddit dumps and the submissions of 2021-05-01 only.
+    """
+    root = tmp_path / 'mirror'
+    for remote in (download_datasets.AUTHORS[0], download_datasets.SUBREDDITS[0]):
+        (root / remote).parent.mkdir(parents=True, exist_ok=True)
+        (root / remote).write_bytes(download_datasets.MAGIC_BYTES['.zst'] + b'dump')
+    day = root / download_datasets.SUBMISSIONS[0].format(day='2021-05-01')
+    day.parent.mkdir(parents=True)
+    day.write_bytes(lzma.compress(b'{"id": "a"}\n'))
+
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(root))
+    handler.log_message = lambda *args: None
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield root, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_unpublished_day_is_not_a_failure(mirror, tmp_path):
+    _, base_url = mirror
+    data_folder = tmp_path / 'input'
+    plan = download_datasets.plan_downloads('2021-05-01', '2021-05-02', base_url=base_url, data_folder=data_folder)
+    assert download_datasets.download_all(plan, jobs=2, retries=1) == []
+    assert (data_folder / 'Submissions' / 'RS_2021-05-01.xz').exists()
+    assert not (data_folder / 'Submissions' / 'RS_2021-05-02.xz').exists()
+
+
+def test_missing_dump_is_a_failure(mirror, tmp_path):
+    root, base_url = mirror
+    os.remove(str(root / download_datasets.AUTHORS[0]))
+    plan = download_datasets.plan_downloads('2021-05-01', '2021-05-01', base_url=base_url,
+                                            data_folder=tmp_path / 'input')
+    failures = download_datasets.download_all(plan, jobs=2, retries=1)
+    assert [url for url, _ in failures] == [f"{base_url}/{download_datasets.AUTHORS[0]}"]
+
+
+def test_plan_of_dumps_or_submissions_only(tmp_path):
+    dumps = download_datasets.plan_downloads(None, None, base_url='http://mirror', data_folder=tmp_path,
+                                             datasets='dumps')
+    assert [url for url, _ in dumps] == [f"http://mirror/{download_datasets.AUTHORS[0]}",
+                                         f"http://mirror/{download_datasets.SUBREDDITS[0]}"]
+    submissions = download_datasets.plan_downloads('2021-05-01', '2021-05-02', base_url='http://mirror',
+                                                   data_folder=tmp_path, datasets='submissions')
+    assert [path.name for _, path in submissions] == ['RS_2021-05-01.xz', 'RS_2021-05-02.xz']
@@ -0,0 +1,210 @@
+import io
+import json
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import preprocess_authors  # noqa: E402
+
+# Valid rows, invalid usernames, a name with spaces, non-ASCII digits, malformed lines and invalid UTF-8 in the
+# names (encoding_error) and in a number (regex_mismatch); the last line has no newline.
+RAW = (
+    b"1 first_user 1134028003 1536497449 1 0\n"
+    b"2 b\xffad 1 2 3 4\n"
+    b"3 x y 1 2 3 4\n"
+    b"4 \xff z 1 2 3 4\n"
+    b"5 n \xd9\xa1\xd9\xa2 2 3 4\n"
+    b"6 none_user None None -3 None\n"
+    b"7 \xc3\xa9t\xc3\xa9_ok 1 2 3 4\n"
+    b"8 numbers 1 2\xff 3 4\n"
+    b"garbage line\n"
+    b"\n"
+    b"9 zz 1 2 3 4"
+)
+
+
+FUZZ_LINES = 50000
+
+
+def _fuzz_field(rng):
+    if rng.random() < 0.9:
+        return rng.choice([str(rng.randrange(10 ** rng.randrange(1, 12))).encode(), b'None'])
+    return rng.choice([
+        b'-' + str(rng.randrange(10 ** 6)).encode(),
+        b'', b'1.5', b'\xd9\xa1\xd9\xa2', b'12\xff', b'0x1f', b' 7', b'3\r',
+    ])
+
+
+def _fuzz_name(rng):
+    name = bytes(rng.choice(b'abcxyzABC019_-') for _ in range(rng.randrange(1, 25)))
+    if rng.random() < 0.85:
+        return name
+    return rng.choice([
+        name + b' ' + name,
+        '\u00e9t\u00e9_{}'.format(rng.randrange(100)).encode('utf-8'),
+        '\u540d\u524d'.encode('utf-8'),
+        name + b'\xff',
+        b'None', b'|', b'a|b', b'\t' + name, name + b'\r',
+    ])
+
+
+def _fuzz_corpus(seed, lines=FUZZ_LINES):
+    """
+    Seeded author lines: mostly well-formed rows, mixed with malformed ones, invalid UTF-8, unicode names and
+    digits, carriage returns and empty lines.
+    """
+    rng = random.Random(seed)
+    out = []
+    for i in range(lines):
+        kind = rng.random()
+        if kind < 0.8:
+            fields = [str(i).encode(), _fuzz_name(rng)] + [_fuzz_field(rng) for _ in range(4)]
+        elif kind < 0.9:
+            fields = [str(i).encode(), _fuzz_name(rng)] + [_fuzz_field(rng) for _ in range(rng.randrange(0, 7))]
+        elif kind < 0.95:
+            fields = [bytes(rng.randrange(256) for _ in range(rng.randrange(0, 30)))]
+        else:
+            fields = [b'']
+        out.append(b' '.join(fields))
+    raw = b'\n'.join(out)
+    return raw if rng.random() < 0.5 else raw + b'\n'
+
+
+def _python_engine(raw):
+    out, err = io.BytesIO(), io.BytesIO()
+    stats = preprocess_authors.run(io.BytesIO(raw), out, err)
+    return out.getvalue(), err.getvalue(), stats
+
+
+def _arrow_engine(raw):
+    pytest.importorskip('numpy')
+    pytest.importorskip('pyarrow')
+    import preprocess_authors_arrow
+
+    out, err = io.BytesIO(), io.BytesIO()
+    stats = preprocess_authors.RunStats()
+    preprocess_authors_arrow.run(io.BytesIO(raw), out, preprocess_authors.RejectWriter(err, stats), stats=stats)
+    return out.getvalue(), err.getvalue(), stats
+
+
+@pytest.mark.parametrize('parser', sorted(preprocess_authors.PARSERS))
+def test_rejects_carry_their_reason(parser):
+    out, err = preprocess_authors.PARSERS[parser](RAW)
+    assert out.splitlines() == [
+        b"1|first_user|1134028003|1536497449|1|0|1",
+        b"3|x y|1|2|3|4|0",
+        b"5|n|\xd9\xa1\xd9\xa2|2|3|4|0",
+        b"6|none_user|||-3||1",
+        b"7|\xc3\xa9t\xc3\xa9_ok|1|2|3|4|1",
+        b"9|zz|1|2|3|4|0",
+    ]
+    assert sorted(err.splitlines()) == sorted([
+        b"encoding_error\t2 b\xffad 1 2 3 4",
+        b"invalid_username\t3 x y 1 2 3 4",
+        b"encoding_error\t4 \xff z 1 2 3 4",
+        b"invalid_username\t5 n \xd9\xa1\xd9\xa2 2 3 4",
+        b"regex_mismatch\t8 numbers 1 2\xff 3 4",
+        b"regex_mismatch\tgarbage line",
+        b"regex_mismatch\t",
+        b"invalid_username\t9 zz 1 2 3 4",
+    ])
+
+
+@pytest.mark.parametrize('raw', [RAW, b"1 cr\rname 1 2 3 4\n2 ok_name 1 2 3\r4\n3 ok_name 1 2 3 4\n", _fuzz_corpus(4)],
+                         ids=['malformed', 'carriage_return', 'fuzz'])
+def test_engines_agree_on_malformed_input(raw):
+    python_out, python_err, python_stats = _python_engine(raw)
+    arrow_out, arrow_err, arrow_stats = _arrow_engine(raw)
+    # The Arrow engine writes the rows of the fallback path after the others of their block.
+    assert sorted(arrow_out.splitlines()) == sorted(python_out.splitlines())
+    assert sorted(arrow_err.splitlines()) == sorted(python_err.splitlines())
+    for counter in ('parsed', 'valid', 'rejected'):
+        assert getattr(arrow_stats, counter) == getattr(python_stats, counter)
+    assert arrow_stats.reasons == python_stats.reasons
+
+
+def test_arrow_parquet_reads_non_ascii_digits(tmp_path):
+    pytest.importorskip('numpy')
+    pq = pytest.importorskip('pyarrow.parquet')
+    import preprocess_authors_arrow
+
+    path = str(tmp_path / 'authors.parquet')
+    preprocess_authors_arrow.run(io.BytesIO(RAW), path, io.BytesIO(), output_format='parquet')
+    rows = {row['id']: row for row in pq.read_table(path).to_pylist()}
+    assert sorted(rows) == [1, 3, 5, 6, 7, 9]
+    assert rows[5]['created'] == 12
+    assert rows[1]['author_valid'] is True and rows[3]['author_valid'] is False
+    assert os.listdir(str(tmp_path)) == ['authors.parquet']
+
+
+def _segmented_inputs(tmp_path):
+    path = tmp_path / 'RA.csv'
+    path.write_bytes(RAW)
+    return str(path), str(tmp_path / 'out.csv'), str(tmp_path / 'segments'), str(tmp_path / 'out.rejects')
+
+
+def test_checkpoint_with_missing_segments_is_discarded(tmp_path, capsys):
+    input_path, output_path, checkpoint_dir, rejects_path = _segmented_inputs(tmp_path)
+    expected_out, expected_err = preprocess_authors.PARSERS['fast'](RAW)
+    os.makedirs(checkpoint_dir)
+    # A crash during the cleanup of an earlier version left a checkpoint without its segments, and a crash
+    # during a segment left a part file.
+    identity = {'input': os.path.abspath(input_path), 'size': os.path.getsize(input_path),
+                'mtime': os.path.getmtime(input_path), 'parser': 'fast', 'extension': '', 'rejects_extension': ''}
+    with open(os.path.join(checkpoint_dir, preprocess_authors.CHECKPOINT_FILE), 'w') as f:
+        json.dump({'identity': identity, 'offset': 40, 'rows': 1, 'done': False,
+                   'segments': [{'file': 'segment-00000', 'rejects': 'segment-00000.rejects', 'offset': 40,
+                                 'rows': 1}],
+                   'stats': {'parsed': 1, 'valid': 1, 'reasons': {}}}, f)
+    open(os.path.join(checkpoint_dir, '.part-segment-00001'), 'wb').close()
+
+    stats = preprocess_authors.RunStats()
+    preprocess_authors.run_segmented(input_path, output_path, checkpoint_dir, rejects_path, chunk_size=64,
+                                     segment_size=64, stats=stats)
+    with open(output_path, 'rb') as f:
+        assert f.read() == expected_out
+    with open(rejects_path, 'rb') as f:
+        assert f.read() == expected_err
+    assert stats.parsed == 6
+    assert os.listdir(checkpoint_dir) == []
+    assert 'some of its segments are missing' in capsys.readouterr().err
+
+
+def test_rate_of_a_resumed_run_covers_its_own_lines(monkeypatch):
+    clock = iter([100.0, 102.0])
+    monkeypatch.setattr(preprocess_authors.time, 'perf_counter', lambda: next(clock))
+    stats = preprocess_authors.RunStats()
+    stats.restore(parsed=1000, valid=900, reasons={'regex_mismatch': 10})
+    stats.add_rows(b"1|a|1|2|3|4|1\n2|b|1|2|3|4|1\n")
+    stats.add_rejects(b"regex_mismatch\tx\nregex_mismatch\ty\n")
+    counters = stats.as_dict()
+    assert counters['parsed'] == 1002
+    assert counters['rejected'] == 12
+    assert counters['rows_per_sec'] == 2
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_parsers_agree_on_fuzz_corpus(seed):
+    raw = _fuzz_corpus(seed)
+    fast_out, fast_err = preprocess_authors.process_chunk_fast(raw)
+    regex_out, regex_err = preprocess_authors.process_chunk_regex(raw)
+    assert fast_out == regex_out
+    assert fast_err == regex_err
+    assert fast_out and fast_err
+
+
+@pytest.mark.parametrize('parser', sorted(preprocess_authors.PARSERS))
+def test_workers_agree_on_fuzz_corpus(parser):
+    raw = _fuzz_corpus(3)
+    results = []
+    for workers in (1, 4):
+        out, err = io.BytesIO(), io.BytesIO()
+        stats = preprocess_authors.run(io.BytesIO(raw), out, err, workers=workers, chunk_size=64 * 1024,
+                                       parser=parser)
+        results.append((out.getvalue(), err.getvalue(), stats.as_dict()['reasons'], stats.parsed, stats.valid))
+    assert results[0] == results[1]
+    assert results[0][:2] == preprocess_authors.PARSERS[parser](raw)
@@ -0,0 +1,40 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import preprocess_subreddits  # noqa: E402
+
+RECORDS = [
+    {'display_name': 'AskReddit', 'created_utc': 1, 'title': 'old'},
+    {'display_name': 'askreddit', 'created_utc': 2, 'title': 'new'},
+    {'display_name': 'python', 'created_utc': 3, 'title': 'python'},
+]
+
+
+@pytest.fixture
+def dump(tmp_path):
+    path = tmp_path / 'reddit_subreddits.ndjson'
+    path.write_text(''.join(json.dumps(record) + '\n' for record in RECORDS) + 'not json\n')
+    return path
+
+
+def test_keeps_the_latest_record_of_every_name(dump, tmp_path):
+    output = tmp_path / 'reddit_subreddits_processed.ndjson'
+    assert preprocess_subreddits.preprocess(str(dump), str(output)) == (3, 2, 1)
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [(record['display_name'], record['title']) for record in records] == [('askreddit', 'new'),
+                                                                                 ('python', 'python')]
+
+
+def test_failed_run_leaves_no_output(dump, tmp_path, monkeypatch):
+    def fail(record):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(preprocess_subreddits, '_dumps', fail)
+    with pytest.raises(RuntimeError):
+        preprocess_subreddits.preprocess(str(dump), str(tmp_path / 'reddit_subreddits_processed.ndjson'))
+    assert sorted(os.listdir(str(tmp_path))) == ['reddit_subreddits.ndjson']
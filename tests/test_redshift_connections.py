@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip('airflow.providers.postgres.hooks.postgres')
+
+import redshift_connections  # noqa: E402
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE  # noqa: E402
+
+
+class _Connection:
+    def __init__(self, kwargs):
+        self.kwargs = kwargs
+        self.closed = False
+
+    def get_transaction_status(self):
+        return TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def hook(monkeypatch):
+    """
+    PostgresHook stand-in that counts the connections it opened in `get_conn_calls`.
+    """
+
+    class PostgresHook:
+        get_conn_calls = 0
+
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+
+        def get_conn(self):
+            PostgresHook.get_conn_calls += 1
+            return _Connection(self.kwargs)
+
+    monkeypatch.setattr(redshift_connections, 'PostgresHook', PostgresHook)
+    return PostgresHook
+
+
+def test_released_connection_is_reused(hook):
+    cache = redshift_connections.RedshiftConnectionCache()
+    conn = cache.acquire('redshift')
+    cache.release('redshift', conn)
+    assert cache.acquire('redshift') is conn
+    assert (hook.get_conn_calls, cache.opened, cache.reused) == (1, 1, 1)
+
+    # Both in use: the second one is opened.
+    assert cache.acquire('redshift') is not conn
+    assert hook.get_conn_calls == 2
+
+
+def test_connection_is_only_reused_with_the_same_hook_arguments(hook):
+    cache = redshift_connections.RedshiftConnectionCache()
+    conn = cache.acquire('redshift')
+    cache.release('redshift', conn)
+
+    keepalive = cache.acquire('redshift', connect_args={'keepalives': 1, 'keepalives_idle': 30})
+    assert keepalive is not conn
+    assert keepalive.kwargs == {'postgres_conn_id': 'redshift',
+                                'connect_args': {'keepalives': 1, 'keepalives_idle': 30}}
+    cache.release('redshift', keepalive)
+
+    # The order of the arguments does not matter.
+    assert cache.acquire('redshift', connect_args={'keepalives_idle': 30, 'keepalives': 1}) is keepalive
+    assert cache.acquire('redshift') is conn
+    assert cache.acquire('other') is not conn
+    assert hook.get_conn_calls == 3
+
+
+def test_connection_released_under_another_id_is_closed(hook):
+    cache = redshift_connections.RedshiftConnectionCache()
+    conn = cache.acquire('redshift')
+    cache.release('other', conn)
+    assert conn.closed
+    cache.acquire('redshift')
+    assert hook.get_conn_calls == 2
@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip('airflow.models')
+
+from airflow.exceptions import AirflowException  # noqa: E402
+
+import redshift_loadtable_operator  # noqa: E402
+
+INSERT = "INSERT INTO {table} SELECT * FROM {staging_table}"
+
+
+class _TaskInstance:
+    def __init__(self):
+        self.xcom = {}
+
+    def xcom_push(self, key, value):
+        self.xcom[key] = value
+
+
+@pytest.fixture
+def tables(postgres, postgres_hook):
+    with postgres.cursor() as cur:
+        cur.execute("""
+            DROP TABLE IF EXISTS upsert_target, upsert_source;
+            CREATE TABLE upsert_target (k INT, v TEXT, n INT);
+            CREATE TABLE upsert_source (k INT, v TEXT, n INT);
+            INSERT INTO upsert_target
+                SELECT g, 'v' || g, CASE WHEN g % 3 = 0 THEN NULL ELSE g END FROM generate_series(1, 1000) g;
+            -- 1000 rows as they are (NULLs included), 10 of them changed, 100 new ones.
+            INSERT INTO upsert_source
+                SELECT g, CASE WHEN g % 100 = 0 THEN 'changed' ELSE 'v' || g END,
+                       CASE WHEN g % 3 = 0 THEN NULL ELSE g END
+                FROM generate_series(1, 1100) g;
+        """)
+    yield postgres
+    with postgres.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS upsert_target, upsert_source")
+
+
+def _upsert():
+    ti = _TaskInstance()
+    redshift_loadtable_operator.LoadRedshiftTableOperator(
+        task_id='load_dim', redshift_conn_id='redshift', table='upsert_target', sql_stmt=INSERT,
+        staging_table='upsert_source', update_mode='upsert', key_columns=['k']).execute({'ti': ti})
+    return {phase['phase']: phase for phase in ti.xcom['metrics']['phases']}
+
+
+def _fetch(conn, sql):
+    with conn.cursor() as cur:
+        cur.execute(sql)
+        return cur.fetchall()
+
+
+def test_upsert_touches_only_changed_and_new_rows(tables):
+    phases = _upsert()
+    assert phases['drop_unchanged']['rows'] == 990
+    assert phases['delete']['rows'] == 10
+    assert phases['insert']['rows'] == 110
+    assert _fetch(tables, "SELECT COUNT(*), COUNT(DISTINCT k), SUM(CASE WHEN v = 'changed' THEN 1 ELSE 0 END), "
+                          "SUM(CASE WHEN n IS NULL THEN 1 ELSE 0 END) FROM upsert_target") == [(1100, 1100, 11, 366)]
+
+    phases = _upsert()
+    assert (phases['delete']['rows'], phases['insert']['rows']) == (0, 0)
+
+
+def test_upsert_rejects_duplicate_keys_and_leaves_the_table(tables):
+    with tables.cursor() as cur:
+        cur.execute("INSERT INTO upsert_source VALUES (5, 'duplicate', 1)")
+    with pytest.raises(AirflowException, match='several rows for 1 key'):
+        _upsert()
+    assert _fetch(tables, "SELECT COUNT(*), SUM(CASE WHEN v = 'changed' THEN 1 ELSE 0 END) FROM upsert_target") \
+        == [(1000, 0)]
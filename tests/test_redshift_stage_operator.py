@@ -0,0 +1,188 @@
+import gzip
+import io
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('airflow.providers.amazon.aws.hooks.s3')
+pytest.importorskip('airflow.providers.postgres.hooks.postgres')
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'airflow', 'plugins'))
+
+import redshift_stage_operator  # noqa: E402
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE  # noqa: E402
+from redshift_connections import redshift_connections  # noqa: E402
+from s3_copy_manifest import split_lines  # noqa: E402
+
+BUCKET = 'reddit-landing-test'
+HEADER = b'id|author|created|updated|karma_posts|karma_comments|author_valid\n'
+ROWS = b''.join(b'%d|user_%d|1|2|3|4|1\n' % (i, i) for i in range(20000))
+
+
+class RecordingConnection:
+    """
+    Postgres stand-in that records the statements instead of running them; Redshift's COPY from S3 has no
+    local equivalent.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.closed = False
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+    def get_transaction_status(self):
+        return TRANSACTION_STATUS_IDLE
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class RecordingCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql):
+        self.conn.statements.append(sql)
+
+    def fetchone(self):
+        # SELECT COUNT(*) FROM stv_slices and SELECT pg_last_copy_count()
+        return (3,)
+
+
+class _TaskInstance:
+    def __init__(self):
+        self.xcom = {}
+
+    def xcom_push(self, key, value):
+        self.xcom[key] = value
+
+
+@pytest.fixture
+def client(monkeypatch):
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+
+        class S3Hook:
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def get_conn(self):
+                return client
+
+        class AwsBaseHook(S3Hook):
+            def get_credentials(self):
+                return type('Credentials', (), {'access_key': 'key', 'secret_key': 'secret'})
+
+        monkeypatch.setattr(redshift_stage_operator, 'S3Hook', S3Hook)
+        monkeypatch.setattr(redshift_stage_operator, 'AwsBaseHook', AwsBaseHook)
+        yield client
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    conn = RecordingConnection()
+    monkeypatch.setattr(redshift_connections, 'acquire', lambda conn_id, **kwargs: conn)
+    monkeypatch.setattr(redshift_connections, 'release', lambda conn_id, conn: None)
+    return conn
+
+
+def _stage(key, **kwargs):
+    ti = _TaskInstance()
+    operator = redshift_stage_operator.StageToRedshiftOperator(
+        task_id='stage_authors', redshift_conn_id='redshift', aws_credentials_id='aws_credentials',
+        table='staging_authors', s3_src_bucket_name=BUCKET, s3_src_bucket_key=key, data_format='csv',
+        delimiter='|', ignore_header=1, **kwargs)
+    operator.execute({'ti': ti})
+    return {phase['phase']: phase for phase in ti.xcom['metrics']['phases']}
+
+
+def _copy(conn):
+    return [statement for statement in conn.statements if 'COPY' in statement][-1]
+
+
+def test_split_leaves_the_header_out_of_every_part(client, conn):
+    client.put_object(Bucket=BUCKET, Key='Authors/RA.csv.gz', Body=gzip.compress(HEADER + ROWS))
+    phases = _stage('Authors/RA.csv.gz', split_parts='auto', split_min_size=0)
+
+    copy = _copy(conn)
+    assert "FROM 's3://reddit-landing-test/Authors/RA.csv.gz.parts/manifest'" in copy
+    assert 'MANIFEST' in copy and 'GZIP' in copy and 'COMPUPDATE OFF' in copy
+    assert 'IGNOREHEADER' not in copy
+    manifest = json.loads(client.get_object(Bucket=BUCKET, Key='Authors/RA.csv.gz.parts/manifest')['Body'].read())
+    assert len(manifest['entries']) == 3
+    parts = b''
+    for entry in manifest['entries']:
+        key = entry['url'][len(f"s3://{BUCKET}/"):]
+        body = client.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+        assert entry['meta']['content_length'] == len(body)
+        parts += gzip.decompress(body)
+    assert sorted(parts.splitlines()) == sorted(ROWS.splitlines())
+    assert phases['split']['bytes'] > 0
+
+
+def test_split_of_an_unchanged_source_is_reused(client, conn):
+    client.put_object(Bucket=BUCKET, Key='Authors/RA.csv.gz', Body=gzip.compress(HEADER + ROWS))
+    _stage('Authors/RA.csv.gz', split_parts=3, split_min_size=0)
+    manifest = client.head_object(Bucket=BUCKET, Key='Authors/RA.csv.gz.parts/manifest')
+
+    phases = _stage('Authors/RA.csv.gz', split_parts=3, split_min_size=0)
+    assert phases['split']['bytes'] == 0
+    assert client.head_object(Bucket=BUCKET, Key='Authors/RA.csv.gz.parts/manifest')['ETag'] == manifest['ETag']
+    assert 'MANIFEST' in _copy(conn)
+
+    # A new source object is split again.
+    client.put_object(Bucket=BUCKET, Key='Authors/RA.csv.gz', Body=gzip.compress(HEADER + ROWS[:1000]))
+    phases = _stage('Authors/RA.csv.gz', split_parts=3, split_min_size=0)
+    assert phases['split']['bytes'] > 0
+
+
+@pytest.mark.parametrize('key', ['Authors/', 'Authors/RA'])
+def test_prefix_is_copied_without_splitting(client, conn, key):
+    client.put_object(Bucket=BUCKET, Key='Authors/RA.csv.gz', Body=gzip.compress(HEADER + ROWS))
+    _stage(key, split_parts=3, split_min_size=0)
+    copy = _copy(conn)
+    assert f"FROM 's3://reddit-landing-test/{key}'" in copy
+    assert 'IGNOREHEADER 1' in copy and 'MANIFEST' not in copy
+
+
+def test_small_source_keeps_its_header_option(client, conn):
+    client.put_object(Bucket=BUCKET, Key='Authors/RA.csv', Body=HEADER + ROWS)
+    _stage('Authors/RA.csv', split_parts=3)
+    copy = _copy(conn)
+    assert "FROM 's3://reddit-landing-test/Authors/RA.csv'" in copy
+    assert 'IGNOREHEADER 1' in copy and 'MANIFEST' not in copy
+
+
+def test_split_lines_skips_headers_across_blocks(tmp_path):
+    paths = split_lines(io.BytesIO(b'header one\nheader two\n' + ROWS), 2, str(tmp_path), block_size=7, skip_lines=2)
+    rows = b''
+    for path in paths:
+        with gzip.open(path, 'rb') as part:
+            rows += part.read()
+    assert sorted(rows.splitlines()) == sorted(ROWS.splitlines())
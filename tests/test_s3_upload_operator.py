@@ -0,0 +1,104 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('airflow.providers.amazon.aws.hooks.s3')
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'airflow', 'plugins'))
+
+import s3_upload_operator  # noqa: E402
+
+BUCKET = 'reddit-landing-test'
+MB = 1024 * 1024
+
+
+class _TaskInstance:
+    def __init__(self):
+        self.xcom = {}
+
+    def xcom_push(self, key, value):
+        self.xcom[key] = value
+
+
+@pytest.fixture
+def client(monkeypatch):
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+
+        class Hook:
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def get_conn(self):
+                return client
+
+        monkeypatch.setattr(s3_upload_operator, 'S3Hook', Hook)
+        yield client
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    os.makedirs(str(tmp_path / 'Submissions'))
+    (tmp_path / 'Submissions' / 'RS_2021-05-01.parquet').write_bytes(os.urandom(6 * MB + 5))
+    (tmp_path / 'Submissions' / 'RS_2021-05-02.parquet').write_bytes(b'small file')
+    return str(tmp_path)
+
+
+def _upload(dataset_dir, file_glob='Submissions/RS_*.parquet', **kwargs):
+    ti = _TaskInstance()
+    operator = s3_upload_operator.S3UploadOperator(
+        task_id='upload_s3_data', dataset_dir=dataset_dir, file_glob=file_glob, bucket_name=BUCKET,
+        multipart_threshold=5 * MB, multipart_chunksize=5 * MB, **kwargs)
+    operator.execute({'ti': ti})
+    return {phase['phase']: phase for phase in ti.xcom['metrics']['phases']}
+
+
+def test_manifest_uploads_count_their_bytes(client, dataset_dir, tmp_path):
+    phases = _upload(dataset_dir, manifest_path=str(tmp_path / 'manifest.sqlite'))
+    assert phases['upload']['files'] == 2
+    assert phases['upload']['bytes'] == 6 * MB + 5 + len(b'small file')
+
+
+@pytest.mark.parametrize('file_glob, prefix', [
+    ('Submissions/RS_*.xz', 'Submissions/'),
+    ('Submissions/RS_2021-05-01.xz', 'Submissions/'),
+    ('Submissions/*/RS_*.xz', 'Submissions/'),
+    ('**/*.parquet', ''),
+    ('RS_2021-05-01.xz', ''),
+])
+def test_glob_prefix_is_a_directory(file_glob, prefix):
+    assert s3_upload_operator._glob_prefix(file_glob) == prefix
+
+
+def test_file_without_wildcard_is_skipped_once_uploaded(client, dataset_dir):
+    _upload(dataset_dir, file_glob='Submissions/RS_2021-05-02.parquet')
+    phases = _upload(dataset_dir, file_glob='Submissions/RS_2021-05-02.parquet')
+    assert (phases['upload']['files'], phases['upload']['skipped']) == (0, 1)
+
+
+def test_uploads_in_parallel_and_skips_present_files(client, dataset_dir):
+    phases = _upload(dataset_dir, max_concurrency=4)
+    assert (phases['upload']['files'], phases['upload']['skipped']) == (2, 0)
+    for name in ('RS_2021-05-01.parquet', 'RS_2021-05-02.parquet'):
+        body = client.get_object(Bucket=BUCKET, Key='Submissions/' + name)['Body'].read()
+        with open(os.path.join(dataset_dir, 'Submissions', name), 'rb') as f:
+            assert body == f.read()
+
+    phases = _upload(dataset_dir, max_concurrency=4)
+    assert (phases['upload']['files'], phases['upload']['skipped'], phases['upload']['bytes']) == (0, 2, 0)
+
+
+def test_partial_object_is_uploaded_again(client, dataset_dir):
+    path = os.path.join(dataset_dir, 'Submissions', 'RS_2021-05-01.parquet')
+    with open(path, 'rb') as f:
+        content = f.read()
+    # What an interrupted earlier run may have left behind.
+    client.put_object(Bucket=BUCKET, Key='Submissions/RS_2021-05-01.parquet', Body=content[:MB])
+
+    phases = _upload(dataset_dir)
+    assert (phases['upload']['files'], phases['upload']['skipped']) == (2, 0)
+    assert client.get_object(Bucket=BUCKET, Key='Submissions/RS_2021-05-01.parquet')['Body'].read() == content
@@ -0,0 +1,74 @@
+import logging
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import upload_datasets  # noqa: E402
+from upload_datasets import AggregateProgress  # noqa: E402
+from upload_manifest import UploadManifest  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def _last_report(progress, caplog):
+    with caplog.at_level(logging.INFO, logger='upload_datasets'):
+        progress.report()
+    return caplog.records[-1].getMessage()
+
+
+def test_skipped_files_leave_the_total(caplog):
+    progress = AggregateProgress(total_files=3, total_bytes=6 * MB, interval=3600)
+    progress.file_finished(True, skipped_bytes=2 * MB)
+    progress(1 * MB)
+    progress(2 * MB)
+    progress.file_finished(True)
+    report = _last_report(progress, caplog)
+    assert report.startswith("3.0/4.0 MB ")
+    assert report.endswith(", 2/3 files done, 0 failed")
+
+
+def test_failed_files_are_counted(caplog):
+    progress = AggregateProgress(total_files=2, total_bytes=2 * MB, interval=3600)
+    progress.file_finished(True, skipped_bytes=1 * MB)
+    progress.file_finished(False)
+    assert _last_report(progress, caplog).endswith("0.0/1.0 MB (0.0 MB/s, ETA infs), 1/2 files done, 1 failed")
+
+
+def test_upload_file_skips_unchanged_and_resends_changed_files(monkeypatch, tmp_path):
+    boto3 = pytest.importorskip('boto3')
+    moto = pytest.importorskip('moto')
+    monkeypatch.setattr(upload_datasets, 'config', upload_datasets.configparser.ConfigParser())
+    upload_datasets.config.read_dict({'S3': {'LANDING_ZONE': 'landing'}})
+    path = tmp_path / 'RS_2021-05-01.xz'
+    path.write_bytes(b'first version')
+    manifest = UploadManifest(str(tmp_path / 'manifest.sqlite'))
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='landing')
+
+        def upload():
+            progress = AggregateProgress(total_files=1, total_bytes=path.stat().st_size, interval=3600)
+            assert upload_datasets.upload_file(client, str(path), 'Submissions/' + path.name, manifest, progress)
+            return progress
+
+        assert upload()._seen_so_far == len(b'first version')
+        # Unchanged since its upload: nothing is sent and the file leaves the total.
+        progress = upload()
+        assert (progress._seen_so_far, progress._total_bytes, progress._done) == (0, 0, 1)
+
+        path.write_bytes(b'second version')
+        assert upload()._seen_so_far == len(b'second version')
+        body = client.get_object(Bucket='landing', Key='Submissions/' + path.name)['Body'].read()
+        assert body == b'second version'
+
+        # The bucket is gone: the upload fails and is counted as failed.
+        client.delete_object(Bucket='landing', Key='Submissions/' + path.name)
+        client.delete_bucket(Bucket='landing')
+        path.write_bytes(b'third version')
+        progress = AggregateProgress(total_files=1, total_bytes=path.stat().st_size, interval=3600)
+        assert not upload_datasets.upload_file(client, str(path), 'Submissions/' + path.name, manifest, progress)
+        assert progress._failed == 1
+    manifest.close()
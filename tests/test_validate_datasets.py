@@ -0,0 +1,12 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+import validate_datasets  # noqa: E402
+
+
+def test_missing_day_is_profiled_as_empty(tmp_path):
+    path = str(tmp_path / 'RS_2021-05-02.xz')
+    profile = validate_datasets.evaluate(validate_datasets.profile_file(path, 'submissions', missing_ok=True))
+    assert (profile['missing'], profile['rows'], profile['ok']) == (True, 0, False)